@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+    Builds the precomputed equity tables simulate_win_odds looks up:
+
+        python build_equity_tables.py                      # pre-flop table, all cores
+        python build_equity_tables.py --samples 400000     # more precise
+        python build_equity_tables.py --street flop --opponents 1 2
+        python build_equity_tables.py --street river --opponents 1 --max-chunks 500
+
+    pre-flop: every one of the 169 hole card classes (street_indexer(0)) against 1 to 5
+    opponents with random hands, saved to tables/preflop_equity_v1.npz:
+
+        equity      -> float64[169, 5], column is opponents - 1
+        samples     -> samples behind every entry
+        version     -> table version, bump PREFLOP_EQUITY_FILE when the layout changes
+
+    With the default 200,000 samples an entry is within about 0.001 (one standard error).
+
+    flop/turn/river: one float32 .npy per street and number of opponents with an entry
+    for every suit isomorphic class of street_indexer (1.3M, 14M and 123M of them).  The
+    entries are exact where equity_method says enumerating is affordable (turn and river
+    with 1 or 2 opponents) and sampled otherwise (--street-samples, default 5,000).  The
+    file starts out as NaN and gets filled a chunk of classes at a time, a run only does
+    the chunks that still have NaN in them, so it can be stopped and picked up again,
+    --max-chunks limits how much one run does.
+"""
+import os
+import time
+import argparse
+
+import numpy as np
+
+from multiprocessing import Pool
+
+from poker import *
+
+def sample_equity(hands, boards, opponents, samples, rng, batch_size=100000):
+    """
+        equity of every row of hands (S, 2) on the boards (S, 0/3/4/5) against opponents
+        random hands, out of samples deals each (see sample_showdowns).  returns S equities.
+    """
+    hands = np.asarray(hands, dtype=np.int64)
+    boards = np.asarray(boards, dtype=np.int64)
+    if boards.size == 0:
+        boards = boards.reshape(len(hands), 0) # pre-flop
+    states_per_batch = max(1, batch_size // samples)
+
+    equity = np.zeros(len(hands), dtype=np.float64)
+    for first in range(0, len(hands), states_per_batch):
+        states = slice(first, first + states_per_batch)
+        for start in range(0, samples, batch_size):
+            size = min(batch_size, samples - start)
+            strengths = sample_showdowns(hands[states], boards[states], opponents, size, rng)
+            equity[states] += showdown_shares(strengths.reshape(-1, opponents + 1))[:, 0].reshape(-1, size).sum(axis=1)
+    return equity / samples
+
+def preflop_class_equity(task):
+    """ one row of the pre-flop table: the equity of a class against 1..PreflopOpponents opponents """
+    hand_class, samples, seed = task
+    rng = np.random.default_rng(seed)
+    cards = street_indexer(0).unindex(hand_class)
+    return hand_class, [float(sample_equity([cards], [[]], opponents, samples, rng)[0]) for opponents in range(1, PreflopOpponents + 1)]
+
+def build_preflop_equity(samples=200000, processes=None, seed=1, table_dir=TABLE_DIR):
+    """ fills the 169 x PreflopOpponents table in parallel and saves it """
+    load_hand_rank_tables() # builds the evaluator tables once here instead of in every worker
+    classes = street_indexer(0).size
+    seeds = np.random.SeedSequence(seed).spawn(classes) # every class its own stream, so the order workers finish in doesn't matter
+    tasks = [(hand_class, samples, seeds[hand_class]) for hand_class in range(classes)]
+    equity = np.zeros((classes, PreflopOpponents), dtype=np.float64)
+
+    pool = Pool(processes)
+    done = 0
+    for hand_class, row in pool.imap_unordered(preflop_class_equity, tasks):
+        equity[hand_class] = row
+        done += 1
+        print("  {} of {} classes done".format(done, classes), end='\r')
+    pool.close()
+    pool.join()
+    print("")
+
+    os.makedirs(table_dir, exist_ok=True)
+    table_file = os.path.join(table_dir, PREFLOP_EQUITY_FILE)
+    temp_file = table_file + '.tmp.npz'
+    np.savez(temp_file, equity=equity, samples=samples, version=1)
+    os.replace(temp_file, table_file) # workers never see a half written table
+    return equity
+
+def create_street_table(board_cards, opponents, table_dir=TABLE_DIR):
+    """ creates the NaN filled table of a street if it isn't there yet """
+    table_file = street_equity_file(board_cards, opponents, table_dir)
+    if os.path.exists(table_file):
+        return table_file
+    os.makedirs(table_dir, exist_ok=True)
+    temp_file = table_file + '.tmp.npy'
+    table = np.lib.format.open_memmap(temp_file, mode='w+', dtype=np.float32, shape=(street_indexer(board_cards).size,))
+    for start in range(0, len(table), 10000000):
+        table[start:start + 10000000] = np.nan
+    table.flush()
+    del table
+    os.replace(temp_file, table_file)
+    return table_file
+
+def street_chunk_equity(task):
+    """ fills the classes [start, stop) of a street table, each worker writes its own slice """
+    board_cards, opponents, start, stop, samples, seed, table_file = task
+    indexer = street_indexer(board_cards)
+    states = np.array([indexer.unindex(index) for index in range(start, stop)], dtype=np.int64)
+    if equity_method(board_cards, opponents, samples) == 'exact':
+        equity = [exact_equity(state[:2], state[2:], opponents) for state in states.tolist()]
+    else:
+        equity = sample_equity(states[:, :2], states[:, 2:], opponents, samples, np.random.default_rng(seed))
+    table = np.load(table_file, mmap_mode='r+')
+    table[start:stop] = equity
+    table.flush()
+    return stop - start
+
+def build_street_equity(board_cards, opponents, samples=5000, chunk_size=2000, max_chunks=None, processes=None, seed=1, table_dir=TABLE_DIR):
+    """ fills the chunks of a street table that still have NaN entries, returns how many classes got done """
+    load_hand_rank_tables()
+    table_file = create_street_table(board_cards, opponents, table_dir)
+    table = np.load(table_file, mmap_mode='r')
+    tasks = []
+    for chunk_number, start in enumerate(range(0, len(table), chunk_size)):
+        stop = min(start + chunk_size, len(table))
+        if np.isnan(table[start:stop]).any():
+            # the seed only depends on the chunk, so a restarted build gets the same numbers
+            chunk_seed = np.random.SeedSequence(seed, spawn_key=(board_cards, opponents, chunk_number))
+            tasks.append((board_cards, opponents, start, stop, samples, chunk_seed, table_file))
+    left = sum(task[3] - task[2] for task in tasks)
+    del table
+    if max_chunks is not None:
+        tasks = tasks[:max_chunks]
+
+    print("{} classes left, doing {} chunks of {}".format(left, len(tasks), chunk_size))
+    pool = Pool(processes)
+    done = 0
+    for classes in pool.imap_unordered(street_chunk_equity, tasks):
+        done += classes
+        print("  {} of {} classes done".format(done, left), end='\r')
+    pool.close()
+    pool.join()
+    print("")
+    return done
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="builds the precomputed equity tables")
+    parser.add_argument('--street', default='preflop', choices=['preflop'] + list(StreetNames.values()), help="which table to build")
+    parser.add_argument('--samples', type=int, default=200000, help="samples per pre-flop entry")
+    parser.add_argument('--street-samples', type=int, default=5000, help="samples per flop/turn/river entry that isn't enumerated")
+    parser.add_argument('--opponents', type=int, nargs='+', default=[1, 2], help="opponent counts to build flop/turn/river tables for")
+    parser.add_argument('--chunk', type=int, default=2000, help="classes per work item")
+    parser.add_argument('--max-chunks', type=int, default=None, help="stop after this many chunks, run again to continue")
+    parser.add_argument('--processes', type=int, default=None, help="worker processes (default all cores)")
+    parser.add_argument('--seed', type=int, default=1, help="seed of the samples")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    if args.street == 'preflop':
+        print("building the pre-flop equity table...")
+        equity = build_preflop_equity(args.samples, args.processes, args.seed)
+        indexer = street_indexer(0)
+        for hand_class in np.argsort(-equity[:, 0])[:5]:
+            cards = indexer.unindex(int(hand_class))
+            print("{:<12} {}".format(str(card_reduced_set(cards)), np.round(equity[hand_class], 3)))
+    else:
+        board_cards = {name: cards for cards, name in StreetNames.items()}[args.street]
+        for opponents in args.opponents:
+            print("building the {} table against {} opponents...".format(args.street, opponents))
+            build_street_equity(board_cards, opponents, args.street_samples, args.chunk, args.max_chunks, args.processes, args.seed)
+    print("done in {:.1f} seconds".format(time.time() - start_time))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+    Enumerates all 133,784,560 7 card hands and counts exactly how often each hand
+    category (PokerHierachy) and each evaluate_hand strength comes up:
+
+        python enumerate_hands.py                   # all cores, about a minute on a single core
+        python enumerate_hands.py --processes 4 --chunk 1000000
+
+    The hands are split into ranges of combination indexes (see rank_combinations in
+    poker.py), each worker unranks its range and scores it with score_hands_batch.  The
+    counts are written to tables/hand_frequencies_v1.npz:
+
+        category_counts    -> int64[10], index is the PokerHierachy number
+        strength_counts    -> int64[HandStrengthClasses + 1], index is the strength
+        hands              -> total number of hands counted
+
+    It doubles as a stress benchmark since it keeps every core busy scoring hands,
+    the hands/sec are printed at the end.
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+from multiprocessing import Pool
+
+from poker import *
+
+FREQUENCIES_FILE = 'hand_frequencies_v1.npz'
+TotalHands = int(Binomials[7][52])
+
+# the textbook counts, the job refuses to write anything else
+ExpectedCategoryCounts = {
+    'straight_flush': 41584,
+    'four_of_kind': 224848,
+    'full_house': 3473184,
+    'flush': 4047644,
+    'straight': 6180020,
+    'three_of_kind': 6461620,
+    'two_pair': 31433400,
+    'one_pair': 58627800,
+    'high_card': 23294460,
+}
+
+def count_hand_range(index_range):
+    """ scores the hands with combination index in [start, stop), returns the strength histogram """
+    start, stop = index_range
+    strength_counts = np.zeros(HandStrengthClasses + 1, dtype=np.int64)
+    step = 1000000 # keeps the arrays of a worker around 100MB
+    for block_start in range(start, stop, step):
+        cards = unrank_combinations(np.arange(block_start, min(block_start + step, stop)), 7)
+        strength_counts += np.bincount(score_hands_batch(cards), minlength=HandStrengthClasses + 1)
+    return strength_counts
+
+def hand_ranges(total, chunk_size):
+    """ splits [0, total) into [start, stop) pieces of chunk_size """
+    return [(start, min(start + chunk_size, total)) for start in range(0, total, chunk_size)]
+
+def enumerate_hands(processes=None, chunk_size=2000000, total=TotalHands):
+    """ counts every strength over the first total hands, returns (strength_counts, category_counts) """
+    load_hand_rank_tables() # builds the tables once here instead of in every worker
+    strength_counts = np.zeros(HandStrengthClasses + 1, dtype=np.int64)
+    ranges = hand_ranges(total, chunk_size)
+    pool = Pool(processes)
+    done = 0
+    for counts in pool.imap_unordered(count_hand_range, ranges):
+        strength_counts += counts
+        done += 1
+        print("  {} of {} ranges done".format(done, len(ranges)), end='\r')
+    pool.close()
+    pool.join()
+    print("")
+
+    categories = np.array([0] + [hand_category(strength) for strength in range(1, HandStrengthClasses + 1)]) # PokerHierachy number of each strength
+    category_counts = np.bincount(categories, weights=strength_counts, minlength=10).astype(np.int64)
+    return strength_counts, category_counts
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="exact hand category and strength counts over all 7 card hands")
+    parser.add_argument('--processes', type=int, default=None, help="worker processes (default all cores)")
+    parser.add_argument('--chunk', type=int, default=2000000, help="hands per work item")
+    parser.add_argument('--hands', type=int, default=TotalHands, help="only count the first N hands, for a quick benchmark")
+    parser.add_argument('--output', default=os.path.join(TABLE_DIR, FREQUENCIES_FILE), help="where to write the counts")
+    args = parser.parse_args()
+
+    print("enumerating {:,} hands...".format(args.hands))
+    start_time = time.time()
+    strength_counts, category_counts = enumerate_hands(args.processes, args.chunk, args.hands)
+    elapsed_time = time.time() - start_time
+
+    for name, number in sorted(PokerHierachy.items(), key=lambda item: -item[1]):
+        print("{:<16} {:>12,} {:>10.6f}%".format(name, category_counts[number], 100.0 * category_counts[number] / args.hands))
+    print("{:,} hands in {:.1f} seconds, {:,.0f} hands/sec".format(int(strength_counts.sum()), elapsed_time, args.hands / elapsed_time))
+
+    if args.hands != TotalHands:
+        print("partial run, nothing written")
+        sys.exit(0)
+
+    wrong = [name for name, count in ExpectedCategoryCounts.items() if category_counts[PokerHierachy[name]] != count]
+    if wrong or strength_counts.sum() != TotalHands:
+        print("counts are off for {}, nothing written".format(wrong))
+        sys.exit(1)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    np.savez_compressed(args.output, category_counts=category_counts, strength_counts=strength_counts, hands=TotalHands)
+    print("written to {}".format(args.output))
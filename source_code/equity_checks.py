@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+    Checks the stopping rules of estimate_equity in poker.py:
+
+        python equity_checks.py
+        python equity_checks.py --runs 1000
+
+    target_error: a near certain state (Ac Ad on Ah 7c 2d against 1 opponent, equity about
+    0.975) often gets a first batch of 100 with nothing but wins.  The standard error
+    sqrt(p * (1 - p) / n) of that batch is 0, the Wilson half-width isn't, so the estimate
+    must never stop after the first batch at target_error 0.005.  Every run is also
+    checked to stop with an interval of the asked for width.  max_samples or batch_size
+    below 1 must raise instead of dividing by zero or looping forever.  The exit code is
+    1 if anything failed.
+"""
+import sys
+import argparse
+
+import numpy as np
+
+from poker import *
+
+def check_target_error(runs, seed, target_error=0.005, batch_size=100):
+    """ runs estimate_equity on the near certain state, returns the number of failures """
+    hand, river, opponents = [48, 49], [50, 20, 1], 1 # Ac Ad on Ah 7c 2d
+    failures = 0
+    first_batch_all_wins = 0
+    samples = []
+    for run in range(runs):
+        rng = np.random.default_rng([seed, run])
+        first_batch = simulate_showdowns(hand, river, opponents, batch_size, np.random.default_rng([seed, run]))
+        if showdown_shares(first_batch)[:, 0].sum() == batch_size:
+            first_batch_all_wins += 1 # the old rule stopped here with a zero error
+        estimate = estimate_equity(hand, river, opponents, target_error=target_error, max_samples=100000, batch_size=batch_size, rng=rng)
+        samples.append(estimate.samples)
+        if estimate.samples <= batch_size:
+            failures += 1
+            print("  FAIL run {} stopped after {} samples at equity {}".format(run, estimate.samples, estimate.equity))
+        elif (estimate.high - estimate.low) / 2 / 1.96 > target_error and estimate.samples < 100000:
+            failures += 1
+            print("  FAIL run {} stopped with a half-width of {}".format(run, (estimate.high - estimate.low) / 2))
+    print("target_error {}: {} runs, {} first batches all wins, samples min {} mean {:.0f}, {} failures".format(
+          target_error, runs, first_batch_all_wins, min(samples), np.mean(samples), failures))
+    return failures
+
+def check_bad_arguments():
+    """ max_samples = 0 used to divide by zero and batch_size = 0 never stopped, returns the number of failures """
+    failures = 0
+    for arguments in ({'max_samples': 0}, {'batch_size': 0, 'threshold': 0.5}):
+        try:
+            estimate_equity([0, 5], [9, 13, 22], 2, **arguments)
+        except ZeroDivisionError:
+            failures += 1
+            print("  FAIL {} divided by zero".format(arguments))
+        except Exception:
+            continue
+        else:
+            failures += 1
+            print("  FAIL {} didn't raise".format(arguments))
+    print("bad arguments: {} failures".format(failures))
+    return failures
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="checks the stopping rules of estimate_equity")
+    parser.add_argument('--runs', type=int, default=300, help="estimates to check")
+    parser.add_argument('--seed', type=int, default=5, help="seed of the samples")
+    args = parser.parse_args()
+
+    failures = check_bad_arguments() + check_target_error(args.runs, args.seed)
+    if failures:
+        print("estimate_equity stopping rules FAILED")
+        sys.exit(1)
+    print("estimate_equity stopping rules ok")
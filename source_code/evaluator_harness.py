@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+    Checks the hand evaluators in poker.py against the reference score_hand and
+    times them.  Run it before swapping the evaluator used by the engine:
+
+        python evaluator_harness.py                # every 5 card board + 2 hole cards, ~2 minutes
+        python evaluator_harness.py --boards 100000 --samples 200000   # quick run
+
+    Backends:
+        reference   -> score_hand, the original list based scorer
+        table       -> evaluate_hand, the lookup table evaluator
+        batch       -> score_hands_batch, the numpy evaluator
+        incremental -> HandState, board folded in first than the hole cards
+
+    A backend is right on a hand when strength_to_score(strength) gives back the
+    score_hand list.  Ordering is checked on random pairs of hands by comparing the
+    score_hand lists directly, so it does not depend on the tables at all.  The exit
+    code is 1 if anything did not match.
+"""
+import sys
+import time
+import argparse
+import itertools
+
+import numpy as np
+
+from poker import *
+
+Backends = ['reference', 'table', 'batch', 'incremental']
+SuitLetters = {suit[0]: i for i, suit in enumerate(Suits)}
+
+def cards_from_text(text):
+    """ 'Ah Kh 10c 2s' -> card codes, used to write the edge cases below """
+    return [RankIndex[token[:-1]] * 4 + SuitLetters[token[-1]] for token in text.split()]
+
+# hands the old number_of_kind and is_straight got wrong at some point, with the
+# score_hand list each one has to come out as.  Ranks are indexes into Ranks (0 = '2', 12 = 'A').
+EdgeCases = [
+    ('three pairs', 'Kc Kd Qh Qs 2c 2d Ah', [3, 11, 10, 12]),
+    ('three pairs, kicker from the lowest pair', 'Kc Kd Qh Qs 3c 3d 2h', [3, 11, 10, 1]),
+    ('two pair, top card in a pair', 'Ac Ad 9h 9s 7c 5d 2h', [3, 12, 7, 5]),
+    ('two trips', 'Kc Kd Kh Qs Qc Qd 2h', [7, 11, 10]),
+    ('trips and two pairs', '7c 7d 7h 5s 5c 3d 3h', [7, 5, 3]),
+    ('trips and a higher pair', '9c 9d 9h Ks Kc 2d 3h', [7, 7, 11]),
+    ('quads and trips', 'Ac Ad Ah As Kc Kd Kh', [8, 12, 11]),
+    ('quads, kicker above a pair', '2c 2d 2h 2s 3c 3d Ah', [8, 0, 12]),
+    ('quads of the top card', 'Ac Ad Ah As 3c 3d 9h', [8, 12, 7]),
+    ('trips of the top card', 'Ac Ad Ah Ks Qc 3d 2h', [4, 12, 11, 10]),
+    ('pair of the top card', 'Ac Ad 9h 7s 5c 3d 2h', [2, 12, 7, 5, 3]),
+    ('high card', 'Ac Jd 9h 7s 5c 3d 2h', [1, 12, 9, 7, 5, 3]),
+    ('wheel', 'Ac 2d 3h 4s 5c 9d Kh', [5, 3]),
+    ('wheel with a pair', 'Ac Ad 2h 3s 4c 5d 9h', [5, 3]),
+    ('six high beats the wheel', 'Ac 2d 3h 4s 5c 6d Kh', [5, 4]),
+    ('steel wheel', 'Ah 2h 3h 4h 5h Kc Kd', [9, 3]),
+    ('broadway', '10c Jd Qh Ks Ac 2d 3h', [5, 12]),
+    ('six card straight', '4c 5d 6h 7s 8c 9d 2h', [5, 7]),
+    ('seven card straight', '2c 3d 4h 5s 6c 7d 8h', [5, 6]),
+    ('straight with two pairs', '4c 4d 5h 5s 6c 7d 8h', [5, 6]),
+    ('six card flush', 'Ah Jh 9h 7h 5h 3h Kc', [6, 12, 9, 7, 5, 3]),
+    ('seven card flush', 'Ah Jh 9h 7h 5h 3h 2h', [6, 12, 9, 7, 5, 3]),
+    ('flush beats a straight', '5h 6c 7h 8h 9d 2h Kh', [6, 11, 6, 5, 3, 0]),
+    ('flush beats trips', 'Ah Ac Ad 9h 7h 5h 2h', [6, 12, 7, 5, 3, 0]),
+    ('straight flush under an offsuit straight', '5h 6h 7h 8h 9h 10c 2h', [9, 7]),
+    ('six card straight flush', '5h 6h 7h 8h 9h 10h 2c', [9, 8]),
+    ('royal flush', '10s Js Qs Ks As Ac Ad', [9, 12]),
+    ('flush and straight in different cards', '2h 4h 7h 8h 9c 10d Jh', [6, 9, 6, 5, 2, 0]),
+]
+
+def strength_list(strengths):
+    """ maps an array of strengths back to score_hand lists """
+    return [strength_to_score(int(strength)) for strength in strengths]
+
+def run_backends(hands):
+    """
+        scores an (N, 7) array of hands with every backend.  The incremental backend
+        takes the first 5 columns as the board.
+        returns {backend: (scores, seconds)}, reference scores are score_hand lists,
+        all others are strengths.
+    """
+    results = {}
+    rows = hands.tolist()
+
+    start = time.time()
+    results['reference'] = ([score_hand(row) for row in rows], time.time() - start)
+
+    start = time.time()
+    results['table'] = ([evaluate_hand(row) for row in rows], time.time() - start)
+
+    start = time.time()
+    results['batch'] = (score_hands_batch(hands), time.time() - start)
+
+    start = time.time()
+    results['incremental'] = ([HandState(row[:5]).strength_with(row[5:]) for row in rows], time.time() - start)
+    return results
+
+class Report(object):
+    """ adds up mismatches and timing for every backend over all the chunks """
+    def __init__(self):
+        self.hands = 0
+        self.seconds = {backend: 0.0 for backend in Backends}
+        self.mismatches = {backend: 0 for backend in Backends}
+        self.order_checks = 0
+        self.order_mismatches = {backend: 0 for backend in Backends}
+        self.examples = []
+
+    def add(self, hands, results, pairs):
+        reference = results['reference'][0]
+        self.hands += len(hands)
+        for backend in Backends:
+            self.seconds[backend] += results[backend][1]
+        for backend in Backends[1:]:
+            strengths = results[backend][0]
+            for i, score in enumerate(strength_list(strengths)):
+                if score != reference[i]:
+                    self.mismatches[backend] += 1
+                    if len(self.examples) < 10:
+                        self.examples.append((backend, hands[i].tolist(), reference[i], score))
+
+        # ordering: the sign of every comparison has to be the same as score_hand's
+        first, second = pairs
+        self.order_checks += len(first)
+        for backend in Backends[1:]:
+            strengths = np.asarray(results[backend][0])
+            order = np.sign(strengths[first] - strengths[second])
+            for i, j, sign in zip(first, second, order):
+                reference_sign = (reference[i] > reference[j]) - (reference[i] < reference[j])
+                if sign != reference_sign:
+                    self.order_mismatches[backend] += 1
+
+    def failed(self):
+        return sum(self.mismatches.values()) + sum(self.order_mismatches.values()) > 0
+
+    def show(self, title):
+        print("")
+        print("{}: {} hands, {} ordered pairs".format(title, self.hands, self.order_checks))
+        print("{:<12} {:>12} {:>12} {:>14}".format('backend', 'mismatches', 'order', 'evals/sec'))
+        for backend in Backends:
+            rate = self.hands / self.seconds[backend] if self.seconds[backend] > 0 else float('inf')
+            if backend == 'reference':
+                print("{:<12} {:>12} {:>12} {:>14,.0f}".format(backend, '-', '-', rate))
+            else:
+                print("{:<12} {:>12} {:>12} {:>14,.0f}".format(backend, self.mismatches[backend], self.order_mismatches[backend], rate))
+        for backend, cards, expected, got in self.examples:
+            print("  {} got {} for {}, score_hand says {}".format(backend, got, [card_to_char(card) for card in cards], expected))
+
+def random_pairs(size, rng):
+    """ size random (i, j) index pairs into a chunk, used for the ordering checks """
+    if size < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return rng.integers(0, size, size), rng.integers(0, size, size)
+
+def add_hole_cards(boards, rng):
+    """ deals 2 random hole cards not on the board to every row of an (N, 5) array of sorted boards """
+    size = len(boards)
+    first = rng.integers(0, 47, size)
+    second = rng.integers(0, 46, size)
+    second += second >= first # 2 different picks out of the 47 cards left
+    hole = np.stack([first, second], axis=1)
+    # the k-th card left over is k plus the number of board cards at or below it
+    for column in range(5):
+        hole += hole >= boards[:, column:column + 1]
+    return np.hstack([boards, hole])
+
+def check_edge_cases():
+    """ every edge case through every backend, returns the number of failures """
+    failures = 0
+    print("edge cases:")
+    for name, text, expected in EdgeCases:
+        cards = cards_from_text(text)
+        hands = np.array([cards])
+        results = run_backends(hands)
+        got = {'reference': results['reference'][0][0]}
+        for backend in Backends[1:]:
+            got[backend] = strength_to_score(int(results[backend][0][0]))
+        wrong = [backend for backend in Backends if got[backend] != expected]
+        if wrong:
+            failures += 1
+            print("  FAIL {:<45} expected {} got {}".format(name, expected, {backend: got[backend] for backend in wrong}))
+        else:
+            print("  ok   {:<45} {}".format(name, expected))
+    return failures
+
+def check_boards(limit, chunk_size, rng):
+    """ every 5 card board (or the first limit of them) plus 2 random hole cards """
+    report = Report()
+    boards = itertools.combinations(range(52), 5)
+    if limit is not None:
+        boards = itertools.islice(boards, limit)
+    while True:
+        chunk_of_boards = np.array(list(itertools.islice(boards, chunk_size)), dtype=np.int64)
+        if len(chunk_of_boards) == 0:
+            break
+        hands = add_hole_cards(chunk_of_boards, rng)
+        report.add(hands, run_backends(hands), random_pairs(len(hands), rng))
+        print("  checked {} boards".format(report.hands), end='\r')
+    report.show("all 5 card boards + 2 hole cards" if limit is None else "first {} boards + 2 hole cards".format(limit))
+    return report
+
+def check_samples(samples, chunk_size, rng):
+    """ random 7 card hands, drawn by sorting random keys so every hand is equally likely """
+    report = Report()
+    left = samples
+    while left > 0:
+        size = min(chunk_size, left)
+        hands = np.argsort(rng.random((size, 52)), axis=1)[:, :7]
+        report.add(hands, run_backends(hands), random_pairs(size, rng))
+        left -= size
+    report.show("random 7 card hands")
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="differential checks and timing of the poker.py hand evaluators")
+    parser.add_argument('--boards', type=int, default=None, help="only check the first N boards (default all 2,598,960)")
+    parser.add_argument('--samples', type=int, default=1000000, help="random 7 card hands to check")
+    parser.add_argument('--chunk', type=int, default=50000, help="hands scored per backend call")
+    parser.add_argument('--seed', type=int, default=7, help="seed for the hole cards and samples")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    load_hand_rank_tables()
+    score_hands_batch(np.array([cards_from_text('Ac Kc Qc Jc 10c 2d 3d')])) # warms up the batch tables so they don't count in the timing
+
+    failures = check_edge_cases()
+    board_report = check_boards(args.boards, args.chunk, rng)
+    sample_report = check_samples(args.samples, args.chunk, rng)
+
+    if failures or board_report.failed() or sample_report.failed():
+        print("")
+        print("evaluators do NOT agree with score_hand")
+        sys.exit(1)
+    print("")
+    print("all evaluators agree with score_hand")
@@ -9,25 +9,80 @@ import collections
 import time
 import math
 import copy
+import inspect
+import types
+import array
+import bisect
+import sqlite3
 import pandas as pd
 
 from collections import Counter
 from multiprocessing import Pool
+from multiprocessing import shared_memory
 from functools import partial
 
 #pip install numpy
 import numpy as np
 
-# named tuple is a tuple object (immutable type) that also has names.  
-# immutable means once created they can't be modified.
-# named tuple means you can access properties via . notation
-# so if you have a card instance: card.suit and card.rank
-# should return the suit and rank respectively.
-Card = collections.namedtuple('Card', ['rank', 'suit'])
+# cards are encoded as integers 0..51 across the whole engine: card = rank * 4 + suit,
+# where rank is the index into Ranks (0 = '2', 12 = 'A') and suit the index into Suits.
+# rank is card >> 2 and suit is card & 3, so the evaluator and the deck never touch
+# strings.  A set of cards is a 52-bit integer mask with bit (1 << card) set per card.
+# Strings are only produced when output gets written, see card_to_string/card_to_char.
+Ranks = [str(n) for n in range(2, 11)] + list('JQKA')
+Suits = ['clubs','diamonds','hearts','spades']
+RankIndex = {rank:i for i, rank in enumerate(Ranks)}
+SuitIndex = {suit:i for i, suit in enumerate(Suits)}
 
 # maps card ranks to integers
-RankMap = {rank:i+1 for i, rank in enumerate([str(n) for n in range(2, 11)] + list('JQKA'))}
-Ranks = [str(n) for n in range(2, 11)] + list('JQKA')
+RankMap = {rank:i+1 for i, rank in enumerate(Ranks)}
+
+class Card(int):
+    """
+        Card is the integer card code with a .rank and .suit attached to it.  It
+        is the adapter that keeps older bet_strategy implementations working: 
+        card.rank, card.suit, card[0] and rank, suit = card all behave like the old
+        Card(rank, suit) named tuple, while the engine just sees an int.
+
+        Card(rank='10', suit='hearts') or Card(34) both create the same card.
+    """
+    __slots__ = ()
+
+    def __new__(cls, rank, suit=None):
+        if suit is None:
+            code = int(rank)
+        else:
+            code = RankIndex[rank] * 4 + SuitIndex[suit]
+        if code < 0 or code > 51:
+            raise Exception("ERROR: card code {} has to be between 0 and 51".format(code))
+        return super().__new__(cls, code)
+
+    @property
+    def rank(self):
+        return Ranks[self >> 2]
+
+    @property
+    def suit(self):
+        return Suits[self & 3]
+
+    def __iter__(self):
+        return iter((self.rank, self.suit))
+
+    def __getitem__(self, index):
+        return (self.rank, self.suit)[index]
+
+    def __bool__(self):
+        return True # the 2 of clubs is card 0, but it's still a card
+
+    def __getnewargs__(self):
+        return (int(self),)
+
+    def __repr__(self):
+        return "Card(rank='{}', suit='{}')".format(self.rank, self.suit)
+
+# the 52 card instances, index with a card code to get the adapter for it
+CardSet = tuple(Card(code) for code in range(52))
+
 PokerHierachy ={'high_card':1,'one_pair':2,'two_pair':3,'three_of_kind':4,'straight':5,'flush':6,'full_house':7,'four_of_kind':8,'straight_flush':9}
 PokerInverseHierachy={poker_number:name for name,poker_number in PokerHierachy.items()}
 
@@ -40,20 +95,160 @@ def dprint(message):
         print(message)
     return None
 
+##########################################################################################
+#                          Tracing
+##########################################################################################
+
+# Structured events instead of dprint, a call site looks like:
+#
+#   if tracing:
+#       trace(TraceRaise, self.current_game, self.name, raise_amount)
+#
+# so with tracing off an event costs reading a global, nothing gets formatted.  With
+# tracing on every event is a fixed size record in the ring buffer of the process
+# (trace_buffer), the last TraceBufferSize events stay around.  When a table fails its
+# process dumps them to data/trace_<table_id>_<pid>.npy, pool workers included, see
+# show_trace.py to read one.  debug = 1 turns tracing on and prints every event as it
+# comes, which works with use_parallel too.
+TraceEvents = [ # code -> (name, message), player is the number of players_<n>
+    ('table_start', 'table {game} started'),
+    ('table_end', 'table {game} ended: {a} games in {b} seconds'),
+    ('game_start', 'start game {game}'),
+    ('game_skipped', 'skipping game since no players left to play: {game}'),
+    ('game_end', 'end game {game}'),
+    ('street', 'game {game}: {a} community cards, bidding round {b}'),
+    ('bet', 'game {game}: current {a} for players_{player}'),
+    ('raise', 'game {game}: players_{player} - raises {a}'),
+    ('call', 'game {game}: players_{player} - calls/checks'),
+    ('fold', 'game {game}: players_{player} - folds'),
+    ('last_man', 'game {game}: players_{player} - is last man standing'),
+    ('pot', 'game {game}: current pot is: ${a}'),
+    ('showdown', 'game {game}: checking win condition for players_{player}'),
+]
+(TraceTableStart, TraceTableEnd, TraceGameStart, TraceGameSkipped, TraceGameEnd, TraceStreet, TraceBet,
+ TraceRaise, TraceCall, TraceFold, TraceLastMan, TracePot, TraceShowdown) = range(len(TraceEvents))
+
+TraceRecord = np.dtype([('time', 'f8'), ('event', 'i2'), ('player', 'i2'), ('game', 'i8'), ('a', 'f8'), ('b', 'f8')])
+TraceBufferSize = 100000
+
+class TraceBuffer(object):
+    """ the last size events of a process as TraceRecord rows, oldest get overwritten first """
+    def __init__(self,size=TraceBufferSize):
+        self.size = size
+        self.count = 0 # events ever emitted
+        self.records = np.zeros(size, dtype=TraceRecord)
+
+    def emit(self,event,game,player,a,b):
+        self.records[self.count % self.size] = (time.time(), event, player, game, a, b)
+        self.count += 1
+        return None
+
+    def events(self):
+        """ the kept events, oldest first """
+        if self.count <= self.size:
+            return self.records[:self.count].copy()
+        start = self.count % self.size
+        return np.concatenate([self.records[start:], self.records[:start]])
+
+    def dump(self,path):
+        np.save(path, self.events())
+        return path
+
+tracing = 0 # only ever read at the call sites, use start_tracing/stop_tracing
+trace_buffer = None
+
+def start_tracing(size=TraceBufferSize):
+    """ turns tracing on with a new ring buffer for this process """
+    global tracing, trace_buffer
+    trace_buffer = TraceBuffer(size)
+    tracing = 1
+    return trace_buffer
+
+def stop_tracing():
+    global tracing
+    tracing = 0
+    return None
+
+def _trace_value(value):
+    if value is None:
+        return np.nan
+    return value
+
+def trace(event,game=0,player=None,a=None,b=None):
+    """ records an event, player is a player name like players_3 """
+    number = -1
+    if player is not None:
+        suffix = player.rsplit('_', 1)[-1]
+        number = int(suffix) if suffix.isdigit() else -1
+    trace_buffer.emit(event, game, number, _trace_value(a), _trace_value(b))
+    if debug == 1:
+        print(format_trace_event(event, game, number, a, b))
+    return None
+
+def format_trace_event(event,game,player,a,b):
+    def value(number):
+        if number is None or number != number: # NaN is a missing value, a fold for bets
+            return 'None'
+        return int(number) if float(number).is_integer() else round(float(number), 2)
+    return TraceEvents[event][1].format(game=game, player=player, a=value(a), b=value(b))
+
+def format_trace(records):
+    """ a dumped or kept array of TraceRecord as lines of text """
+    return ["{:.6f} {:<12} {}".format(record['time'], TraceEvents[record['event']][0],
+            format_trace_event(int(record['event']), int(record['game']), int(record['player']), float(record['a']), float(record['b'])))
+            for record in records]
+
+def read_trace(path):
+    return np.load(path)
+
+def dump_trace(name):
+    """ writes the ring buffer of this process to data/trace_<name>_<pid>.npy, returns the path """
+    if trace_buffer is None:
+        return None
+    data_dir = os.path.join(os.path.dirname(__file__),'data')
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+    return trace_buffer.dump(os.path.join(data_dir,'trace_{}_{}.npy'.format(name, os.getpid())))
+
 # function for converting a card to characters used mostly in Table.run_analysis
 def card_to_char(card):
-    if card:
-        return card.rank + card.suit[0]
+    if card is not None:
+        return Ranks[card >> 2] + Suits[card & 3][0]
     else:
         return '00'
 
 # fucntion for converting card to string... simlar to the above.
 def card_to_string(card):
-    if card:
-        return card.rank + '-' + card.suit
+    if card is not None:
+        return Ranks[card >> 2] + '-' + Suits[card & 3]
     else:
         return 'Z-N/A'
 
+def card_code(card):
+    """
+        returns the integer code of a card.  Lets the engine accept cards
+        that are not ints yet, like the Card named tuples in the analysis scripts.
+    """
+    if isinstance(card, (int, np.integer)):
+        return int(card)
+    return RankIndex[card.rank] * 4 + SuitIndex[card.suit]
+
+def card_mask(cards):
+    """ returns the 52-bit mask of a set of cards """
+    mask = 0
+    for card in cards:
+        mask |= 1 << card
+    return mask
+
+def mask_to_cards(mask):
+    """ returns the sorted card codes in a 52-bit card mask """
+    cards = []
+    while mask:
+        low_bit = mask & -mask
+        cards.append(low_bit.bit_length() - 1)
+        mask ^= low_bit
+    return cards
+
 # used to take a list and chunk it into a list of n-tuples
 # found this on stackoverflow for chunking lists and used
 # directly for that puporse.
@@ -74,12 +269,12 @@ def card_reduced_set(cards):
         raise Exception("Only 2 cards can be scored")
     card1, card2 = cards 
 
-    if card1.suit == card2.suit:
+    if card1 & 3 == card2 & 3:
         card_suited = "Same"
     else:
         card_suited = "Diff"
 
-    sorted_ranks = sorted([card1.rank, card2.rank],key=lambda card: RankMap[card])
+    sorted_ranks = [Ranks[rank] for rank in sorted([card1 >> 2, card2 >> 2])]
     sorted_ranks.append(card_suited)
 
     return tuple(sorted_ranks)
@@ -115,9 +310,9 @@ class FrenchDeck():
         """
             sets up the Deck.
         """
-        self.ranks = [str(n) for n in range(2, 11)] + list('JQKA')
-        self.suits = 'spades diamonds clubs hearts'.split()
-        standard_card_deck = [Card(rank, suit) for suit in self.suits for rank in self.ranks]
+        self.ranks = Ranks
+        self.suits = Suits
+        standard_card_deck = list(CardSet) # card codes 0..51, see Card
         self.all_cards = standard_card_deck[:]
         random.shuffle(standard_card_deck)
         self.cards = standard_card_deck
@@ -140,7 +335,7 @@ class FrenchDeck():
         """ load the deck from the save point created by save_deck command """ 
         if self.cards and self.removed_cards:
             self.cards = self.saved_deck[:]
-            self.removed_cards = self.removed_cards[:]
+            self.removed_cards = self.saved_removed_deck[:]
         return None
 
     def reshuffle_draw_deck(self):
@@ -234,31 +429,33 @@ class FrenchDeck():
         else:
             return self._permute(num_of_cards=num_of_cards,hands=hands)
 
-    def remove_card(self,rank,suit):
+    def remove_card(self,rank,suit=None):
         """
             Take your deck and try to remove a card with a certain rank and suit
-            This is used to simulate outcomes in the Player class.
+            This is used to simulate outcomes in the Player class.  You can also
+            pass the card itself: remove_card(card).
 
             What it does high-level, it checks if a card exists in the deck,
             if it does, it removes it to the discard.  If it's not in the draw
             it makes sure it's in the discard.  If it's in neither the 
             draw or discard piles, it errors out.
         """
-        card_to_find = Card(rank = rank, suit = suit)
-        if card_to_find not in self.all_cards:
+        if suit is None:
+            card_to_find = card_code(rank)
+        elif rank in RankIndex and suit in SuitIndex:
+            card_to_find = RankIndex[rank] * 4 + SuitIndex[suit]
+        else:
+            card_to_find = -1
+        if card_to_find < 0 or card_to_find > 51:
             raise Exception("ERROR: card is a non-standard card type")
 
-        index = 0
-        found_index = -1
-        for card in self.cards:
-            if card == card_to_find:
-                found_index = index
-            index = index + 1
-        
+        try:
+            found_index = self.cards.index(card_to_find)
+        except ValueError:
+            found_index = -1
+
         if found_index == -1:
-            try:
-                self.removed_cards.index(card_to_find)
-            except:
+            if card_to_find not in self.removed_cards:
                 Exception("ERROR:card is missing from the deck completely")
         else:
             removed_card = self.cards.pop(found_index)
@@ -269,72 +466,881 @@ class FrenchDeck():
     def __str__(self):
         return "French Deck ({} of {} cards remaining)".format(len(self.cards),len(self.all_cards))
 
-simulate_win_odds_cache = {}
+class ArrayDeck(object):
+    """
+        FrenchDeck with the same methods, but the cards live in one byte array:
+
+            order[:live]  -> the draw pile
+            order[live:]  -> the removed cards, in the order they left
+            where[card]   -> position of a card in order
+
+        so remove_card is a swap with the last card of the draw pile, draw and permute 
+        do a partial Fisher-Yates that only shuffles the cards they hand out.  Since the 
+        draw pile is always a random permutation, nothing ever has to shuffle the whole deck.
+
+        Draws and removals only move cards around inside order[:live], so the cards that 
+        were in the draw pile at save_deck are still order[:live] of that time and 
+        load_deck just sets live back.  Only a reshuffle in between needs the saved copy.
+    """
+    ranks = Ranks
+    suits = Suits
+    all_cards = CardSet
+    new_deck = array.array('b', range(52)) # copied by every new deck
+
+    def __init__(self,rng=None):
+        self.rng = rng # numpy Generator to shuffle with, the random module if None
+        self.order = self.new_deck[:]
+        self.where = self.new_deck[:]
+        self.live = 52
+        self.reshuffles = 0
+        self.saved_deck = None
+        return None
+
+    @property
+    def cards(self):
+        return [CardSet[card] for card in self.order[:self.live]]
+
+    @property
+    def removed_cards(self):
+        return [CardSet[card] for card in self.order[self.live:]]
+
+    def set_seed(self,seed):
+        if self.rng is None:
+            random.seed(seed)
+        else:
+            self.rng = random_stream(np.random.SeedSequence(seed))
+        return None
+
+    def save_deck(self):
+        """ save the deck and go back to it using the load_deck command"""
+        self.saved_deck = (self.live, self.reshuffles, self.order[:], self.where[:])
+        return None
+
+    def load_deck(self):
+        """ load the deck from the save point created by save_deck command """
+        if self.saved_deck is not None:
+            self.live, reshuffles, order, where = self.saved_deck
+            if reshuffles != self.reshuffles:
+                self.order = order[:]
+                self.where = where[:]
+                self.reshuffles = reshuffles
+        return None
+
+    def reshuffle_draw_deck(self):
+        """ the draw pile gets dealt in random order anyway, nothing to do """
+        return None
+
+    def reshuffle(self):
+        """ puts the removed cards back into the draw pile """
+        self.live = 52
+        self.reshuffles += 1
+        return None
+
+    def _pick(self,num_of_cards):
+        """ partial Fisher-Yates: moves num_of_cards random cards to the end of the draw pile, returns them """
+        order, where = self.order, self.where
+        live = self.live
+        if self.rng is None:
+            uniforms = [random.random() for _ in range(num_of_cards)]
+        else:
+            uniforms = self.rng.random(num_of_cards).tolist() # one call per draw, not per card
+        for last, uniform in zip(range(live - 1, live - 1 - num_of_cards, -1), uniforms):
+            pick = int(uniform * (last + 1))
+            card, other = order[pick], order[last]
+            order[pick], order[last] = other, card
+            where[other], where[card] = pick, last
+        return [CardSet[order[last]] for last in range(live - 1, live - 1 - num_of_cards, -1)]
+
+    def _draw(self,num_of_cards,hands=1):
+        if hands < 1:
+            raise Exception("Error: at least 1 hand needs to be drawn")
+
+        if num_of_cards < 1 or num_of_cards > 52:
+            raise Exception("Error: Tried to draw {} has to be between 1 and {}".format(num_of_cards,self.live))
+
+        for _ in range(hands):
+            if num_of_cards >= self.live:
+                self.reshuffle()
+            new_draw = self._pick(num_of_cards)
+            self.live -= num_of_cards
+            yield new_draw
+
+    def draw(self,num_of_cards,hands=1):
+        """ same as FrenchDeck.draw """
+        if hands == 1 and 0 < num_of_cards < self.live:
+            new_draw = self._pick(num_of_cards) # no generator for the common case
+            self.live -= num_of_cards
+            return new_draw
+        elif hands == 1:
+            return next(self._draw(num_of_cards=num_of_cards,hands=hands))
+        else:
+            return self._draw(num_of_cards=num_of_cards,hands=hands)
+
+    def _permute(self,num_of_cards,hands=1):
+        if num_of_cards < 1 or num_of_cards > self.live:
+            raise Exception("Error: Draw has to be between 1 and {}".format(self.live))
+
+        if hands < 1:
+            raise Exception("Error: at least 1 hand needs to be drawn")
+
+        for _ in range(hands):
+            yield self._pick(num_of_cards) # only moves cards around inside the draw pile
+
+    def permute(self,num_of_cards,hands=1):
+        """ same as FrenchDeck.permute """
+        if hands == 1:
+            return next(self._permute(num_of_cards=num_of_cards,hands=hands))
+        else:
+            return self._permute(num_of_cards=num_of_cards,hands=hands)
+
+    def remove_card(self,rank,suit=None):
+        """ same as FrenchDeck.remove_card, a card that was already removed is left alone """
+        if suit is None:
+            card_to_find = card_code(rank)
+        elif rank in RankIndex and suit in SuitIndex:
+            card_to_find = RankIndex[rank] * 4 + SuitIndex[suit]
+        else:
+            card_to_find = -1
+        if card_to_find < 0 or card_to_find > 51:
+            raise Exception("ERROR: card is a non-standard card type")
+
+        position = self.where[card_to_find]
+        if position < self.live:
+            last = self.live - 1
+            other = self.order[last]
+            self.order[position], self.order[last] = other, card_to_find
+            self.where[other], self.where[card_to_find] = position, last
+            self.live = last
+        return None
+
+    def __str__(self):
+        return "Array Deck ({} of {} cards remaining)".format(self.live,len(self.all_cards))
+
+MaxDealCards = 2 * 6 + 5 # board + hole cards of a full table
+
+def deal_cards(hands,rng,cards_per_hand=MaxDealCards):
+    """
+        deals hands rows of cards_per_hand cards in one go: every row is the start of a 
+        random permutation of the deck (sorting random keys).  returns a uint8 (hands, cards_per_hand) array.
+    """
+    return np.argsort(rng.random((hands,52)),axis=1)[:,:cards_per_hand].astype(np.uint8)
+
+class DealSource(object):
+    """
+        all the cards of a run dealt up front, a uint8 array (tables, hands, MaxDealCards).
+        A hand is laid out like Game expects it, board first and then 2 hole cards per seat,
+        so a table with fewer players just uses the first 2 * players + 5 cards and the 
+        board and first seats are the same whatever the number of players.
+
+        Table n is dealt from the same stream as Table.run_simulation uses on its own 
+        (seed, table n, DealStream), so pre-dealing doesn't change a single card.  The deals
+        can be written to a deal file (.npy, read back memory mapped) to replay them later,
+        or put in shared memory so pool workers read them without getting a copy each:
+
+            deals = DealSource.generate(tables, hands, seed)
+            deals.save('benchmark_deals.npy')
+            deals = DealSource.load('benchmark_deals.npy')
+            handle = deals.share()          -> in the parent, picklable
+            deals = DealSource.attach(handle) -> in the worker
+    """
+    def __init__(self,deals,shared_memory=None):
+        if deals.ndim != 3 or deals.shape[2] != MaxDealCards:
+            raise Exception("Error: deals need the shape (tables, hands, {}), got {}".format(MaxDealCards,deals.shape))
+        self.deals = deals
+        self.shared_memory = shared_memory # SharedMemory block behind deals, if any
+
+    @classmethod
+    def generate(cls,tables,hands,seed):
+        deals = np.empty((tables,hands,MaxDealCards),dtype=np.uint8)
+        for table_number in range(tables):
+            table_seed = np.random.SeedSequence(seed, spawn_key=(table_number,))
+            deals[table_number] = deal_cards(hands,random_stream(child_seed(table_seed,DealStream)))
+        return cls(deals)
+
+    @classmethod
+    def load(cls,path):
+        return cls(np.load(path,mmap_mode='r'))
+
+    def save(self,path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)),exist_ok=True)
+        temp_file = path + '.tmp.npy'
+        np.save(temp_file,self.deals)
+        os.replace(temp_file,path)
+        return path
+
+    def share(self):
+        """ copies the deals into a shared memory block, returns the handle for attach """
+        if self.shared_memory is None:
+            block = shared_memory.SharedMemory(create=True,size=self.deals.nbytes)
+            shared = np.ndarray(self.deals.shape,dtype=np.uint8,buffer=block.buf)
+            shared[:] = self.deals
+            self.deals = shared
+            self.shared_memory = block
+        return (self.shared_memory.name,self.deals.shape)
+
+    @classmethod
+    def attach(cls,handle):
+        name, shape = handle
+        block = shared_memory.SharedMemory(name=name)
+        return cls(np.ndarray(shape,dtype=np.uint8,buffer=block.buf),block)
+
+    def release(self):
+        """ frees the shared memory block, only the process that called share should do this """
+        if self.shared_memory is not None:
+            self.deals = np.array(self.deals)
+            self.shared_memory.close()
+            self.shared_memory.unlink()
+            self.shared_memory = None
+        return None
+
+    def table_deals(self,table_number,players,hands=None):
+        """ the (hands, 2 * players + 5) deals of one table """
+        if table_number >= self.deals.shape[0] or (hands is not None and hands > self.deals.shape[1]):
+            raise Exception("Error: deals only cover {} tables of {} hands".format(self.deals.shape[0],self.deals.shape[1]))
+        return self.deals[table_number,:hands,:2 * players + 5]
+
+def iterate_deals(deals):
+    """ yields the rows of a deal array as lists of cards, what Game takes """
+    for row in deals.tolist():
+        yield [CardSet[card] for card in row]
+
+deal_source = None # DealSource of a pool worker, see init_worker
+
+class EquityCache(object):
+    """
+        bounded cache of sampled equities for simulate_win_odds.  States are keyed by 
+        their suit isomorphic class (street_indexer) and the number of opponents, so 
+        As Ks on 2s 7d 9c and Ah Kh on 2h 7c 9d share an entry.  Instead of keeping the
+        first (noisy) answer, every entry adds up the wins and trials of every call that
+        sampled it, so each hit returns the estimate so far and makes it better.  Once an
+        entry has settle_trials trials it is returned without sampling.  Only 'plain'
+        sampling goes through the cache, the other SamplingModes aren't win counts.
+
+        The least recently used entries get evicted once there are more than max_entries
+        or the entries take more than max_bytes (about ENTRY_BYTES each).
+    """
+    ENTRY_BYTES = 240 # key tuple + [wins, trials] list + the OrderedDict node, roughly
+
+    def __init__(self,max_entries=200000,max_bytes=64 * 1024 * 1024,settle_trials=2000):
+        self.max_entries = min(max_entries,max_bytes // self.ENTRY_BYTES)
+        self.settle_trials = settle_trials
+        self.entries = collections.OrderedDict() # key -> [wins, trials], least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self,cards,river,opponents):
+        return (len(river),opponents,int(street_indexer(len(river)).index(list(cards) + list(river))))
+
+    def get(self,key):
+        """ (wins, trials) of a state or None, counts as a hit or a miss """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return (entry[0],entry[1])
+
+    def add(self,key,wins,trials):
+        """ adds samples to a state, returns its (wins, trials) so far """
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = [0.0,0]
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        else:
+            self.entries.move_to_end(key)
+        entry[0] += wins
+        entry[1] += trials
+        return (entry[0],entry[1])
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'bytes': len(self.entries) * self.ENTRY_BYTES}
+
+    def __len__(self):
+        return len(self.entries)
+
+# one cache per process, pool workers each get their own.  Off by default: a worker shares its
+# entries between all the tables it plays, so with the cache on the odds a table sees depend on
+# which tables ran in that worker before it and runs with the same 'seed' are no longer repeatable.
+equity_cache = EquityCache()
+use_cache = 0 # set to 1 to reuse sampled odds across calls (faster, not repeatable)
+
+EQUITY_STORE_FILE = 'equity_store_v1.sqlite'
+
+class EquityStore(object):
+    """
+        the on disk side of the EquityCache, so sampled equities outlive a pool worker
+        and a run.  It is a SQLite file in WAL mode, so all the workers can read it while
+        one of them writes, with 2 tables keyed like EquityCache.key:
+
+            equity_log  -> append only (board_cards, opponents, class, wins, trials) rows,
+                           workers write their new samples here in batches
+            equity      -> one row per state, the log gets merged into it by compact()
+
+        A state's counts are its equity row plus all its log rows.  Only new samples get
+        written, counts loaded from the store never go back in, so nothing is counted twice.
+    """
+    def __init__(self,path=None,batch_size=500,timeout=60):
+        if path is None:
+            path = os.path.join(TABLE_DIR, EQUITY_STORE_FILE)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        self.pending = [] # samples not written yet
+        self.pid = os.getpid() # a forked worker must not use the connection of its parent
+        self.connection = sqlite3.connect(path, timeout=timeout) # timeout -> waits for the other writers
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS equity (board_cards INTEGER, opponents INTEGER, class INTEGER, wins REAL, trials INTEGER, PRIMARY KEY (board_cards, opponents, class)) WITHOUT ROWID")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS equity_log (board_cards INTEGER, opponents INTEGER, class INTEGER, wins REAL, trials INTEGER)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS equity_log_state ON equity_log (board_cards, opponents, class)")
+
+    def get(self,key):
+        """ (wins, trials) of a state over the equity table and the log, None if it was never sampled """
+        wins, trials = self.connection.execute(
+            "SELECT SUM(wins), SUM(trials) FROM (SELECT wins, trials FROM equity WHERE board_cards=? AND opponents=? AND class=? "
+            "UNION ALL SELECT wins, trials FROM equity_log WHERE board_cards=? AND opponents=? AND class=?)", key + key).fetchone()
+        if trials is None:
+            return None
+        return (wins, trials)
+
+    def add(self,key,wins,trials):
+        """ queues new samples of a state, they get written batch_size at a time """
+        self.pending.append(key + (wins, trials))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """ appends the queued samples to the log in one transaction """
+        if not self.pending:
+            return 0
+        with self.connection:
+            self.connection.executemany("INSERT INTO equity_log VALUES (?,?,?,?,?)", self.pending)
+        written = len(self.pending)
+        self.pending = []
+        return written
+
+    def warm(self,cache,limit=None):
+        """ loads the most sampled states of the equity table into cache, returns how many """
+        if limit is None:
+            limit = cache.max_entries
+        rows = self.connection.execute("SELECT board_cards, opponents, class, wins, trials FROM equity ORDER BY trials DESC LIMIT ?", (limit,)).fetchall()
+        for board_cards, opponents, index, wins, trials in reversed(rows): # most sampled last, so they are the last to get evicted
+            cache.add((board_cards, opponents, index), wins, trials)
+        return len(rows)
+
+    def compact(self):
+        """ merges the log into the equity table and empties it, returns the number of log rows merged """
+        self.flush()
+        with self.connection:
+            merged = self.connection.execute("SELECT COUNT(*) FROM equity_log").fetchone()[0]
+            self.connection.execute(
+                "INSERT INTO equity SELECT board_cards, opponents, class, SUM(wins), SUM(trials) FROM equity_log WHERE true GROUP BY board_cards, opponents, class "
+                "ON CONFLICT (board_cards, opponents, class) DO UPDATE SET wins = wins + excluded.wins, trials = trials + excluded.trials")
+            self.connection.execute("DELETE FROM equity_log")
+        self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return merged
+
+    def stats(self):
+        states, trials = self.connection.execute("SELECT COUNT(*), SUM(trials) FROM equity").fetchone()
+        log_rows = self.connection.execute("SELECT COUNT(*) FROM equity_log").fetchone()[0]
+        return {'states': states, 'trials': trials or 0, 'log_rows': log_rows, 'pending': len(self.pending)}
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+equity_store = None # EquityStore of this process, see open_equity_store
+
+def open_equity_store(path=None,warm=True):
+    """ 
+        opens the store for this process and warm loads equity_cache from it, used as the 
+        Pool initializer so every worker starts with what earlier runs sampled.
+    """
+    global equity_store
+    if equity_store is not None and equity_store.pid == os.getpid():
+        equity_store.close()
+    equity_store = EquityStore(path)
+    if warm:
+        equity_cache.clear() # a forked worker has a copy of the parents cache, warming on top would count it twice
+        equity_store.warm(equity_cache)
+    return equity_store
+
+def flush_equity_store():
+    """ writes what this process sampled so far, called after every table """
+    if equity_store is not None:
+        equity_store.flush()
+    return None
+
+def sampling_rng():
+    """ numpy generator seeded from random, so random.seed keeps making serial runs repeatable """
+    return np.random.default_rng(random.getrandbits(64))
+
+# Every table, player and MCTS engine gets its own random stream: a Philox (counter based)
+# generator on a SeedSequence whose spawn key says whose stream it is:
+#
+#   (table,)                       -> the table, table is its number inside the simulation
+#   (table, DealStream)            -> the cards dealt at that table
+#   (table, PlayerStream, seat)    -> the strategy of the player in that seat
+#   (table, PlayerStream, seat, n) -> the n-th MCTS engine of that player
+#   (LockstepStream, simulation)   -> the strategies of a simulation run by LockstepTables
+#
+# A stream only depends on the seed and its key, so the order tables run in (or what
+# worker runs them) doesn't matter, and a strategy that samples more or less doesn't move
+# the deals.  Table n of every simulation gets the same deals, which makes a comparison
+# of 2 simulations a comparison on the same cards (common random numbers).
+DealStream = 0
+PlayerStream = 1
+LockstepStream = 2 ** 31 # way past any table number
+
+def random_stream(seed):
+    """ numpy Generator on a Philox bit generator for a SeedSequence """
+    return np.random.Generator(np.random.Philox(seed))
+
+def child_seed(seed, *keys):
+    """ SeedSequence of the sub stream keys of seed, the same every time it is asked for """
+    return np.random.SeedSequence(seed.entropy, spawn_key=tuple(seed.spawn_key) + keys)
+
+def new_seed():
+    """ SeedSequence drawn from random, for tables and players created without one """
+    return np.random.SeedSequence(random.getrandbits(64))
+
+# ways of dealing the samples, see sample_showdowns and sampled_equity:
+# plain -> every sample dealt independently
+# stratified -> the first card dealt (first card of the run-out, or of the first opponent
+#     on the river) goes through the cards left in turn from a random start, so every
+#     card gets its fair share of samples instead of a random share
+# antithetic -> samples come in pairs, the second deal of a pair reverses the order of 
+#     the cards left, so it deals the cards the first one didn't
+# (a control variate on the opponents' pre-flop equity was tried as well, it cuts the
+# variance by only 1-6% even with a fixed coefficient, less than it costs, so it's gone)
+SamplingModes = ('plain', 'stratified', 'antithetic')
+
+def sample_showdowns(hands,boards,opponents,samples,rng=None,sampling='plain'):
+    """
+        the vectorized monte-carlo engine.  For every row of hands (S, 2) with its board 
+        (S, 0/3/4/5) it deals samples random run-outs of the board plus a hand for every
+        opponent, all at once: each deal is the first cards of a random order of the
+        cards left, taken with argpartition on a row of random keys (the cards already
+        out get the largest keys).  The board is shared by every hand played on it.
+        Returns an (S, samples, opponents + 1) array of strengths, your hand is column 0.
+    """
+    if rng is None:
+        rng = sampling_rng()
+    hands = np.asarray(hands,dtype=np.int64)
+    boards = np.asarray(boards,dtype=np.int64)
+    if boards.size == 0:
+        boards = boards.reshape(len(hands),0) # pre-flob
+    draw_player = hands.shape[1]
+    draw_river = 5 - boards.shape[1]
+    dealt = draw_river + draw_player * opponents
+    known = np.hstack([hands,boards])
+
+    rows = np.repeat(np.arange(len(hands)),samples)
+    if sampling == 'antithetic':
+        first_half = rng.random((len(hands),(samples + 1) // 2,52))
+        keys = np.concatenate([first_half,1.0 - first_half],axis=1)[:,:samples].reshape(len(rows),52)
+    else:
+        keys = rng.random((len(rows),52))
+    np.put_along_axis(keys,known[rows],2.0,axis=1) # cards already out always sort last
+
+    forced = None
+    if sampling == 'stratified' and dealt > 0:
+        live = np.array([np.setdiff1d(np.arange(52),state) for state in known]) # the strata, one per card left
+        strata = live.shape[1]
+        offsets = rng.integers(0,strata,len(hands)) # random start, so every card is still equally likely
+        forced = live[rows,(offsets[rows] + np.tile(np.arange(samples),len(hands))) % strata]
+        keys[np.arange(len(rows)),forced] = 2.0 # dealt by hand below, not by the keys
+        dealt -= 1
+
+    deals = np.argpartition(keys,dealt,axis=1)[:,:dealt] # only which keys are the smallest matters, not their order
+    if forced is not None:
+        deals = np.hstack([forced.reshape(-1,1),deals])
+
+    holdings = np.zeros((len(rows),opponents + 1),dtype=np.int64)
+    holdings[:,0] = hand_masks(hands)[rows] # your hand is always first
+    if opponents > 0:
+        holdings[:,1:] = hand_masks(deals[:,draw_river:].reshape(-1,draw_player)).reshape(len(rows),opponents)
+    strengths = score_holdings_batch(hand_masks(boards)[rows] | hand_masks(deals[:,:draw_river]),holdings)
+    return strengths.reshape(len(hands),samples,opponents + 1)
+
+def sampled_equity(cards,river,opponents,runtimes=100,sampling='plain',rng=None):
+    """ your equity out of runtimes samples dealt with one of the SamplingModes """
+    if sampling not in SamplingModes:
+        raise Exception("Unknown sampling {}, pick one of {}".format(sampling, SamplingModes))
+    if river is None:
+        river = []  # this is a pre-flob situation
+    cards, river = [card_code(card) for card in cards], [card_code(card) for card in river]
+
+    hand_strengths = sample_showdowns([cards],[river],opponents,runtimes,rng,sampling)[0]
+    return float(showdown_shares(hand_strengths)[:,0].mean())
+
+def simulate_showdowns(cards,river,opponents,runtimes=100,rng=None):
+    """
+        deals runtimes random run-outs of the river plus a hand for every opponent and 
+        scores them all in one batch, see sample_showdowns.  Returns a (runtimes, opponents + 1)
+        array of hand strengths, your hand is column 0.
+    """
+    if river is None:
+        river = []  # this is a pre-flob situation
+    cards, river = [card_code(card) for card in cards], [card_code(card) for card in river]
+    return sample_showdowns([cards],[river],opponents,runtimes,rng)[0]
 
-def simulate_win_odds(cards,river,opponents,runtimes=100):
+def simulate_win_odds(cards,river,opponents,runtimes=100,method='auto',sampling='plain',rng=None):
     """
         A player can use this to simulate the odds of them winning a hand of poker.
         You give it your current hand (cards variable), the current river, which is
         either: None (pre-flob), 3,4,5 for post-flop.  The odds change with the 
         number of opponents, so you need to add it to.  You do this for
         runtime number of times and report the percent of wins.  YOu can 
-        think of it as a monte-carlo simulation
+        think of it as a monte-carlo simulation.  A split pot counts as a partial 
+        win (1/2 for a 2-way tie), so this is your equity: the share of the pot you
+        win on average.
+        method: 'sample' always simulates, 'exact' goes through every run-out and 
+        opponent hand (see exact_equity) and 'auto' uses the precomputed tables if 
+        they have the hand (see table_equity), otherwise whatever is cheaper for the street and number of 
+        opponents (see equity_method).
+        sampling: how the samples get dealt, one of SamplingModes.
     """
-    deck = FrenchDeck()
-
-    # enabling cache means if same hand + river show up, use the latest odds and skip calc
-    # bad thing about this is if you get a 1% percentile win-rate on a flop etc, than 
-    # that becomes baked into simulation.  So disable cache == better results, enable
-    # cache means quicker results.
-    use_cache = 0
 
     if river is None:
         river = []  # this is a pre-flob situation
 
-    card_cache = [c for c in sorted(cards,key=lambda c: RankMap[c.rank])]
-    river_cache = [c for c in sorted(river,key=lambda c: RankMap[c.rank])]
-    cache_key = tuple(card_cache + river_cache)
+    if method == 'auto':
+        table_odds = table_equity(cards,river,opponents) # precomputed odds, see build_equity_tables.py
+        if table_odds is not None:
+            return table_odds
 
-    if use_cache == 1:
-        if cache_key in simulate_win_odds_cache:
-            return simulate_win_odds_cache[cache_key]
+    if method == 'auto':
+        method = equity_method(len(river),opponents,runtimes)
 
-    for card in cards + river:
-        deck.remove_card(rank=card.rank,suit=card.suit) # remove the players hand and river from the deck
+    if method == 'exact':
+        win_rate = exact_equity(cards,river,opponents) # no sampling noise at all
+    else:
+        # the cache adds up every sample of a state instead of freezing the first answer, see EquityCache
+        cache_key = None
+        if use_cache == 1 and sampling == 'plain': # entries add up plain win counts, the other modes are estimators of their own
+            cache_key = equity_cache.key(cards,river,opponents)
+            cached = equity_cache.get(cache_key)
+            if cached is None and equity_store is not None:
+                stored = equity_store.get(cache_key) # sampled by another worker or an earlier run
+                if stored is not None:
+                    cached = equity_cache.add(cache_key,stored[0],stored[1])
+            if cached is not None and cached[1] >= equity_cache.settle_trials:
+                return cached[0] / cached[1]
+
+        win_rate = sampled_equity(cards,river,opponents,runtimes,sampling,rng) # your share of the pot, a split pot counts as part of a win
+
+        if cache_key is not None:
+            wins, trials = equity_cache.add(cache_key,win_rate * runtimes,runtimes)
+            if equity_store is not None:
+                equity_store.add(cache_key,win_rate * runtimes,runtimes) # only the new samples go to disk
+            win_rate = wins / trials
 
-    deck.save_deck() # the deck with removed cards is our start point for simulating everything.  So save it and reload after each runtime.
+    return  win_rate # your percent wins
 
-    start_hand = cards # your hand
-    draw_player = len(cards) # all peoples hands
-    draw_river = 5 - len(river) # current number of cards left to draw in the river
+# result of estimate_equity: the equity, the low and high end of its confidence interval
+# and how many samples it took (0 when it came from a table or exact enumeration)
+EquityEstimate = collections.namedtuple('EquityEstimate', ['equity', 'low', 'high', 'samples'])
+
+def wilson_interval(wins,samples,z=1.96):
+    """ Wilson score interval of wins out of samples, z = 1.96 is a 95% interval """
+    if samples == 0:
+        return (0.0, 1.0)
+    p = wins / float(samples)
+    denominator = 1 + z * z / samples
+    center = (p + z * z / (2 * samples)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / samples + z * z / (4 * samples * samples)) / denominator
+    return (max(0.0, center - half_width), min(1.0, center + half_width))
+
+def estimate_equity(cards,river,opponents,target_error=None,max_samples=1000,batch_size=100,threshold=None,z=1.96,rng=None):
+    """
+        simulate_win_odds that samples only as much as it needs to.  It samples in batches
+        of batch_size and stops as soon as:
+            1. the standard error (Wilson half-width / z) is below target_error, or
+            2. threshold is clearly on one side of the interval (for strategies that only 
+               compare the equity against a number), or
+            3. max_samples are used up.
+        Tables and exact enumeration are used first like simulate_win_odds does.  
+        Returns an EquityEstimate.  Split pots count as partial wins, which makes the 
+        binomial error a (slightly) pessimistic one.
+    """
+    if max_samples < 1 or batch_size < 1:
+        raise Exception("Error: max_samples and batch_size should be at least 1, got {} and {}".format(max_samples, batch_size))
+    if river is None:
+        river = []  # this is a pre-flob situation
 
-    wins = 0
-    for _ in range(runtimes):
-        hands_to_compare = []
-        if len(river) < 5:
-            new_river = deck.draw(draw_river) # draw the river
-        else:
-            new_river = [] # you already drew the river (all 5 cards)
-        current_river = river[:] + new_river # river with simulated cards
-        player_hand = start_hand[:] + current_river[:]  # your hand including simulated river
-        hands_to_compare.append(player_hand) # your hand is always first
-        for _ in range(opponents):
-            opponent_hand = deck.draw(draw_player) + current_river[:] # create opponents hands
-            hands_to_compare.append(opponent_hand) # add after your hand
-        is_win = winning_hand(hands_to_compare) # rank the hands, check if first one won
+    odds = table_equity(cards,river,opponents)
+    if odds is None and equity_method(len(river),opponents,max_samples) == 'exact':
+        odds = exact_equity(cards,river,opponents)
+    if odds is not None:
+        return EquityEstimate(odds, odds, odds, 0)
+
+    if rng is None:
+        rng = sampling_rng()
+    wins = 0.0
+    samples = 0
+    while samples < max_samples:
+        runtimes = min(batch_size, max_samples - samples)
+        hand_strengths = simulate_showdowns(cards,river,opponents,runtimes,rng)
+        wins += float(showdown_shares(hand_strengths)[:,0].sum())
+        samples += runtimes
+
+        low, high = wilson_interval(wins,samples,z)
+        # the Wilson half-width in standard errors, unlike sqrt(p * (1 - p) / n) it isn't 0
+        # when a batch comes back all wins or all losses
+        if target_error is not None and (high - low) / 2 / z <= target_error:
+            break
+        if threshold is not None and (low > threshold or high < threshold):
+            break
+
+    low, high = wilson_interval(wins,samples,z)
+    return EquityEstimate(wins / samples, low, high, samples)
+
+##########################################################################################
+#                          Exact equity enumeration
+##########################################################################################
+
+# On the turn and the river there are few enough run-outs and opponent hands left to 
+# go through all of them, which gives the exact equity instead of a noisy sample.  
+# For every run-out of the board the strength of every possible opponent holding is 
+# scored once in a batch.  With 1 opponent the equity is just counting the holdings 
+# below (and equal to) your hand.  With 2 opponents the number of deals is counted 
+# instead of dealt: the pairs of holdings out of a set minus the pairs sharing a card 
+# (2 different holdings share at most 1 card), so it costs the same as 1 opponent.
+# equity_method decides per (street, opponents) if that beats sampling.
+
+ExactEquityBudget = 60000 # always enumerate below this many hand evaluations, about 10ms
+ExactEquityLimit = 5000000 # never enumerate more than this
+ExactEquityOpponents = 2 # more opponents always get sampled
+
+def exact_equity_cost(board_cards, opponents):
+    """ hand evaluations exact_equity needs with board_cards already on the board """
+    cards_left = 50 - board_cards
+    return math.comb(cards_left, 5 - board_cards) * (math.comb(cards_left, 2) + 1)
+
+def equity_method(board_cards, opponents, runtimes=100):
+    """ 'exact' if enumerating everything is cheap (or cheaper than runtimes samples), else 'sample' """
+    if opponents == 0:
+        return 'exact'
+    if opponents > ExactEquityOpponents:
+        return 'sample'
+    cost = exact_equity_cost(board_cards, opponents)
+    sample_cost = 1500 + runtimes * (opponents + 2) # sample_showdowns has about 1500 evaluations of fixed numpy overhead, dealing a sample costs about 1
+    if cost <= ExactEquityBudget or (cost <= sample_cost and cost <= ExactEquityLimit):
+        return 'exact'
+    return 'sample'
+
+def _disjoint_pairs(first, first_counts, second=None, second_counts=None):
+    """
+        number of pairs of holdings, one from each set, that don't share a card.  sets are
+        per run-out counts of holdings, counts are per run-out and card how many holdings 
+        of the set hold that card.  Without second, pairs inside first.
+    """
+    if second is None:
+        return (first * (first - 1) / 2 - (first_counts * (first_counts - 1) / 2).sum(axis=1)).sum()
+    return (first * second - (first_counts * second_counts).sum(axis=1)).sum()
+
+def exact_equity(cards, river, opponents):
+    """
+        your equity (share of the pot you win on average) going through every run-out 
+        of the board and every hand the opponents can hold.  Same answer simulate_win_odds 
+        gets with infinite runtimes, use equity_method to see if it's affordable.
+    """
+    if river is None:
+        river = []
+    cards, river = [card_code(card) for card in cards], [card_code(card) for card in river]
+    if opponents == 0:
+        return 1.0
+    if opponents > ExactEquityOpponents:
+        raise Exception("Exact equity only goes up to {} opponents".format(ExactEquityOpponents))
+    if exact_equity_cost(len(river), opponents) > ExactEquityLimit:
+        raise Exception("Too many run-outs to enumerate for {} board cards".format(len(river)))
+
+    # everything below works on positions into live, the cards nobody has seen
+    dead = card_mask(cards + river)
+    live = np.array([card for card in range(52) if not dead >> card & 1], dtype=np.int64)
+    holdings = np.array(list(itertools.combinations(range(len(live)), 2)), dtype=np.int64)
+    draw_river = 5 - len(river)
+    runouts = np.array(list(itertools.combinations(range(len(live)), draw_river)), dtype=np.int64).reshape(math.comb(len(live), draw_river), draw_river)
+
+    # every holding scored on every run-out, the ones sharing a card with the run-out don't count
+    boards = HandState(river).lanes | hand_masks(live[runouts])
+    holding_lanes = np.broadcast_to(np.append(hand_masks(live[holdings]), HandState(cards).lanes), (len(runouts), len(holdings) + 1))
+    strengths = score_holdings_batch(boards, holding_lanes)
+    hero_strengths = strengths[:, -1:]
+    strengths = strengths[:, :-1]
+    holding_spots = (1 << holdings[:, 0]) | (1 << holdings[:, 1])
+    runout_spots = np.bitwise_or.reduce(1 << runouts, axis=1)
+    possible = (runout_spots.reshape(-1, 1) & holding_spots) == 0
+    below = possible & (strengths < hero_strengths)
+    equal = possible & (strengths == hero_strengths)
+
+    if opponents == 1:
+        return float((below.sum() + 0.5 * equal.sum()) / possible.sum())
+
+    # which cards each holding uses, to count holdings per card with a matrix product
+    uses_card = np.zeros((len(holdings), len(live)))
+    uses_card[np.arange(len(holdings)), holdings[:, 0]] = 1
+    uses_card[np.arange(len(holdings)), holdings[:, 1]] = 1
+    sets = {}
+    for name, holding_set in (('possible', possible), ('below', below), ('equal', equal)):
+        sets[name] = (holding_set.sum(axis=1).astype(float), holding_set @ uses_card)
+
+    deals = _disjoint_pairs(*sets['possible'])
+    both_below = _disjoint_pairs(*sets['below'])
+    one_tie = _disjoint_pairs(*sets['equal'], *sets['below']) # split 2 ways
+    two_ties = _disjoint_pairs(*sets['equal']) # split 3 ways
+    return float((both_below + one_tie / 2.0 + two_ties / 3.0) / deals)
 
-        if is_win:
-            wins += 1 # keep tabs of your wins
+##########################################################################################
+#                          Precomputed equity tables
+##########################################################################################
 
-        deck.load_deck() # reset the deck for the next simulation
-        deck.reshuffle_draw_deck()
+# before the flop your equity only depends on the class of your hole cards (169 of 
+# them, see street_indexer(0)) and the number of opponents.  build_equity_tables.py 
+# samples every class against 1 to 5 opponents once and saves the result here, than
+# simulate_win_odds answers pre-flop questions with a lookup.  If the table was never
+# built the pre-flop odds are simulated like before.
+PREFLOP_EQUITY_FILE = 'preflop_equity_v1.npz'
+PreflopOpponents = 5 # columns of the table, 1..5 opponents
+_preflop_equity = None # (169, PreflopOpponents) array once loaded, False if there is no table
+_preflop_classes = None # 52 * 52 list, class of every pair of hole cards
+_preflop_equity_pairs = None # (PreflopOpponents, 52, 52) equity of every pair of hole cards, 0 for a card paired with itself
+
+def table_equity_batch(hands, boards, opponents):
+    """ table_equity of every row of (N, 2) hands on (N, 0/3/4/5) boards against (N,) opponents, NaN where the tables don't have it """
+    hands = np.asarray(hands, dtype=np.int64)
+    boards = np.asarray(boards, dtype=np.int64)
+    opponents = np.asarray(opponents)
+    board_cards = boards.shape[1]
+    equity = np.full(len(hands), np.nan)
+    for opponent_count in np.unique(opponents).tolist():
+        rows = opponents == opponent_count
+        if board_cards == 0:
+            values = preflop_equity_array(hands[rows], opponent_count)
+        else:
+            if (board_cards, opponent_count) not in _street_equity:
+                load_street_equity(board_cards, opponent_count)
+            table = _street_equity[(board_cards, opponent_count)]
+            values = None if table is False else table[street_indexer(board_cards).index_batch(np.hstack([hands[rows], boards[rows]]))]
+        if values is not None:
+            equity[rows] = values
+    return equity
+
+def load_preflop_equity(table_dir=None):
+    """ loads the pre-flop table, returns None if it hasn't been built """
+    global _preflop_equity, _preflop_classes, _preflop_equity_pairs
+    if table_dir is None:
+        table_dir = TABLE_DIR # defined with the evaluator tables further down
+    table_file = os.path.join(table_dir, PREFLOP_EQUITY_FILE)
+    if not os.path.exists(table_file):
+        _preflop_equity = False
+        return None
+    with np.load(table_file) as table:
+        _preflop_equity = np.array(table['equity'], dtype=np.float64)
+    _preflop_classes = [0] * (52 * 52)
+    for card1, card2 in itertools.permutations(range(52), 2):
+        _preflop_classes[card1 * 52 + card2] = street_indexer(0).index([card1, card2])
+    _preflop_equity_pairs = _preflop_equity[np.array(_preflop_classes)].T.reshape(PreflopOpponents, 52, 52).copy()
+    _preflop_equity_pairs[:, np.arange(52), np.arange(52)] = 0.0
+    return _preflop_equity
+
+def preflop_equity(cards, opponents):
+    """ equity of your hole cards against opponents random hands, None if the table doesn't cover it """
+    if _preflop_equity is None:
+        load_preflop_equity()
+    if _preflop_equity is False or not 1 <= opponents <= PreflopOpponents:
+        return None
+    card1, card2 = [card_code(card) for card in cards]
+    return float(_preflop_equity[_preflop_classes[card1 * 52 + card2], opponents - 1])
+
+# after the flop the same works on the suit isomorphic (hole cards, board) classes of
+# street_indexer, one flat float32 file per street and number of opponents.  These are
+# too big to build in one go (the river has 123M classes), so build_equity_tables.py 
+# fills them chunk by chunk and can be stopped and restarted: entries that are not
+# built yet are NaN and get simulated like before.  The files are memory-mapped, so 
+# every pool worker reads the same pages.
+STREET_EQUITY_FILE = 'street_equity_{}_{}_v1.npy' # street name, opponents
+StreetNames = {3: 'flop', 4: 'turn', 5: 'river'} # board cards -> street
+_street_equity = {} # (board cards, opponents) -> memory-mapped table, False if there is none
+
+def street_equity_file(board_cards, opponents, table_dir=None):
+    if table_dir is None:
+        table_dir = TABLE_DIR
+    return os.path.join(table_dir, STREET_EQUITY_FILE.format(StreetNames[board_cards], opponents))
+
+def load_street_equity(board_cards, opponents, table_dir=None):
+    """
+        memory-maps the table of a street, returns None if it hasn't been started.  Prints
+        how much of it is built, the rest gets sampled, so the odds of a partly built table
+        change as the build goes on.
+    """
+    table_file = street_equity_file(board_cards, opponents, table_dir)
+    if not os.path.exists(table_file):
+        _street_equity[(board_cards, opponents)] = False
+        return None
+    table = np.load(table_file, mmap_mode='r')
+    built = sum(int(np.count_nonzero(table[start:start + 10000000] == table[start:start + 10000000])) for start in range(0, len(table), 10000000)) # NaN isn't equal to itself
+    print("equity tables: {} {} of {} classes built ({:.1%})".format(os.path.basename(table_file), built, len(table), built / float(len(table))))
+    _street_equity[(board_cards, opponents)] = table
+    return table
+
+def street_equity(cards, river, opponents):
+    """ equity of your hole cards on a flop, turn or river board, None if that entry isn't built """
+    key = (len(river), opponents)
+    if key not in _street_equity:
+        if len(river) not in StreetNames:
+            return None
+        load_street_equity(len(river), opponents)
+    table = _street_equity[key]
+    if table is False:
+        return None
+    equity = float(table[street_indexer(len(river)).index(list(cards) + list(river))])
+    if equity != equity: # NaN, not built yet
+        return None
+    return equity
 
-    win_rate = wins/float(runtimes)
+def preflop_equity_array(hands, opponents=1):
+    """ pre-flop equity of every row of an (N, 2) array of hole cards, None if there is no pre-flop table """
+    if _preflop_equity is None:
+        load_preflop_equity()
+    if _preflop_equity is False or not 1 <= opponents <= PreflopOpponents:
+        return None
+    hands = np.asarray(hands, dtype=np.int64)
+    return _preflop_equity_pairs[opponents - 1][hands[:, 0], hands[:, 1]]
 
-    if use_cache == 1:
-        simulate_win_odds_cache[cache_key] = win_rate
+def report_equity_tables():
+    """
+        prints which precomputed tables this machine has.  They are git-ignored and the
+        odds they don't cover get sampled, so two checkouts with the same seed play
+        differently if their tables differ, the output of a run says which ones it used.
+    """
+    if _preflop_equity is None:
+        load_preflop_equity()
+    if _preflop_equity is False:
+        print("equity tables: no pre-flop table, pre-flop odds get sampled (see build_equity_tables.py)")
+    else:
+        print("equity tables: pre-flop {} ({} classes x {} opponents)".format(PREFLOP_EQUITY_FILE, _preflop_equity.shape[0], _preflop_equity.shape[1]))
+    for board_cards in StreetNames:
+        for opponents in range(1, PreflopOpponents + 1): # tables have at most 6 players
+            if (board_cards, opponents) not in _street_equity:
+                load_street_equity(board_cards, opponents) # prints how much of it is built
+    return None
 
-    return  win_rate # your percent wins
+def table_equity(cards, river, opponents):
+    """ equity from the precomputed tables (pre-flop or street), None if they don't have it """
+    if river is None or len(river) == 0:
+        return preflop_equity(cards, opponents)
+    return street_equity(cards, river, opponents)
 
 #################Shahin's addition############################################
 def is_flush(cards):
@@ -343,22 +1349,16 @@ def is_flush(cards):
     if len(cards)<5: 
         raise Exception("Need at least 5 cards to check for flush")
         return 0
-    card_suit=[]
+    suit_counter=[0,0,0,0]
     for card in cards:
-        card_suit.append(card.suit)
-    card_suits_set=list(Counter(card_suit).keys())
-    card_suits_counter=list(Counter(card_suit).values())
-    if max(card_suits_counter)>=5:
-        flush_count=max(card_suits_counter)
-        flush_suit=card_suits_set[card_suits_counter.index(flush_count)]
-        flush_cards=[]
-        flush_rank=[]
-        for card in cards:
-            if card.suit==flush_suit:
-                flush_cards.append(card)
-                #Find highest flush
-                flush_rank.append(Ranks.index(card.rank))
-        return {'flush':{'suit':flush_suit,'flush_cards':flush_cards,'High_flush_on':max(flush_rank)}}
+        suit_counter[card & 3]+=1
+    flush_count=max(suit_counter)
+    if flush_count>=5:
+        flush_suit=suit_counter.index(flush_count)
+        flush_cards=[card for card in cards if card & 3==flush_suit]
+        #Find highest flush, flushes are compared on their five highest cards
+        flush_rank=sorted([card >> 2 for card in flush_cards],reverse=True)
+        return {'flush':{'suit':Suits[flush_suit],'flush_cards':flush_cards,'High_flush_on':flush_rank[0],'flush_ranks':flush_rank[:5]}}
 
 
 def is_straight(cards):
@@ -367,38 +1367,28 @@ def is_straight(cards):
     there is no straight flush, it will return highest straight if it exists"""
     straight_flush=False
     straight={}
-    card_rank=[]
-    card_suit=[]
-    deck=FrenchDeck()
-    Ranks=deck.ranks
-    for card in cards:
-        card_rank.append(Ranks.index(card.rank))
-        card_suit.append(card.suit)
+    card_rank=[card >> 2 for card in cards]
     sort_rank=sorted(set(card_rank))
     "need to have at least 5 different ranking to check for straight"
     if len(sort_rank)>4:
         #check for lowest possible rank with Ace counting as 1
         if max(sort_rank)==12:
             if sort_rank[3]==3:
-                straight_cards=[]
-                for card in cards:
-                    if Ranks.index(card.rank) in [0,1,2,3,12]:
-                        straight_cards.append(card)
+                straight_cards=[card for card in cards if card >> 2 in (0,1,2,3,12)]
+                # the wheel (A-2-3-4-5) is a 5 high straight, 3 is the rank index of '5'
                 if is_flush(straight_cards):
                     straight_flush=True
-                    straight={'straight_flush':{'suit':is_flush(straight_cards)['flush']['suit'],'High_straight_on':5}}
+                    straight={'straight_flush':{'suit':is_flush(straight_cards)['flush']['suit'],'High_straight_on':3}}
                 else: 
-                    straight={'High_straight_on':5}
+                    straight={'High_straight_on':3}
 
         #iterating over each set of card with 5cards to check for straight
         card_index=0
         while len(sort_rank)-card_index>=5:
             #checking if we have straight flush or not.
             if sort_rank[card_index+4]-sort_rank[card_index]==4:
-                straight_cards=[]
-                for card in cards:
-                    if Ranks.index(card.rank) in sort_rank[card_index:card_index+5]:
-                        straight_cards.append(card)
+                straight_ranks=sort_rank[card_index:card_index+5]
+                straight_cards=[card for card in cards if card >> 2 in straight_ranks]
                 #print('straight_cards hand is=', straight_cards)
                 if is_flush(straight_cards):
                     straight_flush=True
@@ -411,18 +1401,12 @@ def is_straight(cards):
 
 def is_fullHouse(cards):
     'This function returns the fullhouse hand with its trips and pair cards'
-    card_rank=[]
     high_fullhouse=[]
     fullhouse_dic={}
-    deck=FrenchDeck()
-    Ranks=deck.ranks
-    for card in cards:
-        card_rank.append(card.rank)
-    rank_set=list(Counter(card_rank).keys())
-    rank_repetition=list(Counter(card_rank).values())
-    "getting numerical value of each rank for comparison"
-    numeric_rank_set=[Ranks.index(r) for r in rank_set]
-    sort_rank=sorted(numeric_rank_set)
+    rank_counter=Counter([card >> 2 for card in cards])
+    "ranks are already numerical values, so they can be compared directly"
+    numeric_rank_set=list(rank_counter.keys())
+    rank_repetition=list(rank_counter.values())
     fullhouse=[numeric_rank_set[i] for i,j in enumerate(rank_repetition) if (j==2 or j==3)]
     threekind_list=[numeric_rank_set[i] for i,j in enumerate(rank_repetition) if j==3]
     "checking condition for fullhouse"
@@ -438,27 +1422,22 @@ def is_fullHouse(cards):
     
 def number_of_kind(cards):
     "This function returns highes number of a kind anywhere between 2 to 4 if there is less than 2 of a kind it returns highes card"
-    card_rank=[]
-    deck=FrenchDeck()
-    Ranks=deck.ranks
-    for card in cards:
-        card_rank.append(card.rank)
-    rank_set=list(Counter(card_rank).keys())
-    rank_repetition=list(Counter(card_rank).values())
-    "getting numerical value of each rank for comparison"
-    numeric_rank_set=[Ranks.index(r) for r in rank_set]
+    rank_counter=Counter([card >> 2 for card in cards])
+    "ranks are already numerical values, so they can be compared directly"
+    numeric_rank_set=list(rank_counter.keys())
+    rank_repetition=list(rank_counter.values())
     max_repetition=max(rank_repetition)
     sort_rank=sorted(numeric_rank_set)
     kicker_card=list()
     if max_repetition==4:
         """Returns 4 of a kind and use remaining 1 card for kicker-card in case they have the same 
         4 of the kind"""
-        
+        four_kind=numeric_rank_set[rank_repetition.index(max_repetition)]
         "Find next highest card in case highest card is the same as 4 of a kind"
-        if Ranks[sort_rank[-1]]==rank_set[rank_repetition.index(max_repetition)]:
+        if sort_rank[-1]==four_kind:
             sort_rank.pop(-1)
         kicker_card.append(sort_rank[-1])
-        return {'number_of_kind':4,'number_of_kind_on':rank_set[rank_repetition.index(max_repetition)],'kicker_card':kicker_card}
+        return {'number_of_kind':4,'number_of_kind_on':four_kind,'kicker_card':kicker_card}
     elif max_repetition==3:
         "No need to check for possibilities of having two three of the kinds"        
         three_kind=[numeric_rank_set[i] for i,j in enumerate(rank_repetition) if j==3]
@@ -472,24 +1451,20 @@ def number_of_kind(cards):
         counter=0
         while len(kicker_card)<2:
             "Going to next card if any of the two highest cards are the same as 3 of a kinds"
-            if Ranks[sort_rank[-1-counter]]==high_three_card:
+            if sort_rank[-1-counter]==high_three_card:
                 sort_rank.pop(-1-counter)
             kicker_card.append(sort_rank[-1-counter])
             counter+=1
         return {'number_of_kind':3,'number_of_kind_on':high_three_card,'kicker_card':kicker_card}
     elif max_repetition==2:
         #need to check how many pairs we have and then select the highest two pairs if there are more than one.
-        pair_rank=[]
-        for repeat_index in range(len(rank_repetition)):
-            if rank_repetition[repeat_index]==2:
-                pair_rank_index=Ranks.index(rank_set[repeat_index])
-                pair_rank.append(pair_rank_index)
+        pair_rank=[numeric_rank_set[i] for i,j in enumerate(rank_repetition) if j==2]
         number_of_pairs=len(pair_rank)
         if number_of_pairs==1:
             counter=0
             while len(kicker_card)<3:
                 "Going to next card if any of the three highest cards are the same as 3 of a kinds"
-                if Ranks[sort_rank[-1-counter]]==rank_set[rank_repetition.index(max_repetition)]:
+                if sort_rank[-1-counter]==pair_rank[0]:
                     sort_rank.pop(-1-counter)
                 kicker_card.append(sort_rank[-1-counter])
                 counter+=1
@@ -498,7 +1473,7 @@ def number_of_kind(cards):
             counter=0
             while len(kicker_card)<1:
                 "Going to next card if any of the highest cards are the same as 3 of a kinds"
-                while Ranks[sort_rank[-1-counter]] in [Ranks[pair] for pair in pair_rank]:
+                while sort_rank[-1-counter] in pair_rank:
                     sort_rank.pop(-1-counter)
                 kicker_card.append(sort_rank[-1-counter])            
             return {'number_of_kind':2,'number_of_pair':2,'number_of_kind_on':[Ranks[(pair_rank[i])] for i in range(2)],'sort_order':sorted(pair_rank,reverse=True),'kicker_card':kicker_card}
@@ -510,7 +1485,7 @@ def number_of_kind(cards):
             counter=0
             while len(kicker_card)<1:
                 "Going to next card if any of the highest cards are the same as 3 of a kinds"
-                while Ranks[sort_rank[-1-counter]] in [Ranks[pair] for pair in pair_rank]:
+                while sort_rank[-1-counter] in pair_rank:
                     sort_rank.pop(-1-counter)
                 kicker_card.append(sort_rank[-1-counter])            
             return {'number_of_kind':2,'number_of_pair':2,'number_of_kind_on':[Ranks[(pair_rank[i])] for i in range(2)],'sort_order':sorted(pair_rank,reverse=True),'kicker_card':kicker_card}
@@ -526,12 +1501,14 @@ def score_hand(cards):
     """ This function scoring each hand and returning a list as score with priority score starting from item 0 in the score
     for example the highest ranking of the hands given to straight flush, if two people get straight flush then it will look at
     the secon item in the list which is the highest card on their straight flush.
-    poker_hierarchy dictionary is used to rank each hand.
+    poker_hierarchy dictionary is used to rank each hand.  Scores of the same hand type always have the
+    same length and only use the best five cards, so they compare as lists and pack into one integer (pack_score).
     """
     poker_hierarchy={'high_card':1,'one_pair':2,'two_pair':3,'three_of_kind':4,'straight':5,'flush':6,'full_house':7,'four_of_kind':8,'straight_flush':9}
     if (len(cards) != 7):
         raise Exception("Can only score 7 cards")
         return 0
+    cards=[card_code(card) for card in cards]
     straightFlush_or_straight=is_straight(cards)
     flush=is_flush(cards)
     fullHouse=is_fullHouse(cards)
@@ -560,7 +1537,7 @@ def score_hand(cards):
             else:
                 one_pair=[poker_hierarchy['one_pair']]+of_a_kind['sort_order']+of_a_kind['kicker_card']
         elif of_a_kind['number_of_kind']==1:
-            high_card=[poker_hierarchy['high_card']]+[of_a_kind['highest_card_on']]+of_a_kind['kicker_card']
+            high_card=[poker_hierarchy['high_card']]+[of_a_kind['highest_card_on']]+of_a_kind['kicker_card'][:4]
         else:
             #print("number_of_kind function should return number of kind between 1 and 4, but it returned ",of_a_kind['number_of_kind'])
             pass
@@ -578,7 +1555,7 @@ def score_hand(cards):
     elif flush:
         #print("\n\n\n******************************Congratulations**flush******************\n\n\n")
         #print("This set of card is flash on ",flush['flush']['High_flush_on'])
-        return [poker_hierarchy['flush']]+[flush['flush']['High_flush_on']]
+        return [poker_hierarchy['flush']]+flush['flush']['flush_ranks']
     elif straight:
         #print("\n\n\n******************************Congratulations**straight******************\n\n\n")
         #print("This set of card is high straight on ",straight)
@@ -604,27 +1581,861 @@ def score_hand(cards):
 
 ################end of functions defined by Shahin ###########################
 
+##########################################################################################
+#                          Lookup table hand evaluator
+##########################################################################################
+
+# score_hand is the reference, but it is far too slow for simulations.  The evaluator
+# below maps any 7 cards to a single integer strength (1 = worst, 4824 = royal flush)
+# with one addition per card and one table lookup.  Strengths order hands exactly like
+# the score_hand lists do, so max/== on strengths can replace max/== on scores.
+#
+# how it works: every card has a key, (rank key << 9) + suit key.  The rank keys are
+# picked so that the sum over any 7 cards (at most 4 per rank) is unique, so the sum of 
+# the rank keys indexes the strength of the non-flush hands.  The suit keys sum to 
+# a unique number per suit distribution, which tells us if there is a flush and in 
+# what suit.  Flushes are looked up by the 13-bit rank mask of the flush suit.
+#
+# The tables are built once (a few seconds) from score_hand and saved in the tables 
+# folder as .npy files that get memory-mapped, so all pool workers share one copy.
+
+HandRankKeys = (0, 1, 5, 22, 98, 453, 2031, 8698, 22854, 83661, 262349, 636345, 1479181)
+HandSuitKeys = (0, 1, 8, 57)
+CardKeys = tuple((HandRankKeys[card >> 2] << 9) + HandSuitKeys[card & 3] for card in range(52))
+HandStrengthClasses = 4824 # a best five out of seven can only be 4824 of the 7462 five card hands
+TABLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tables')
+HAND_RANKS_FILE = 'hand_ranks_v1.npy'
+HAND_CLASSES_FILE = 'hand_classes_v1.npy'
+
+def _flush_suit_table():
+    """ maps a sum of 7 suit keys to the suit that has 5 or more cards, -1 if there is no flush """
+    flush_suits = [-1] * 512
+    for suit_counts in itertools.product(range(8), repeat=4):
+        if sum(suit_counts) != 7:
+            continue
+        suit_key = sum(count * key for count, key in zip(suit_counts, HandSuitKeys))
+        flush_suit = suit_counts.index(max(suit_counts)) if max(suit_counts) >= 5 else -1
+        if flush_suits[suit_key] not in (-1, flush_suit):
+            raise Exception("suit keys are not unique for 7 cards")
+        flush_suits[suit_key] = flush_suit
+    return tuple(flush_suits)
+
+FlushSuits = _flush_suit_table()
+
+def pack_score(score):
+    """
+        packs a score_hand list into one integer with the same ordering:
+        hand type in bits 20+, than 4 bits per tie breaking rank.
+    """
+    packed = score[0] << 20
+    for i, rank in enumerate(score[1:]):
+        packed |= rank << (16 - 4 * i)
+    return packed
+
+def _rank_count_vectors(cards_left, rank=0):
+    """ all ways of spreading cards_left cards over the ranks >= rank, at most 4 per rank """
+    if rank == 12:
+        if cards_left <= 4:
+            yield (cards_left,)
+        return
+    for count in range(min(4, cards_left) + 1):
+        for rest in _rank_count_vectors(cards_left - count, rank + 1):
+            yield (count,) + rest
+
+def build_hand_rank_tables(table_dir=TABLE_DIR):
+    """
+        builds the evaluator tables from score_hand and saves them to table_dir:
+
+        hand_ranks: uint16, the first 8192 entries are the strengths of flushes by rank mask,
+                    entry 8192 + rank key sum is the strength of a non-flush hand.
+        hand_classes: uint32, the packed score (pack_score) of every strength, in order.
+    """
+    print("building hand evaluator tables in {}...".format(table_dir))
+    rank_key_scores = {}
+    for counts in _rank_count_vectors(7):
+        # spread the suits so no suit has more than 2 cards: never a flush
+        ranks = [rank for rank, count in enumerate(counts) for _ in range(count)]
+        cards = [rank * 4 + i % 4 for i, rank in enumerate(ranks)]
+        rank_key = sum(HandRankKeys[rank] for rank in ranks)
+        if rank_key in rank_key_scores:
+            raise Exception("rank keys are not unique for 7 cards")
+        rank_key_scores[rank_key] = pack_score(score_hand(cards))
+
+    flush_scores = {}
+    for mask in range(8192):
+        flush_ranks = [rank for rank in range(13) if mask >> rank & 1]
+        if len(flush_ranks) < 5 or len(flush_ranks) > 7:
+            continue
+        # 5 or more suited cards always beat what the other 2 cards can add
+        cards = [rank * 4 for rank in flush_ranks] + [1 + 4 * i for i in range(7 - len(flush_ranks))]
+        flush_scores[mask] = pack_score(score_hand(cards))
+
+    hand_classes = sorted(set(rank_key_scores.values()) | set(flush_scores.values()))
+    if len(hand_classes) != HandStrengthClasses:
+        raise Exception("expected {} hand classes, found {}".format(HandStrengthClasses, len(hand_classes)))
+    strengths = {packed: strength + 1 for strength, packed in enumerate(hand_classes)}
+
+    hand_ranks = np.zeros(8192 + max(rank_key_scores) + 1, dtype=np.uint16)
+    for mask, packed in flush_scores.items():
+        hand_ranks[mask] = strengths[packed]
+    for rank_key, packed in rank_key_scores.items():
+        hand_ranks[8192 + rank_key] = strengths[packed]
+
+    if not os.path.exists(table_dir):
+        os.makedirs(table_dir, exist_ok=True)
+    for file_name, table in ((HAND_RANKS_FILE, hand_ranks), (HAND_CLASSES_FILE, np.array(hand_classes, dtype=np.uint32))):
+        # write to a temporary file and rename, so workers never see half written tables
+        temp_file = os.path.join(table_dir, '{}.{}.tmp'.format(file_name, os.getpid()))
+        with open(temp_file, 'wb') as handle:
+            np.save(handle, table)
+        os.replace(temp_file, os.path.join(table_dir, file_name))
+    return None
+
+_hand_ranks = None # memory view over the hand_ranks table, see load_hand_rank_tables
+_hand_classes = None # packed score of each strength, index strength - 1
+_hand_categories = None # PokerHierachy number of each strength, index strength
+
+def load_hand_rank_tables(table_dir=TABLE_DIR):
+    """ memory-maps the evaluator tables, building them first if they don't exist yet """
+    global _hand_ranks, _hand_classes, _hand_categories
+    ranks_file = os.path.join(table_dir, HAND_RANKS_FILE)
+    classes_file = os.path.join(table_dir, HAND_CLASSES_FILE)
+    if not os.path.exists(ranks_file) or not os.path.exists(classes_file):
+        build_hand_rank_tables(table_dir)
+    hand_ranks = np.load(ranks_file, mmap_mode='r')
+    hand_classes = np.load(classes_file, mmap_mode='r')
+    _hand_classes = hand_classes
+    _hand_categories = (0,) + tuple(int(packed) >> 20 for packed in hand_classes)
+    _hand_ranks = memoryview(hand_ranks) # indexing a memoryview returns plain ints, much faster than numpy scalars
+    return None
+
+def evaluate_hand(cards):
+    """
+        returns the strength of 7 cards as an integer between 1 and 4824, higher wins.
+        Same ordering as score_hand, see the notes above.
+    """
+    if _hand_ranks is None:
+        load_hand_rank_tables()
+    key = 0
+    try:
+        for card in cards:
+            key += CardKeys[card]
+    except TypeError:
+        return evaluate_hand([card_code(card) for card in cards]) # not card codes, e.g. Card named tuples
+    flush_suit = FlushSuits[key & 511]
+    if flush_suit < 0:
+        return _hand_ranks[8192 + (key >> 9)]
+    flush_mask = 0
+    for card in cards:
+        if card & 3 == flush_suit:
+            flush_mask |= 1 << (card >> 2)
+    return _hand_ranks[flush_mask]
+
+def hand_category(strength):
+    """ returns the PokerHierachy number (1 high card .. 9 straight flush) of a strength """
+    if _hand_categories is None:
+        load_hand_rank_tables()
+    return _hand_categories[strength]
+
+def strength_to_score(strength):
+    """ turns a strength back into the score_hand list it stands for """
+    if _hand_classes is None:
+        load_hand_rank_tables()
+    packed = int(_hand_classes[strength - 1])
+    ranks = [(packed >> (16 - 4 * i)) & 15 for i in range(5)]
+    ranks_used = {1: 5, 2: 4, 3: 3, 4: 3, 5: 1, 6: 5, 7: 2, 8: 2, 9: 1}[packed >> 20]
+    return [packed >> 20] + ranks[:ranks_used]
+
+def score_to_strength(score):
+    """ turns a score_hand list into its strength, the inverse of strength_to_score """
+    if _hand_classes is None:
+        load_hand_rank_tables()
+    packed = pack_score(score)
+    strength = int(np.searchsorted(_hand_classes, packed)) + 1
+    if strength > HandStrengthClasses or int(_hand_classes[strength - 1]) != packed:
+        raise Exception("{} is not a valid hand score".format(score))
+    return strength
+
+##########################################################################################
+#                          NumPy batch hand evaluator
+##########################################################################################
+
+# score_hands_batch scores a whole (N, 7) array of card codes with array operations, no
+# python loop per hand.  Each hand becomes one 64-bit mask with a 16-bit lane per suit 
+# holding the 13-bit rank mask of that suit.  The rank histogram is counted straight 
+# from the four suit lanes with bitwise adders (one bit plane per count bit), which 
+# gives the pair, trips and quads rank masks without a per-rank loop or a sort.  
+# Straights and kickers come from small tables indexed by 13-bit rank masks.  Every
+# hand is packed like pack_score and than mapped to the strength evaluate_hand returns.
+
+SuitLanes = np.array([(card & 3) * 16 + (card >> 2) for card in range(52)], dtype=np.int64)
+RankMask = 0x1fff
+_batch_tables = None
+
+def _build_batch_tables():
+    """ per 13-bit rank mask tables: number of bits, highest bit, top five ranks packed, straight high card """
+    masks = np.arange(8192)
+    bit_counts = np.zeros(8192, dtype=np.int32)
+    high_bits = np.full(8192, -1, dtype=np.int32)
+    top_five = np.zeros(8192, dtype=np.int32)
+    for rank in range(13):
+        has_rank = (masks >> rank) & 1 == 1
+        bit_counts += has_rank
+        high_bits[has_rank] = rank
+    for mask in range(8192):
+        ranks = [rank for rank in range(12, -1, -1) if mask >> rank & 1][:5]
+        top_five[mask] = sum(rank << (16 - 4 * i) for i, rank in enumerate(ranks))
+
+    straight_highs = np.full(8192, -1, dtype=np.int32)
+    # lowest straight first, the wheel (A,2,3,4,5) is a 5 high straight
+    straight_patterns = [(3, 0b1000000001111)] + [(high, 0b11111 << (high - 4)) for high in range(4, 13)]
+    for high, pattern in straight_patterns:
+        straight_highs[(masks & pattern) == pattern] = high
+    return {'bit_counts': bit_counts, 'high_bits': high_bits, 'top_five': top_five, 'straight_highs': straight_highs}
+
+def _remove_rank(mask, rank):
+    """ clears rank from an array of rank masks, rank -1 means nothing to clear """
+    return mask & ~np.left_shift(1, rank, where=rank >= 0, out=np.zeros_like(mask))
+
+def hand_masks(cards):
+    """ turns an (N, k) array of card codes into N suit lane masks, see the notes above """
+    cards = np.asarray(cards, dtype=np.int64)
+    return np.bitwise_or.reduce(1 << SuitLanes[cards], axis=1)
+
+def score_hand_masks(masks):
+    """
+        scores 7-card hands given as suit lane masks (see hand_masks).
+        returns the strengths as an int64 array.
+    """
+    global _batch_tables
+    if _batch_tables is None:
+        _batch_tables = _build_batch_tables()
+    if _hand_classes is None:
+        load_hand_rank_tables()
+    bit_counts = _batch_tables['bit_counts']
+    high_bits = _batch_tables['high_bits']
+    top_five = _batch_tables['top_five']
+    straight_highs = _batch_tables['straight_highs']
+
+    masks = np.asarray(masks, dtype=np.int64)
+    # the lanes fit in 32 bits, which halves the memory traffic of everything below
+    clubs, diamonds, hearts, spades = [((masks >> (16 * suit)) & RankMask).astype(np.int32) for suit in range(4)]
+
+    # rank histogram as bit planes: count = 4 * fours + 2 * twos + ones
+    low_sum, low_carry = clubs ^ diamonds, clubs & diamonds
+    high_sum, high_carry = hearts ^ spades, hearts & spades
+    ones = low_sum ^ high_sum
+    ones_carry = low_sum & high_sum
+    twos = low_carry ^ high_carry ^ ones_carry
+    fours = (low_carry & high_carry) | (ones_carry & (low_carry ^ high_carry))
+    quad_mask = fours
+    trip_mask = twos & ones
+    pair_mask = twos & ~ones
+    rank_mask = clubs | diamonds | hearts | spades
+
+    # with 7 cards only one suit can have 5 or more
+    flush_mask = np.zeros_like(clubs)
+    for suit_mask in (clubs, diamonds, hearts, spades):
+        flush_mask |= np.where(bit_counts[suit_mask] >= 5, suit_mask, 0)
+    is_flush = flush_mask > 0
+
+    quads = high_bits[quad_mask]
+    trips = high_bits[trip_mask]
+    second_trips = high_bits[_remove_rank(trip_mask, trips)]
+    top_pair = high_bits[pair_mask]
+    second_pair = high_bits[_remove_rank(pair_mask, top_pair)]
+    full_house_pair = np.maximum(second_trips, top_pair)
+    straight_flush_high = straight_highs[flush_mask]
+    straight_high = straight_highs[rank_mask]
+
+    quads_kicker = high_bits[_remove_rank(rank_mask, quads)]
+    trips_kickers = top_five[_remove_rank(rank_mask, trips)] >> 12
+    two_pair_kicker = high_bits[_remove_rank(_remove_rank(rank_mask, top_pair), second_pair)]
+    pair_kickers = top_five[_remove_rank(rank_mask, top_pair)] >> 8
+
+    # best hand type first, same order as score_hand
+    conditions = [
+        straight_flush_high >= 0,
+        quads >= 0,
+        (trips >= 0) & (full_house_pair >= 0),
+        is_flush,
+        straight_high >= 0,
+        trips >= 0,
+        second_pair >= 0,
+        top_pair >= 0,
+    ]
+    packed_scores = [
+        (9 << 20) | (straight_flush_high << 16),
+        (8 << 20) | (quads << 16) | (quads_kicker << 12),
+        (7 << 20) | (trips << 16) | (full_house_pair << 12),
+        (6 << 20) | top_five[flush_mask],
+        (5 << 20) | (straight_high << 16),
+        (4 << 20) | (trips << 16) | (trips_kickers << 8),
+        (3 << 20) | (top_pair << 16) | (second_pair << 12) | (two_pair_kicker << 8),
+        (2 << 20) | (top_pair << 16) | (pair_kickers << 4),
+    ]
+    packed = np.select(conditions, packed_scores, default=(1 << 20) | top_five[rank_mask])
+    return np.searchsorted(_hand_classes, packed.astype(np.uint32)) + 1
+
+def score_hands_batch(cards):
+    """
+        score_hands_batch(cards) -> strengths
+
+        scores an (N, 7) array of card codes in one call.  Returns an int64 array of
+        N strengths, the same numbers evaluate_hand returns for each row.
+    """
+    cards = np.asarray(cards, dtype=np.int64)
+    if cards.ndim != 2 or cards.shape[1] != 7:
+        raise Exception("Can only score an (N, 7) array of cards, got shape {}".format(cards.shape))
+    if len(cards) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return score_hand_masks(hand_masks(cards))
+
+##########################################################################################
+#                          Incremental hand evaluator
+##########################################################################################
+
+# HandState folds cards in one at a time.  It keeps the running card key sum of 
+# evaluate_hand and the suit lane mask of score_hand_masks, so adding a card is two
+# additions and forking a state is copying three ints.  Work on the board is done once
+# and shared: build the state of the board and than ask it for the strength of each 
+# hole card pair, or fork it when the river grows by a card.
+
+CardLanes = tuple(1 << int(lane) for lane in SuitLanes)
+
+class HandState(object):
+    """
+        state = HandState(flop)     # fold in the board once
+        state.add_card(turn)        # the next street folds in a single card
+        state.strength_with(hand)   # strength of board + 2 hole cards, 7 cards in total
+        river_state = state.fork()  # cheap copy to try out run-outs on
+    """
+    __slots__ = ('key', 'lanes', 'card_count')
+
+    def __init__(self, cards=None):
+        self.key = 0 # sum of CardKeys, see evaluate_hand
+        self.lanes = 0 # 13-bit rank mask per suit, see score_hand_masks
+        self.card_count = 0
+        if cards is not None:
+            self.add_cards(cards)
+
+    def add_card(self, card):
+        if self.lanes & CardLanes[card]:
+            raise Exception("{} is already part of the hand".format(CardSet[card]))
+        self.key += CardKeys[card]
+        self.lanes |= CardLanes[card]
+        self.card_count += 1
+        return self
+
+    def add_cards(self, cards):
+        for card in cards:
+            self.add_card(card)
+        return self
+
+    def fork(self):
+        """ copy of the state, adding cards to it leaves this one alone """
+        state = HandState.__new__(HandState)
+        state.key, state.lanes, state.card_count = self.key, self.lanes, self.card_count
+        return state
+
+    def with_cards(self, cards):
+        """ a new state with cards added, this one stays unchanged """
+        return self.fork().add_cards(cards)
+
+    def _lookup(self, key, lanes):
+        if _hand_ranks is None:
+            load_hand_rank_tables()
+        flush_suit = FlushSuits[key & 511]
+        if flush_suit < 0:
+            return _hand_ranks[8192 + (key >> 9)]
+        return _hand_ranks[(lanes >> (16 * flush_suit)) & RankMask]
+
+    def strength(self):
+        """ evaluate_hand strength, the state needs to hold 7 cards """
+        if self.card_count != 7:
+            raise Exception("Can only score 7 cards, the hand has {}".format(self.card_count))
+        return self._lookup(self.key, self.lanes)
+
+    def strength_with(self, cards):
+        """ strength of the state plus cards (7 in total) without changing or copying the state """
+        if self.card_count + len(cards) != 7:
+            raise Exception("Can only score 7 cards, the hand would have {}".format(self.card_count + len(cards)))
+        key, lanes = self.key, self.lanes
+        for card in cards:
+            key += CardKeys[card]
+            lanes |= CardLanes[card]
+        return self._lookup(key, lanes)
+
+    def __repr__(self):
+        return "HandState({} cards)".format(self.card_count)
+
+def score_holdings_batch(board_masks, holding_masks):
+    """
+        scores boards against holdings without rebuilding the board part of each hand.
+        board_masks: (N,) suit lane masks of 5 card boards (hand_masks of the boards).
+        holding_masks: (N, K) suit lane masks of K 2-card holdings played on each board.
+        returns an (N, K) array of strengths.
+    """
+    holding_masks = np.asarray(holding_masks, dtype=np.int64)
+    hands = np.asarray(board_masks, dtype=np.int64).reshape(-1, 1) | holding_masks
+    return score_hand_masks(hands.ravel()).reshape(holding_masks.shape)
+
+# result of a showdown, one entry per seat in the order the hands were given:
+# strengths -> evaluate_hand strength of each hand
+# outcomes -> 'win', 'tie' or 'lose' for each hand
+# shares -> fraction of the pot each hand gets, a 3-way tie gets 1/3 each
+Showdown = collections.namedtuple('Showdown', ['strengths', 'outcomes', 'shares'])
+
+def showdown(hands, board=None):
+    """
+        scores every hand exactly once and splits the pot between the best hands.
+        hands are 7 cards each, or just the hole cards when the board is passed in as a
+        HandState, which saves re-adding the board for every hand.
+        returns a Showdown, see above.
+    """
+    if board is None:
+        strengths = [evaluate_hand(hand) for hand in hands]
+    else:
+        strengths = [board.strength_with(hand) for hand in hands]
+    best_hand = max(strengths)
+    number_of_winners = strengths.count(best_hand)
+    if number_of_winners == 1:
+        winning_outcome = 'win'
+    else:
+        winning_outcome = 'tie'
+    outcomes = [winning_outcome if strength == best_hand else 'lose' for strength in strengths]
+    shares = [1.0 / number_of_winners if strength == best_hand else 0.0 for strength in strengths]
+    return Showdown(strengths, outcomes, shares)
+
+def showdown_shares(hand_strengths):
+    """
+        batch version of showdown for the simulations: takes a (runtimes, seats) array of
+        strengths and returns the pot share of every seat in every simulation.
+    """
+    best_hands = hand_strengths == hand_strengths.max(axis=1, keepdims=True)
+    return best_hands / best_hands.sum(axis=1, keepdims=True)
+
 def winning_hand(hands):
     """ 
-        used in the simulate_win_odds function.  This needs to be implemented still.
-        Right now it just randomly picks win or lose.  Use the hand score function
-        here and than check if 1st entry has highest rank.
-    """
-    winning_hand=[]
-    hand_scores = []
-    player_scores=[]
-    for hand in hands:
-        score = score_hand(hand)
-        if winning_hand<score:
-            winning_hand=score 
-        hand_scores.append(score)
-    for player,hand in enumerate(hands):
-        if score_hand(hand)==winning_hand:
-            player_scores.append(1)
-        else:
-            player_scores.append(0)
-    # if 1st hand did not win return 0 else 1
-    return player_scores[0]
+        returns 1 if the 1st hand has the best hand (or ties for it) else 0.  Kept for 
+        the scripts using it, the simulations use showdown/showdown_shares instead, which
+        count ties as a split pot instead of a win.
+    """
+    if showdown(hands).outcomes[0] == 'lose':
+        return 0
+    return 1
+
+##########################################################################################
+#                          Combinatorial number system
+##########################################################################################
+
+# every k card combination of the 52 cards has a dense index between 0 and C(52, k) - 1:
+# sort the cards c1 < c2 < ... < ck, the index is C(c1, 1) + C(c2, 2) + ... + C(ck, k).
+# That lets jobs split all 7 card hands into index ranges and results live in flat
+# arrays instead of dicts keyed by card tuples.
+Binomials = np.array([[math.comb(n, k) for k in range(8)] for n in range(53)], dtype=np.int64).T # Binomials[k, n] = C(n, k)
+
+def rank_combinations(cards):
+    """ (N, k) array of distinct card codes -> N combination indexes, the row order doesn't matter """
+    cards = np.sort(np.asarray(cards, dtype=np.int64), axis=1)
+    index = np.zeros(len(cards), dtype=np.int64)
+    for k in range(cards.shape[1]):
+        index += Binomials[k + 1][cards[:, k]]
+    return index
+
+def unrank_combinations(indexes, k):
+    """ combination indexes -> (N, k) array of card codes in ascending order, the inverse of rank_combinations """
+    indexes = np.array(indexes, dtype=np.int64)
+    cards = np.zeros((len(indexes), k), dtype=np.int64)
+    for position in range(k, 0, -1):
+        # the largest card c with C(c, position) <= index, the rows of Binomials are sorted
+        card = np.searchsorted(Binomials[position], indexes, side='right') - 1
+        cards[:, position - 1] = card
+        indexes -= Binomials[position][card]
+    return cards
+
+##########################################################################################
+#                          Suit isomorphism indexer
+##########################################################################################
+
+# Swapping suits around never changes the odds of a hand, Ah Kh on 2h 7c 9d plays like
+# As Ks on 2s 7d 9c.  HandIndexer gives every such class of hole cards + board one dense
+# integer (the generalisation of card_reduced_set past the pre-flop), so tables can be
+# flat arrays.  It follows Waugh's hand isomorphism indexing:
+#   1. each suit gets the tuple of how many cards of it came in each round (its 
+#      configuration) and an index of which ranks those were, rounds are the hole 
+#      cards and the board streets, ranks use colex order among the ranks still left
+#   2. suits are sorted by (configuration, index), so a suit permutation gives the 
+#      same sorted list
+#   3. suits with the same configuration are interchangeable, so their indexes are 
+#      ranked as a multiset, the rest is a mixed radix number behind the offset of
+#      the configuration of all 4 suits
+# Index space sizes: pre-flop 169, flop 1,286,792, turn 13,960,050, river 123,156,254.
+
+def _suit_index_size(counts):
+    """ how many ways a suit with counts cards per round can pick its ranks """
+    size, used = 1, 0
+    for count in counts:
+        size *= math.comb(13 - used, count)
+        used += count
+    return size
+
+def _multiset_size(size, group):
+    """ number of multisets of group values out of size values """
+    return math.comb(size + group - 1, group)
+
+def _bit_count(mask):
+    return bin(mask).count('1')
+
+def _comb_array(n, k):
+    """ C(n, k) for arrays of n and small k (at most 4), exact in int64 """
+    result = np.ones(np.broadcast(n, k).shape, dtype=np.int64)
+    for step in range(1, 5):
+        result = np.where(k >= step, result * (n - step + 1) // step, result)
+    return result
+
+class HandIndexer(object):
+    """
+        indexer = HandIndexer([2, 3])       # hole cards + flop
+        i = indexer.index(hole + flop)      # 0 <= i < indexer.size, the same for every suit permutation
+        cards = indexer.unindex(i)          # one hand of the class, round by round
+        indexes = indexer.index_batch(hands)   # (N, 5) array of card codes -> N indexes
+
+        rounds are the number of cards in each round, cards are given round by round, the
+        order inside a round doesn't matter.  [2], [2, 3], [2, 4], [2, 5] treat the board as
+        one round (street_indexer uses these), [2, 3, 1, 1] keeps flop, turn and river apart.
+    """
+    def __init__(self, rounds):
+        self.rounds = tuple(rounds)
+        self.round_count = len(self.rounds)
+        self.cards = sum(self.rounds)
+        if self.round_count > 4 or self.cards > 8 or min(self.rounds) < 1:
+            raise Exception("Can not index rounds {}".format(self.rounds))
+
+        # every (count per round) tuple a suit can have, than all sorted 4-suit combinations adding up to rounds
+        suit_counts = [counts for counts in itertools.product(*[range(cards + 1) for cards in self.rounds]) if sum(counts) <= 13]
+        suit_counts.sort(reverse=True)
+        configurations = []
+        def add_suits(configuration, left, start):
+            if len(configuration) == 4:
+                if not any(left):
+                    configurations.append(tuple(configuration))
+                return None
+            for position in range(start, len(suit_counts)):
+                counts = suit_counts[position]
+                if all(count <= cards for count, cards in zip(counts, left)):
+                    add_suits(configuration + [counts], [cards - count for cards, count in zip(left, counts)], position)
+            return None
+        add_suits([], list(self.rounds), 0)
+
+        self.configurations = configurations
+        self.offsets = []
+        self.groups = [] # per configuration: (first position, suits in group, suit index size, multiset size)
+        self.size = 0
+        for configuration in configurations:
+            groups = []
+            for counts, positions in itertools.groupby(range(4), key=lambda position: configuration[position]):
+                positions = list(positions)
+                suit_size = _suit_index_size(counts)
+                groups.append((positions[0], len(positions), suit_size, _multiset_size(suit_size, len(positions))))
+            self.offsets.append(self.size)
+            self.groups.append(groups)
+            self.size += math.prod(group[3] for group in groups)
+        self.configuration_ids = {configuration: i for i, configuration in enumerate(configurations)}
+
+        # the same information as arrays for index_batch
+        keys = [self._configuration_key([self._counts_key(counts) for counts in configuration]) for configuration in configurations]
+        order = np.argsort(keys)
+        self._batch_keys = np.array(keys, dtype=np.int64)[order]
+        self._batch_offsets = np.array(self.offsets, dtype=np.int64)[order]
+        self._batch_multipliers = np.zeros((len(configurations), 4), dtype=np.int64)
+        self._batch_positions = np.zeros((len(configurations), 4), dtype=np.int64)
+        for row, i in enumerate(order):
+            multiplier = 1
+            for first, group, suit_size, multiset_size in self.groups[i]:
+                for position in range(first, first + group):
+                    self._batch_multipliers[row, position] = multiplier
+                    self._batch_positions[row, position] = first + group - 1 - position # place in ascending order
+                multiplier *= multiset_size
+
+    def _counts_key(self, counts):
+        """ counts tuple -> int with the same ordering, 3 bits per round """
+        key = 0
+        for count in counts:
+            key = (key << 3) | count
+        return key
+
+    def _configuration_key(self, counts_keys):
+        key = 0
+        for counts_key in counts_keys:
+            key = (key << 12) | counts_key
+        return key
+
+    def _suit_index(self, masks):
+        """ rank masks of one suit, one per round -> index of the suit among the suits with its counts """
+        index, multiplier, used = 0, 1, 0
+        for mask in masks:
+            count = _bit_count(mask)
+            rank_index, chosen = 0, 0
+            for rank in range(13):
+                if mask >> rank & 1:
+                    chosen += 1
+                    rank_index += math.comb(rank - _bit_count(used & ((1 << rank) - 1)), chosen)
+            index += rank_index * multiplier
+            multiplier *= math.comb(13 - _bit_count(used), count)
+            used |= mask
+        return index
+
+    def _split_rounds(self, cards):
+        if len(cards) != self.cards:
+            raise Exception("Indexer for rounds {} needs {} cards, got {}".format(self.rounds, self.cards, len(cards)))
+        rounds, start = [], 0
+        for cards_in_round in self.rounds:
+            rounds.append(cards[start:start + cards_in_round])
+            start += cards_in_round
+        return rounds
+
+    def index(self, cards):
+        """ cards round by round (e.g. hole + flop) -> canonical index """
+        suit_masks = [[0] * self.round_count for suit in range(4)]
+        seen = 0
+        for round_number, round_cards in enumerate(self._split_rounds(cards)):
+            for card in round_cards:
+                card = card_code(card)
+                if seen >> card & 1:
+                    raise Exception("{} is dealt twice".format(CardSet[card]))
+                seen |= 1 << card
+                suit_masks[card & 3][round_number] |= 1 << (card >> 2)
+
+        suits = sorted([(tuple(_bit_count(mask) for mask in masks), self._suit_index(masks)) for masks in suit_masks], reverse=True)
+        configuration_id = self.configuration_ids[tuple(counts for counts, suit_index in suits)]
+        index, multiplier = self.offsets[configuration_id], 1
+        for first, group, suit_size, multiset_size in self.groups[configuration_id]:
+            values = [suit_index for counts, suit_index in suits[first:first + group]]
+            values.reverse() # ascending
+            index += multiplier * sum(math.comb(value + place, place + 1) for place, value in enumerate(values))
+            multiplier *= multiset_size
+        return index
+
+    def unindex(self, index):
+        """ canonical index -> card codes round by round, one hand of the class """
+        if not 0 <= index < self.size:
+            raise Exception("Index {} out of range for {} hands".format(index, self.size))
+        configuration_id = bisect.bisect_right(self.offsets, index) - 1
+        configuration = self.configurations[configuration_id]
+        left = index - self.offsets[configuration_id]
+
+        suit_indexes = [0] * 4
+        for first, group, suit_size, multiset_size in self.groups[configuration_id]:
+            multiset_index = left % multiset_size
+            left //= multiset_size
+            # largest value first, like unrank_combinations
+            for place in range(group - 1, -1, -1):
+                value = 0
+                while math.comb(value + 1 + place, place + 1) <= multiset_index:
+                    value += 1
+                multiset_index -= math.comb(value + place, place + 1)
+                suit_indexes[first + group - 1 - place] = value
+
+        rounds = [[] for cards_in_round in self.rounds]
+        for suit in range(4):
+            suit_index, used = suit_indexes[suit], 0
+            for round_number, count in enumerate(configuration[suit]):
+                ranks_left = [rank for rank in range(13) if not used >> rank & 1]
+                choices = math.comb(len(ranks_left), count)
+                rank_index = suit_index % choices
+                suit_index //= choices
+                for chosen in range(count, 0, -1):
+                    position = chosen - 1
+                    while math.comb(position + 1, chosen) <= rank_index:
+                        position += 1
+                    rank_index -= math.comb(position, chosen)
+                    rank = ranks_left[position]
+                    used |= 1 << rank
+                    rounds[round_number].append(rank * 4 + suit)
+        return [card for round_cards in rounds for card in sorted(round_cards)]
+
+    def index_batch(self, cards):
+        """ (N, cards) array of card codes, round by round -> N canonical indexes """
+        cards = np.asarray(cards, dtype=np.int64)
+        if cards.ndim != 2 or cards.shape[1] != self.cards:
+            raise Exception("Indexer for rounds {} needs an (N, {}) array, got shape {}".format(self.rounds, self.cards, cards.shape))
+        popcounts = np.array([_bit_count(mask) for mask in range(8192)], dtype=np.int64)
+        below = [(1 << rank) - 1 for rank in range(13)]
+
+        lane_masks, start = [], 0
+        for cards_in_round in self.rounds:
+            lane_masks.append(hand_masks(cards[:, start:start + cards_in_round]))
+            start += cards_in_round
+
+        suit_keys = []
+        for suit in range(4):
+            counts_key = np.zeros(len(cards), dtype=np.int64)
+            suit_index = np.zeros(len(cards), dtype=np.int64)
+            multiplier = np.ones(len(cards), dtype=np.int64)
+            used = np.zeros(len(cards), dtype=np.int64)
+            for lanes in lane_masks:
+                mask = (lanes >> (16 * suit)) & RankMask
+                count = popcounts[mask]
+                rank_index = np.zeros(len(cards), dtype=np.int64)
+                for rank in range(13):
+                    has_rank = (mask >> rank) & 1
+                    position = rank - popcounts[used & below[rank]]
+                    chosen = popcounts[mask & below[rank]] + 1
+                    rank_index += has_rank * Binomials[np.minimum(chosen, 7), position]
+                suit_index += rank_index * multiplier
+                multiplier *= Binomials[count, 13 - popcounts[used]]
+                used |= mask
+                counts_key = (counts_key << 3) | count
+            suit_keys.append((counts_key << 24) | suit_index)
+
+        suits = np.sort(np.stack(suit_keys, axis=1), axis=1)[:, ::-1]
+        counts_keys = suits >> 24
+        values = suits & ((1 << 24) - 1)
+        configuration_key = np.zeros(len(cards), dtype=np.int64)
+        for position in range(4):
+            configuration_key = (configuration_key << 12) | counts_keys[:, position]
+        row = np.searchsorted(self._batch_keys, configuration_key)
+
+        index = self._batch_offsets[row]
+        places = self._batch_positions[row]
+        index += (_comb_array(values + places, places + 1) * self._batch_multipliers[row]).sum(axis=1)
+        return index
+
+    def __repr__(self):
+        return "HandIndexer({}, {} hands)".format(list(self.rounds), self.size)
+
+StreetRounds = {0: [2], 3: [2, 3], 4: [2, 4], 5: [2, 5]} # board cards -> rounds, the order of the board cards doesn't change the odds
+_street_indexers = {}
+
+def street_indexer(board_cards):
+    """ the (cached) HandIndexer for hole cards + a board of 0, 3, 4 or 5 cards """
+    if board_cards not in _street_indexers:
+        if board_cards not in StreetRounds:
+            raise Exception("No street with {} board cards".format(board_cards))
+        _street_indexers[board_cards] = HandIndexer(StreetRounds[board_cards])
+    return _street_indexers[board_cards]
+
+def canonical_index(hand, river=None):
+    """ suit isomorphic index of hole cards + a board of 0, 3, 4 or 5 cards """
+    if river is None:
+        river = []
+    return street_indexer(len(river)).index(list(hand) + list(river))
+
+##########################################################################################
+#                          Recording
+##########################################################################################
+
+# How much a table keeps for run_analysis, the 'record' config key:
+#   none    -> no files, a player only remembers its last game (the learners read it)
+#   summary -> a row per player and game, the poker_balances files
+#   full    -> summary plus every bet, the poker_hands files
+# Rows go into typed arrays that double when they fill up, cards stay codes and the
+# strings are only made when run_analysis writes the files.
+RecordLevels = ['none', 'summary', 'full']
+
+# board cards of a poker_hands row before they come out
+NoRiver = [-1, -1, -1, -1, -1]
+
+# codes of the text columns of poker_balances
+GameResults = ['lost', 'won']
+GameReasons = ['lost_game', 'won_game', 'last_man_standing', 'fold']
+BlindTypes = ['None', 'small', 'big']
+
+def csv_number(value):
+    """ whole amounts are written without the .0 """
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+class BalanceHistory(object):
+    """
+        the poker_balances rows of a player, a game per row:
+
+            codes   -> int64 game id, result, reason, blind and final hand (PokerHierachy, 0 for none)
+            amounts -> float64 beginning, game start and game end balance and net change
+
+        history[i] still gives the old 9 element list so code that reads history[-1][8]
+        keeps working.  With keep=False only the last game stays around.
+    """
+    def __init__(self,keep=True,capacity=64):
+        self.keep = keep
+        self.size = 0
+        self.codes = np.zeros((capacity if keep else 1, 5), dtype=np.int64)
+        self.amounts = np.zeros((capacity if keep else 1, 4), dtype=np.float64)
+
+    def append(self,game_id,result,reason,blind,final_hand,beginning_balance,start_balance,end_balance):
+        row = self.size
+        if not self.keep:
+            row = 0
+        elif row == len(self.codes):
+            self.codes = np.concatenate([self.codes, np.zeros_like(self.codes)])
+            self.amounts = np.concatenate([self.amounts, np.zeros_like(self.amounts)])
+        self.codes[row] = (game_id, result, reason, blind, final_hand)
+        self.amounts[row] = (beginning_balance, start_balance, end_balance, end_balance - start_balance)
+        self.size += 1
+        return None
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self,i):
+        if i < 0:
+            i += self.size
+        if i < 0 or i >= self.size:
+            raise IndexError("game {} of {}".format(i, self.size))
+        if not self.keep:
+            if i != self.size - 1:
+                raise IndexError("only the last game is kept with record level none")
+            i = 0
+        return self.row(i)
+
+    def row(self,i):
+        game_id, result, reason, blind, final_hand = self.codes[i].tolist()
+        return [game_id, GameResults[result], GameReasons[reason], BlindTypes[blind], PokerInverseHierachy.get(final_hand, 'None')] + self.amounts[i].tolist()
+
+    def rows(self):
+        """ every kept game as a list, for the csv export """
+        for i in range(min(self.size, len(self.codes))):
+            row = self.row(i)
+            yield row[:5] + [csv_number(amount) for amount in row[5:]]
+
+class HandHistory(object):
+    """
+        the poker_hands rows of a player, a bet per row:
+
+            codes   -> int64 game id, bet number, opponents, raise allowed, 2 hole cards and 5 board cards (-1 for none)
+            amounts -> float64 call, current, final (NaN for a fold) and pot
+
+        record_bet just copies the numbers in, rows() sorts the cards and makes the strings.
+        There's a row per bet, so the rows go into flat array.arrays (appending to those is
+        a lot cheaper than writing a numpy row) and only become numpy arrays in rows().
+    """
+    def __init__(self):
+        self.size = 0
+        self.codes = array.array('q')
+        self.amounts = array.array('d')
+
+    def append(self,codes,amounts):
+        self.codes.extend(codes)
+        self.amounts.extend(amounts)
+        self.size += 1
+        return None
+
+    def __len__(self):
+        return self.size
+
+    def rows(self):
+        """ the bets as [game_id, bet_number, opponents, call, current, final, pot, allowed, hand1 ... community5] """
+        codes = np.frombuffer(self.codes, dtype=np.int64).reshape(self.size, 11)
+        amounts = np.frombuffer(self.amounts, dtype=np.float64).reshape(self.size, 4)
+        # cards sorted by rank like the old output, no card goes last
+        hole = np.take_along_axis(codes[:, 4:6], np.argsort(codes[:, 4:6] >> 2, axis=1, kind='stable'), axis=1)
+        board = codes[:, 6:]
+        board = np.take_along_axis(board, np.argsort(np.where(board < 0, 99, board >> 2), axis=1, kind='stable'), axis=1)
+        cards = np.hstack([hole, board]).tolist()
+        for i, (game_id, bet_number, opponents, allowed) in enumerate(codes[:, :4].tolist()):
+            call, current, final, pot = [csv_number(amount) if amount == amount else None for amount in amounts[i].tolist()]
+            yield [game_id, bet_number, opponents, call, current, final, pot, bool(allowed)] + [card_to_string(card if card >= 0 else None) for card in cards[i]]
 
 class GenericPlayer(object):
 
@@ -634,11 +2445,13 @@ class GenericPlayer(object):
         More types of play to be added later.
     """
 
-    def __init__(self,name,balance):
+    def __init__(self,name,balance,seed=None):
         """
-            initialize player
+            initialize player, seed is the SeedSequence of the players random stream
         """
         self.name = name
+        self.seed = seed if seed is not None else new_seed()
+        self.rng = random_stream(self.seed) # use this for every random decision of a strategy
         self.balance = balance # players bank account
         self.beginning_balance = self.balance
         self.bet = 0
@@ -646,8 +2459,9 @@ class GenericPlayer(object):
         self.loses = 0
         self.decisions = ['fold','check','call','bet']
         self.strategy = None
-        self.balance_history = []
-        self.hand_history = []
+        self.record = 'full' # see RecordLevels, Table sets it with set_record_level
+        self.balance_history = BalanceHistory()
+        self.hand_history = HandHistory()
         self.games_played = []
         self.predicted_win = []
         self.call = 0
@@ -665,6 +2479,7 @@ class GenericPlayer(object):
         self.active_game = None
         self.pre_flob_wins = {}
         self.short_memory=None # this remembers the immidiate game number to compare it with current game for simpleLearnerPlayer
+        self.game_events = None # EventCursor into the events of the active game, see GameEventLog
 
     def register_for_game(self,game):
         """
@@ -676,6 +2491,7 @@ class GenericPlayer(object):
         self.games_played.append(game_id)
         self.current_game = game_id
         self.active_game = game
+        self.game_events = game.events.cursor()
         self.bid_number = 0
         self.registered_balance = self.balance
         self.folded_this_game = 0
@@ -685,6 +2501,21 @@ class GenericPlayer(object):
         self.final_hand = 'None'
         return None 
 
+    def set_seed(self,seed):
+        """ gives the player the random stream of seed, for strategies whose __init__ doesn't take a seed """
+        self.seed = seed
+        self.rng = random_stream(seed)
+        return None
+
+    def set_record_level(self,record):
+        """ starts new histories that keep what the record level asks for, see RecordLevels """
+        if record not in RecordLevels:
+            raise Exception("Error: record level should be one of {}".format(RecordLevels))
+        self.record = record
+        self.balance_history = BalanceHistory(keep=record != 'none')
+        self.hand_history = HandHistory() if record == 'full' else None
+        return None
+
     def set_final_hand(self,hand_number):
         self.final_hand = PokerInverseHierachy[hand_number]
         return None
@@ -706,22 +2537,18 @@ class GenericPlayer(object):
             a row in a data frame later on in jupyter analysis.  See Table.run_analysis
             for how that is handled.
         """
-        if self.won_game == 1:
-            end_game_result = 'won'
-        else:
-            end_game_result = 'lost'
-
         if self.folded_this_game == 1:
-            player_status = 'fold'
+            player_status = 3 # fold, see GameReasons
         elif self.last_survivor_this_game == 1:
-            player_status = 'last_man_standing'
+            player_status = 2 # last_man_standing
         elif self.won_game == 1:
-            player_status = 'won_game'
+            player_status = 1 # won_game
         else:
-            player_status = 'lost_game'
+            player_status = 0 # lost_game
 
         # this represents a row in the data analysis for this specific player.
-        self.balance_history.append([self.current_game, end_game_result, player_status, self.blind_type, self.final_hand, self.beginning_balance, self.registered_balance, self.balance, self.balance - self.registered_balance])
+        self.balance_history.append(self.current_game, self.won_game, player_status, BlindTypes.index(self.blind_type), PokerHierachy.get(self.final_hand, 0),
+                                    self.beginning_balance, self.registered_balance, self.balance)
         return None
 
     def get_pot(self,pot_value):
@@ -774,7 +2601,8 @@ class GenericPlayer(object):
             non-folded player on the table.
         """
         if self.opponents == 0:
-            dprint("{} - is last man standing".format(self.name))
+            if tracing:
+                trace(TraceLastMan, self.current_game, self.name)
             self.call_bet()
             self.last_survivor_this_game = 1
             return 1
@@ -784,7 +2612,8 @@ class GenericPlayer(object):
         """
             private method for making a raise.
         """
-        dprint("{} - raises {}".format(self.name,raise_amount))
+        if tracing:
+            trace(TraceRaise, self.current_game, self.name, raise_amount)
         if self.call + raise_amount > self.balance and allow_all_in == True:
             bet_amount = self.balance
         elif self.call + raise_amount > self.balance and allow_all_in == False:
@@ -809,7 +2638,8 @@ class GenericPlayer(object):
             bid is higher than your balance you will go all in.  Set this 
             to false to fold if the bid is higher than your balance.
         """
-        dprint("{} - calls/checks".format(self.name))
+        if tracing:
+            trace(TraceCall, self.current_game, self.name)
         if self.call > self.balance and allow_all_in == True:
             bet_amount = self.balance
         elif self.call > self.balance and allow_all_in == False:
@@ -841,7 +2671,8 @@ class GenericPlayer(object):
         """ 
             fold your hand....
         """
-        dprint("{} - folds".format(self.name))
+        if tracing:
+            trace(TraceFold, self.current_game, self.name)
         self.final_bet = None
         self.folded_this_game = 1
         return None
@@ -851,17 +2682,13 @@ class GenericPlayer(object):
             This method is used in make_bet to record the hand and a lot of the statistics
             associated with it.  See table.run_analysis and the poker_hands.csv to see it.
         """
-        # currently not implemented...use this one to record bets...
         self.bid_number += 1
-        river_set = [None for _ in range(5)]
-        if river is not None:
-            for i,card in enumerate(river):
-                river_set[i] = card
-        hand = [card_to_string(card) for card in sorted(hand,key=lambda c: RankMap[c.rank] if c else 99)]
-        if river_set:
-            river_set = [card_to_string(card) for card in sorted(river_set,key=lambda c: RankMap[c.rank] if c else 99)]
-        data_tuple = [self.current_game, self.name, self.__class__.__name__, self.bid_number,opponents,call_bid,current_bid,self.final_bet,pot,raise_allowed] + hand + river_set
-        self.hand_history.append(data_tuple)
+        if self.hand_history is None: # record level below full
+            return None
+        river_set = NoRiver if river is None else list(river) + NoRiver[len(river):]
+        # cards are kept as codes here, HandHistory.rows sorts them and makes the strings on export
+        final_bet = self.final_bet if self.final_bet is not None else math.nan
+        self.hand_history.append([int(self.current_game), self.bid_number, opponents, raise_allowed, hand[0], hand[1]] + river_set, (call_bid, current_bid, final_bet, pot))
         return None
 
     def make_bet(self,hand,river,opponents,call_bid,current_bid,pot,raise_allowed=False):
@@ -875,11 +2702,8 @@ class GenericPlayer(object):
             more like a dispatcher that links a players betting decisions to a game.
         """
         self._set_up_bet(opponents,call_bid,current_bid,raise_allowed)
-        if (self._last_man_standing()):
-            dprint("is last man")
-            self.record_bet(hand,river,opponents,call_bid,current_bid,pot,raise_allowed)
-            return self.final_bet
-        self.bet_strategy(hand,river,opponents,call_bid,current_bid,pot,raise_allowed)
+        if opponents != 0 or not self._last_man_standing(): # _last_man_standing only does something without opponents
+            self.bet_strategy(hand,river,opponents,call_bid,current_bid,pot,raise_allowed)
         self.record_bet(hand,river,opponents,call_bid,current_bid,pot,raise_allowed)
         return self.final_bet
 
@@ -889,85 +2713,228 @@ class GenericPlayer(object):
     def __str__(self):
         return "{} [balance: ${}]".format(self.name,self.balance)
 
+# the rows of GameEventLog, both are plain tuples underneath so ('player', name, action, bid)
+# code keeps working: event[0] is the kind and a player event unpacks into 4 values.
+PlayerEvent = collections.namedtuple('PlayerEvent', ['kind', 'player', 'action', 'bid'])
+CardEvent = collections.namedtuple('CardEvent', ['kind', 'cards'])
+
+class GameEventLog(object):
+    """
+        append-only log of a game, a PlayerEvent for every bet and a CardEvent when community
+        cards come out.  Besides the events in order it keeps:
+
+            player_events -> only the PlayerEvents, in order
+            street_starts -> index into events where every street starts, 0 is pre-flop
+
+        A strategy takes a cursor (GenericPlayer does that for every game, see
+        GenericPlayer.game_events) and asks it for what is new since the last time, so a
+        decision costs the events since the last decision instead of the whole history.
+    """
+    def __init__(self):
+        self.events = []
+        self.player_events = []
+        self.street_starts = [0]
+
+    def add_player(self,player_name,action,bid):
+        event = PlayerEvent('player', player_name, action, bid)
+        self.events.append(event)
+        self.player_events.append(event)
+        return event
+
+    def add_cards(self,cards):
+        self.street_starts.append(len(self.events))
+        event = CardEvent('card', cards)
+        self.events.append(event)
+        return event
+
+    def street(self):
+        """ 0 pre-flop, 1 flop, 2 turn, 3 river """
+        return len(self.street_starts) - 1
+
+    def street_events(self,street):
+        """ the events of one street, the CardEvent that opened it first """
+        stop = self.street_starts[street + 1] if street + 1 < len(self.street_starts) else len(self.events)
+        return self.events[self.street_starts[street]:stop]
+
+    def cursor(self):
+        return EventCursor(self)
+
+    def __len__(self):
+        return len(self.events)
+
+class EventCursor(object):
+    """ a consumers position in a GameEventLog """
+    def __init__(self,log):
+        self.log = log
+        self.position = 0 # events seen so far
+        self.player_position = 0 # player events seen so far
+
+    def new_events(self):
+        """ every event since the last call to new_events """
+        events = self.log.events[self.position:]
+        self.position = len(self.log.events)
+        return events
+
+    def new_player_events(self):
+        """ the player events since the last call to new_player_events """
+        events = self.log.player_events[self.player_position:]
+        self.player_position = len(self.log.player_events)
+        return events
+
+class GameState(object):
+    """
+        the betting state of a game as arrays indexed by seat (the order players joined the
+        game in) instead of a dict per player, with running totals so nothing ever loops
+        over the seats:
+
+            bets[seat]     -> what the seat bet this game
+            active[seat]   -> 1 until the seat folds
+            pot            -> sum of bets
+            required_bid   -> max of bets, what a seat has to bet to stay in
+            active_count   -> number of seats that didn't fold
+            bet_counts     -> {bet: seats with that bet}, one key left means everyone bet the same
+
+        every update is O(1), reset empties it for the next game.
+    """
+    __slots__ = ('seats', 'bets', 'active', 'pot', 'required_bid', 'active_count', 'bet_counts')
+
+    def __init__(self,seats=0):
+        self.reset(seats)
+
+    def reset(self,seats):
+        self.seats = seats
+        self.bets = [0] * seats
+        self.active = [1] * seats
+        self.pot = 0
+        self.required_bid = 0
+        self.active_count = seats
+        self.bet_counts = {0: seats} if seats else {}
+        return None
+
+    def set_bet(self,seat,bet):
+        old_bet = self.bets[seat]
+        if bet == old_bet:
+            return None
+        self.bets[seat] = bet
+        self.pot += bet - old_bet
+        bet_counts = self.bet_counts
+        if bet_counts[old_bet] == 1:
+            del bet_counts[old_bet]
+        else:
+            bet_counts[old_bet] -= 1
+        bet_counts[bet] = bet_counts.get(bet, 0) + 1
+        if bet > self.required_bid:
+            self.required_bid = bet
+        elif old_bet == self.required_bid and old_bet not in bet_counts:
+            self.required_bid = max(bet_counts) # a bet went down, only happens if a strategy returns less than it had in
+        return None
+
+    def fold(self,seat):
+        if self.active[seat]:
+            self.active[seat] = 0
+            self.active_count -= 1
+        return None
+
+    def all_bets_equal(self):
+        return len(self.bet_counts) == 1
+
 class Game(object):
     """
         Game implements an actual poker game.  It has all the mechanics to do
-        pre-flob, post-flob and scoring of games.  The 
+        pre-flob, post-flob and scoring of games.  The betting state lives in a
+        GameState, the players in self.seats and the betting order in self.order
+        (seat numbers).  A Table keeps one Game and calls reset for every hand.
     """
     def __init__(self,game_id,cards,players,minimum_balance_to_join):
+        self.big_blind = 10
+        self.small_blind = 5
+        self.state = GameState()
+        self.reset(game_id,cards,players,minimum_balance_to_join)
+
+    def reset(self,game_id,cards,players,minimum_balance_to_join=None):
+        """ sets the game up for a new hand, so the same Game can play all the hands of a table """
         self.id = str(game_id)
         self.cards = cards
         self.river = cards[:5]
+        self.board = HandState() # the river folded in street by street, see HandState
         self.winner = None
-        self.big_blind = 10
-        self.small_blind = 5
         # you need a minimum balance otherwise, players with $0 will join your game.
-        self.minumum = minimum_balance_to_join
-        self.players = [{"player": player, "active": 1, "hand": None, "bet": 0} for player in players if player.balance > self.minumum] # get rid of losers that don't have enough money
-        self.player_actions = []
+        if minimum_balance_to_join is not None:
+            self.minumum = minimum_balance_to_join
+        self.seats = [player for player in players if player.balance > self.minumum] # get rid of losers that don't have enough money
+        self.hands = [None] * len(self.seats)
+        self.order = list(range(len(self.seats))) # betting order, post_flop starts at the small blind
+        self.state.reset(len(self.seats))
+        self.events = GameEventLog() # what happened so far, strategies read it with their own cursor
 
         for player in players:
             player.register_for_game(self) # get the unique memory id for the game
 
         # every poker game has a small and big blind to prevent people from always folding unless they have pocket aces.
-        self.players_left_at_start = len(self.players)
+        self.players_left_at_start = len(self.seats)
 
         if self.players_left_at_start > 1:
-            self.players[-1]['bet'] = self.big_blind
-            self.players[-1]['player'].pay_bid(self.big_blind)
-            self.players[-1]['player'].set_blind('big')
-            self.players[-2]['bet'] = self.small_blind 
-            self.players[-2]['player'].pay_bid(self.small_blind)
-            self.players[-2]['player'].set_blind('small')
-        
+            self.state.set_bet(self.order[-1], self.big_blind)
+            self.seats[-1].pay_bid(self.big_blind)
+            self.seats[-1].set_blind('big')
+            self.state.set_bet(self.order[-2], self.small_blind)
+            self.seats[-2].pay_bid(self.small_blind)
+            self.seats[-2].set_blind('small')
+        return None
+
+    @property
+    def players(self):
+        """ 
+            the old per player view, {"player", "active", "hand", "bet"} mappings in betting order.  
+            It is built on every call and is read-only (writing raises a TypeError), the engine uses self.state.
+        """
+        state = self.state
+        return tuple(types.MappingProxyType({"player": self.seats[seat], "active": state.active[seat], "hand": self.hands[seat], "bet": state.bets[seat]}) for seat in self.order)
+
     def get_current_pot(self):
         """
             adds all current bets from all players to get the pot 
         """
-        current_pot = 0
-        for player in self.players:
-            current_pot += player['bet']
-        return current_pot
+        return self.state.pot
 
     def get_required_bid(self):
         """
             goes through all the bids to determine what a player needs to bid to still stay active.
         """
-        required_bid = 0
-        for player in self.players:
-            required_bid = max(required_bid,player['bet'])
-        return required_bid
+        return self.state.required_bid
 
     def get_num_active_opponents(self):
         """
             how many opponents each player still has.  Used by players to make bettign decisions
         """
-        return len(self.get_active_players()) - 1
+        return self.state.active_count - 1
+
+    def get_active_seats(self):
+        """ seats still in the game, in betting order """
+        active = self.state.active
+        return [seat for seat in self.order if active[seat]]
 
     def get_active_players(self):
         """
-            get only those players that are still active.
+            get only those players that are still active, the same read-only views as players
+            but only built for the seats that didn't fold.
         """
-        return [player for player in self.players if player['active']]
+        state = self.state
+        return [types.MappingProxyType({"player": self.seats[seat], "active": 1, "hand": self.hands[seat], "bet": state.bets[seat]}) for seat in self.order if state.active[seat]]
 
     def all_players_checked(self):
         """
             if all players have the same bet, you have to proceed to the next round in poker.
             Use this to check that condition and skip 2nd or 3rd round of betting.
         """
-        unique_bets = len(list(set([player['bet'] for player in self.players])))
-        if unique_bets == 1:
-            return True 
-        else:
-            return False
+        return self.state.all_bets_equal()
 
     def update_player_actions(self,player_name,action,bid):
         """ 
             Keep player history so that you can look it up for strategies for example
             MCTS simulations etc.
         """
-        update_tup = ('player', player_name,action,bid)
-        self.player_actions.append(update_tup)
+        self.events.add_player(player_name,action,bid)
         return None
 
     def update_player_actions_cards(self,card):
@@ -975,15 +2942,19 @@ class Game(object):
             Keep player history so that you can look it up for strategies for example
             MCTS simulations etc.
         """
-
-        self.player_actions.append(('card',card))
+        self.events.add_cards(card)
         return None
 
+    @property
+    def player_actions(self):
+        """ all the events of the game in order, don't change it, see GameEventLog """
+        return self.events.events
+
     def get_player_actions(self):
-        return self.player_actions
+        return self.events.events
 
     def set_beginning_players(self):
-        self.beginning_players = [player['player'].name for player in self.players]
+        self.beginning_players = [self.seats[seat].name for seat in self.order]
         return None
 
     def get_beginning_players(self):
@@ -997,49 +2968,54 @@ class Game(object):
             on the last hand to make sure all players bid the same amount in the ending.
             players that try to bid more than they have just end up going all in.
         """
-        for player, hand in zip(self.players,chunk(self.cards[5:],2)):
-            player['hand'] = hand
+        for seat, hand in enumerate(chunk(self.cards[5:],2)):
+            if seat < len(self.hands):
+                self.hands[seat] = hand
 
         self.set_beginning_players()
 
-        dprint("pre-flob bidding")
         # max bid on limit poker is 3 rounds
         current_river = None
+        state = self.state
+        add_event = self.events.add_player # same as update_player_actions, without a call per bet
 
         for turn in range(1,4):  # limited texas hold-em has 3 rounds max
-            dprint("pre-bid round: {}".format(turn))
-            for player in self.get_active_players():  # always remove those people that folded from turnss
-                agent = player['player'] # get player object for method calls
-                current_opponents = self.get_num_active_opponents() # how many opponents does player have
-                current_hand = player['hand'] # what's the players current hand
-                required_bid = self.get_required_bid() # players bid to proceed to next round
-                current_bid = player['bet'] # players current bet
+            if tracing:
+                trace(TraceStreet, self.id, None, 0, turn)
+            for seat in self.order:
+                if not state.active[seat]:  # always skip those people that folded
+                    continue
+                agent = self.seats[seat] # get player object for method calls
+                current_opponents = state.active_count - 1 # how many opponents does player have
+                current_hand = self.hands[seat] # what's the players current hand
+                required_bid = state.required_bid # players bid to proceed to next round
+                current_bid = state.bets[seat] # players current bet
                 call_bid = required_bid - current_bid # player needs this much to continue
                 raise_allowed = turn != 3 # if 3rd turn, don't let the player raise
-                bid = agent.make_bet(current_hand, current_river, current_opponents,call_bid, current_bid, self.get_current_pot(),raise_allowed) # player submits the new bid
-                dprint("current {} for {}".format(bid,player['player']))
+                bid = agent.make_bet(current_hand, current_river, current_opponents,call_bid, current_bid, state.pot,raise_allowed) # player submits the new bid
+                if tracing:
+                    trace(TraceBet, self.id, agent.name, bid)
                 if bid is None:  # if the player folded...than return None, they no longer have a bid
-                    player['active'] = 0 
+                    state.fold(seat)
                     player_bid = None
                     final_action = 'fold'
                 else:
-                    player['bet'] = bid # if they returned a bid, use it here.
+                    state.set_bet(seat,bid) # if they returned a bid, use it here.
                     player_bid = bid - required_bid
                     if player_bid > 0:
                         final_action = 'bet'
                     else:
                         final_action = 'call'
-                self.update_player_actions(agent.name,final_action,player_bid)
+                add_event(agent.name,final_action,player_bid)
 
-            opponents_left = self.get_num_active_opponents()
-            if (opponents_left == 0):  # if 1 player is left quit bidding
+            if state.active_count == 1:  # if 1 player is left quit bidding
                 break
 
-            all_checked = self.all_players_checked()
-            if (all_checked): # if all players agreed on the same bid quit
+            if state.all_bets_equal(): # if all players agreed on the same bid quit
                 break
 
-            dprint("current pot is: ${}".format(self.get_current_pot()))
+            if tracing:
+                trace(TracePot, self.id, None, state.pot)
 
         return None
 
@@ -1052,89 +3028,88 @@ class Game(object):
             ends, the results are scored by the score_game method.
         """
 
-        self.players = self.players[-2:] + self.players[:-2]  # handle post-flop starts at small blind by poker rules
+        self.order = self.order[-2:] + self.order[:-2]  # handle post-flop starts at small blind by poker rules
+        state = self.state
+        add_event = self.events.add_player # same as update_player_actions, without a call per bet
 
-        dprint("post flob bidding")
         for turn in range(1,4):
             num_of_river_cards=turn + 2  # determine number of cards in the river
             current_river = self.river[:num_of_river_cards] # the new river with the added 3 or 1 cards
-            dprint("starting river turn: {}".format(turn))
-            dprint("current community/river is: {}".format(current_river))
+            self.board.add_cards(current_river[self.board.card_count:]) # only the new street gets added
             self.update_player_actions_cards(current_river)
             for bidding_round in range(1,4):  # here we start the 3 bidding rounds
-                dprint("bidding round is: {}".format(bidding_round))
-                for player in self.get_active_players():  # only players that did not fold can play
-                    agent = player['player'] # get player method for agent calls
-                    current_opponents = self.get_num_active_opponents() # get number of opponents for player
-                    current_hand = player['hand'] # players current hand
-                    required_bid = self.get_required_bid() # total bid required to bet in next round
-                    current_bid = player['bet'] # players current bid
+                if tracing:
+                    trace(TraceStreet, self.id, None, num_of_river_cards, bidding_round)
+                for seat in self.order:
+                    if not state.active[seat]:  # only players that did not fold can play
+                        continue
+                    agent = self.seats[seat] # get player method for agent calls
+                    current_opponents = state.active_count - 1 # get number of opponents for player
+                    current_hand = self.hands[seat] # players current hand
+                    required_bid = state.required_bid # total bid required to bet in next round
+                    current_bid = state.bets[seat] # players current bid
                     call_bid = required_bid - current_bid # extra bet required to continue
                     raise_allowed = bidding_round != 3 # don't allow raises on 3rd round
-                    bid = agent.make_bet(current_hand,current_river,current_opponents,call_bid, current_bid, self.get_current_pot(),raise_allowed) # the agent submits his bid based on the info he has
-                    dprint("current {} for {}".format(bid,player['player']))
+                    bid = agent.make_bet(current_hand,current_river,current_opponents,call_bid, current_bid, state.pot,raise_allowed) # the agent submits his bid based on the info he has
+                    if tracing:
+                        trace(TraceBet, self.id, agent.name, bid)
                     if bid is None:
-                        player['active'] = 0 # if the player folds, he leaves the game
+                        state.fold(seat) # if the player folds, he leaves the game
                         player_bid = None
                         final_action = 'fold'
                     else:
-                        player['bet'] = bid # if he makes a bet, it becomes his new bet
+                        state.set_bet(seat,bid) # if he makes a bet, it becomes his new bet
                         player_bid = bid - required_bid
                         if player_bid > 0:
                             final_action = 'bet'
                         else:
                             final_action = 'call'
-                    self.update_player_actions(agent.name,final_action,player_bid)
+                    add_event(agent.name,final_action,player_bid)
 
-                opponents_left = self.get_num_active_opponents()
-                if (opponents_left == 0): # if 1 player is left finish the current bidding round
+                if state.active_count == 1: # if 1 player is left finish the current bidding round
                     break
 
-                all_checked = self.all_players_checked() # if all players agree on bid finishe the current bidding round
-                if (all_checked):
+                if state.all_bets_equal(): # if all players agree on bid finishe the current bidding round
                     break
 
-                dprint("current pot is: ${}".format(self.get_current_pot()))
+                if tracing:
+                    trace(TracePot, self.id, None, state.pot)
 
-            opponents_left = self.get_num_active_opponents()
-            if (opponents_left == 0): # if only 1 person is left after a bidding round finish post flob 
+            if state.active_count == 1: # if only 1 person is left after a bidding round finish post flob 
                 break
         return None
 
     def score_game(self):
         """ 
-            This needs to be fleshed out.  This part should take all active players, score there hands, determine a winner or 
-            winners in the case of a true tie.  Than give/split the pot accordingly.  Requires the score_hand function,
-            which is not implemented yet.  This function currently has a dummy function for testing purposes, which:
+            This part takes all active players, scores there hands, determines a winner or 
+            winners in the case of a true tie.  Than gives/splits the pot accordingly:
 
             1. sees how many people have not folded
-            2. divides the pot between them
-            3. any extra goes to the casino
-        """
-        # dumb currently, just split pot evenly until we get proper scoring hand function
-        all_scored_hands = []
-        for player in self.get_active_players(): # this is the actual function, still needs to be implemented
-            dprint("checking win condition for {}".format(player))
-            player_hand_score = score_hand(player['hand'] + self.river)
-            all_scored_hands.append(player_hand_score)
-            player['player'].set_final_hand(player_hand_score[0])
-
-        best_hand = max(all_scored_hands)
-        winners = [1 if hand == best_hand else 0 for hand in all_scored_hands]
-        number_of_winners = sum(winners)
-        reward = self.get_current_pot()
-        reward_per_player = reward / float(number_of_winners)
-
-        for player in self.get_active_players():
-            players_scored_hand = score_hand(player['hand'] + self.river)
-            if players_scored_hand == best_hand:
-                player['player'].get_pot(reward_per_player)
-
-        for player in self.players: 
-            player['player'].update_balance_history()
-
-        for player in self.players:
-            player_to_test = player['player']
+            2. scores their hands once with showdown
+            3. divides the pot between the best hands
+        """
+        active_seats = self.get_active_seats()
+        if tracing:
+            for seat in active_seats:
+                trace(TraceShowdown, self.id, self.seats[seat].name)
+
+        # the streets nobody saw since everyone folded still count for scoring
+        self.board.add_cards(self.river[self.board.card_count:])
+
+        # every hand is scored once against the shared board, the pot gets split between the best hands
+        result = showdown([self.hands[seat] for seat in active_seats], board=self.board)
+        reward = self.state.pot
+
+        for seat, strength, share in zip(active_seats, result.strengths, result.shares):
+            self.seats[seat].set_final_hand(hand_category(strength))
+            if share > 0:
+                self.seats[seat].get_pot(reward * share)
+
+        for seat in self.order: 
+            self.seats[seat].update_balance_history()
+
+        for seat in self.order:
+            player_to_test = self.seats[seat]
             if method_exists(player_to_test,'post_game_hook'):
                 player_to_test.post_game_hook()
 
@@ -1144,22 +3119,28 @@ class Game(object):
         """
             This runs each phase of the game
         """
-        dprint("")
-        dprint("start game")
+        if tracing:
+            trace(TraceGameStart, self.id)
 
         if self.players_left_at_start < 2:
-            dprint("skipping game since no players left to play: {}".format(self.id))
+            if tracing:
+                trace(TraceGameSkipped, self.id)
             return None
 
         self.pre_flop()
         self.post_flop() # re-working post_flop
         self.score_game() # re-working score game
-        dprint("end game")
-        dprint("")
+        if tracing:
+            trace(TraceGameEnd, self.id)
         return None
 
     def __str__(self):
-        return "Game with {} players".format(self.players)
+        return "Game with {} players".format(self.seats)
+
+def takes_seed(player_type):
+    """ if the __init__ of a player type has a seed argument (or **kwargs) """
+    parameters = inspect.signature(player_type.__init__).parameters
+    return 'seed' in parameters or any(parameter.kind == inspect.Parameter.VAR_KEYWORD for parameter in parameters.values())
 
 class Table():
     """ 
@@ -1167,7 +3148,7 @@ class Table():
         and than streams a set of cards, which it uses per game.  This needs to be 
         flehsed out a bit.
     """
-    def __init__(self,table_id,scenario_name,player_types,beginning_balance,minimum_play_balance,hands):
+    def __init__(self,table_id,scenario_name,player_types,beginning_balance,minimum_play_balance,hands,seed=None,deals=None,record='full'):
         self.scenario_name = scenario_name # what scanario it is being played under, see simulation variable
         self.player_types = player_types # player types for this game, list of class names, which are instantiatd later
         self.player_types_names = '|'.join(sorted([player_type.__name__ for player_type in self.player_types])) # names of the subclasses representing player strategy
@@ -1178,6 +3159,9 @@ class Table():
         self.games_played = [] # record of all games played, game id
         self.id = str(int(table_id)) # unique table id for this specific table
         self.start_game_serial = int(table_id) * 1000000
+        self.seed = seed if seed is not None else new_seed() # SeedSequence of the table, see DealStream
+        self.deals = deals # (hands, 2 * players + 5) cards to play, dealt from the seed if None, see DealSource
+        self.record = record # what run_analysis writes, see RecordLevels
 
     def add_games_played(self,game_id):
         """
@@ -1199,7 +3183,13 @@ class Table():
         for i, player_type in enumerate(self.player_types): # player types represent GenericPlayer subtype, which gets instantiated here.
             balance = self.balance 
             name = "players_" + str(i + 1)
-            new_player = player_type(name,balance) # creates a player instance, player_type is the name of a class.  Note using Class as a 1st class citizen.
+            seed = child_seed(self.seed,PlayerStream,i) # the players own random stream
+            if takes_seed(player_type):
+                new_player = player_type(name,balance,seed=seed) # creates a player instance, player_type is the name of a class.  Note using Class as a 1st class citizen.
+            else:
+                new_player = player_type(name,balance) # a strategy with the old __init__(self,name,balance)
+                new_player.set_seed(seed)
+            new_player.set_record_level(self.record)
             players.append(new_player)
 
         self.players = players # all the players now instantiated
@@ -1219,20 +3209,32 @@ class Table():
         """
         
         start_time = time.time()
-        dprint('started poker game')
-        deck = FrenchDeck() # French deck of cards used to play the game, you can think of this as the dealer.
+        if debug == 1 and not tracing:
+            start_tracing() # debug prints the trace events
+        if tracing:
+            trace(TraceTableStart, int(self.id))
+        deals = self.deals
+        if deals is None: # the dealer, all the hands at once: 5 cards + 2 per person
+            deals = deal_cards(self.hands,random_stream(child_seed(self.seed,DealStream)))[:,:len(self.player_types) * 2 + 5]
+        if len(deals) < self.hands:
+            raise Exception("Error: {} deals for {} hands".format(len(deals),self.hands))
 
         self.initialize_players() # create your players
         
-        for _, hand in enumerate(deck.permute(len(self.player_types) * 2 + 5,self.hands)): # start streaming 5 cards + 2 per person.  Permute means it reshuffles each time.
+        game = None
+        for hand in iterate_deals(deals[:self.hands]):
             self.start_game_serial += 1
-            game = Game(self.start_game_serial,hand,self.players,self.min_balance) # Start a new game instance with settings, this represents the actual poker game
+            if game is None:
+                game = Game(self.start_game_serial,hand,self.players,self.min_balance) # Start a new game instance with settings, this represents the actual poker game
+            else:
+                game.reset(self.start_game_serial,hand,self.players) # same game object, new hand
             self.add_games_played(game.id) # remember to record that this game happened at this table for later analysis
             game.run_game() # start the actual simulation
             self.progress_player_turn_order() # move the turn order for players
 
         elapsed_time = time.time() - start_time
-        dprint("ending poker game: {} games in {} seconds".format(self.hands,round(elapsed_time,2)))
+        if tracing:
+            trace(TraceTableEnd, int(self.id), None, self.hands, elapsed_time)
         
         return 0
 
@@ -1246,7 +3248,11 @@ class Table():
 
             All the data is pulled from either the table class or the Player class purposely to prevent too much muddling and tight coupling.
             Table class more so since this is a method of the class.  Player is the primary reporting class.
+
+            With record level summary poker_hands only gets its header, with none nothing is written.
         """
+        if self.record == 'none':
+            return 0
 
         script_dir = os.path.dirname(__file__)
         data_dir = os.path.join(script_dir,'data')
@@ -1265,7 +3271,7 @@ class Table():
             writer = csv.writer(csvfile)
             writer.writerow(fieldnames)
             for i,player in enumerate(self.players):
-                for history in player.balance_history:
+                for history in player.balance_history.rows():
                     data_tuple = [str(self.id)] + [history[0]] + [player.name] + [player.__class__.__name__] + history[1:]
                     writer.writerows([data_tuple])
 
@@ -1281,8 +3287,10 @@ class Table():
             writer = csv.writer(csvfile)
             writer.writerow(fieldnames) 
             for player in self.players:
-                for history in player.hand_history:
-                    data_tuple = [str(self.id)] + history
+                if player.hand_history is None:
+                    continue
+                for history in player.hand_history.rows():
+                    data_tuple = [str(self.id)] + [history[0]] + [player.name] + [player.__class__.__name__] + history[1:]
                     writer.writerows([data_tuple])
 
         file_name = 'poker_table_info_' + self.id + '.csv'
@@ -1297,6 +3305,259 @@ class Table():
             writer.writerows([data_tuple])
         return 0
 
+##########################################################################################
+#                          Lock-step engine
+##########################################################################################
+
+# A strategy that doesn't remember anything between bets can decide for many tables at once.
+# It does that with a classmethod:
+#
+#   bet_strategy_batch(hands, river, opponents, call_bid, current_bid, pot, raise_allowed, rng)
+#
+# every argument an array with a row per table (hands (N, 2), river (N, 0/3/4/5)) except
+# raise_allowed and rng.  It returns an int array: BatchFold to fold, 0 to call/check and
+# more than 0 to raise by that much.  When every player type of a simulation has one,
+# 'engine': 'lockstep' plays all its tables with LockstepTables instead of Table.
+BatchFold = -1
+
+def supports_lockstep(player_types):
+    return all(hasattr(player_type, 'bet_strategy_batch') for player_type in player_types)
+
+class LockstepTables(object):
+    """
+        plays many tables hand by hand in lock step: every bet is made for all tables at 
+        once and the whole state is (tables, players) arrays.  Player p is players_{p+1} of
+        its table, the betting works exactly like Game (same blinds, order, limits, all in
+        and last man standing rules), so on the same deals AlwaysCall/AlwaysRaise tables end
+        with the same balances as with Table.  Showdowns go through score_hands_batch.
+
+            engine = LockstepTables(table_ids, scenario_name, player_types, balance, minimum, hands, deals)
+            engine.run_simulation()
+            engine.run_analysis()       -> same poker_balances/table_info files as Table, bets aren't recorded (record level summary or none)
+
+        player_types has a list of player types per table (they can differ, duplicate mode
+        rotates them) and deals is a (tables, hands, 2 * players + 5) array, see DealSource.
+    """
+    def __init__(self,table_ids,scenario_name,player_types,beginning_balance,minimum_play_balance,hands,deals,rng=None,record='summary'):
+        self.ids = [str(int(table_id)) for table_id in table_ids]
+        self.scenario_name = scenario_name
+        self.player_types = player_types
+        self.tables = len(table_ids)
+        self.players = len(player_types[0])
+        self.hands = hands
+        self.deals = np.asarray(deals, dtype=np.int64)
+        self.beginning_balance = beginning_balance
+        self.min_balance = minimum_play_balance
+        self.big_blind = 10
+        self.small_blind = 5
+        self.rng = rng if rng is not None else sampling_rng()
+        self.record = record # see RecordLevels, bets are never recorded here
+        if record not in ('none', 'summary'):
+            raise Exception("Error: the lock-step engine doesn't record bets, record level should be 'none' or 'summary'")
+
+        if self.deals.shape[:2] != (self.tables, hands) or self.deals.shape[2] < 2 * self.players + 5:
+            raise Exception("Error: lock-step deals need the shape ({}, {}, {}), got {}".format(self.tables, hands, 2 * self.players + 5, self.deals.shape))
+        self.classes = []
+        self.class_ids = np.zeros((self.tables, self.players), dtype=np.int64)
+        for table, types in enumerate(player_types):
+            for player, player_type in enumerate(types):
+                if player_type not in self.classes:
+                    self.classes.append(player_type)
+                self.class_ids[table, player] = self.classes.index(player_type)
+
+        self.balance = np.full((self.tables, self.players), float(beginning_balance))
+        self.history = [] # one dict of arrays per hand, see play_hand
+
+    def _reset_hand(self,hand_number):
+        tables, players = self.tables, self.players
+        self.position_player = np.array([(position - hand_number) % players for position in range(players)]) # Table rotates one seat per hand
+        joined = self.balance > self.min_balance
+        self.joined = joined
+        joined_positions = joined[:, self.position_player]
+        self.playing = joined_positions.sum(axis=1) >= 2
+
+        # blinds are the last 2 players that joined, in seat order
+        positions = np.arange(players)
+        last = np.where(joined_positions, positions, -1)
+        big_position = last.max(axis=1)
+        second = np.where(joined_positions & (positions < big_position[:, None]), positions, -1)
+        self.small_position = np.maximum(second.max(axis=1), 0)
+
+        # hole cards go out in seat order to the players that joined
+        cards = self.deals[:, hand_number]
+        seat_number = np.cumsum(joined_positions, axis=1) - 1
+        self.holes = np.zeros((tables, players, 2), dtype=np.int64)
+        rows = np.arange(tables)
+        for position, player in enumerate(self.position_player):
+            seat = np.maximum(seat_number[:, position], 0)
+            self.holes[:, player, 0] = cards[rows, 5 + 2 * seat]
+            self.holes[:, player, 1] = cards[rows, 6 + 2 * seat]
+        self.board = cards[:, :5]
+
+        self.registered = self.balance.copy()
+        self.bets = np.zeros((tables, players))
+        self.active = joined & self.playing[:, None]
+        self.active_count = self.active.sum(axis=1)
+        self.folded = np.zeros((tables, players), dtype=bool)
+        self.last_survivor = np.zeros((tables, players), dtype=bool)
+        self.blind = np.zeros((tables, players), dtype=np.int8)
+
+        big_player = self.position_player[np.maximum(big_position, 0)]
+        small_player = self.position_player[self.small_position]
+        for player, blind, amount in ((big_player, 2, self.big_blind), (small_player, 1, self.small_blind)):
+            live = rows[self.playing]
+            self.bets[live, player[live]] = amount
+            self.balance[live, player[live]] -= amount
+            self.blind[live, player[live]] = blind
+        self.pot = self.bets.sum(axis=1)
+        self.required_bid = self.bets.max(axis=1)
+        return None
+
+    def _all_bets_equal(self):
+        high = np.where(self.joined, self.bets, -np.inf).max(axis=1)
+        low = np.where(self.joined, self.bets, np.inf).min(axis=1)
+        return high == low
+
+    def _bet(self,live,actor,river,raise_allowed):
+        """ the players in actor (one per table) bet at the tables in live, like Game does with make_bet """
+        rows = np.nonzero(live & self.active[np.arange(self.tables), actor])[0]
+        if len(rows) == 0:
+            return None
+        players = actor[rows]
+        opponents = self.active_count[rows] - 1
+        current_bid = self.bets[rows, players]
+        call_bid = self.required_bid[rows] - current_bid
+        balance = self.balance[rows, players]
+
+        decision = np.zeros(len(rows), dtype=np.int64)
+        last_man = opponents == 0 # the last one standing just calls
+        self.last_survivor[rows[last_man], players[last_man]] = True
+        class_ids = self.class_ids[rows, players]
+        for class_id in np.unique(class_ids[~last_man]):
+            chosen = ~last_man & (class_ids == class_id)
+            decision[chosen] = self.classes[class_id].bet_strategy_batch(self.holes[rows[chosen], players[chosen]], river[rows[chosen]], opponents[chosen], call_bid[chosen], current_bid[chosen], self.pot[rows[chosen]], raise_allowed, self.rng)
+
+        raising = (decision > 0) & raise_allowed
+        amount = np.minimum(np.where(raising, call_bid + decision, call_bid), balance) # short stacks go all in
+        fold = (decision < 0) | (raising & (amount == 0)) # a raise with nothing left is a fold, like GenericPlayer._raise_bet
+
+        bet = ~fold
+        bet_rows, bet_players = rows[bet], players[bet]
+        self.balance[bet_rows, bet_players] -= amount[bet]
+        self.bets[bet_rows, bet_players] = current_bid[bet] + amount[bet]
+        self.pot[bet_rows] += amount[bet]
+        self.required_bid[bet_rows] = np.maximum(self.required_bid[bet_rows], current_bid[bet] + amount[bet])
+
+        fold_rows, fold_players = rows[fold], players[fold]
+        self.active[fold_rows, fold_players] = False
+        self.folded[rows[decision < 0], players[decision < 0]] = True # the all in raise with nothing left doesn't count as a fold in the history
+        self.active_count[fold_rows] -= 1
+        return None
+
+    def play_hand(self,hand_number):
+        self._reset_hand(hand_number)
+        tables, players = self.tables, self.players
+        no_river = np.zeros((tables, 0), dtype=np.int64)
+
+        # pre-flop: up to 3 rounds in seat order, no raises in the last one
+        live = self.playing.copy()
+        for turn in range(1,4):
+            for player in self.position_player:
+                self._bet(live, np.full(tables, player), no_river, turn != 3)
+            live &= ~((self.active_count == 1) | self._all_bets_equal())
+
+        # post-flop: starts at the small blind, 3 streets of up to 3 rounds
+        street_live = self.playing.copy()
+        for river_cards in (3, 4, 5):
+            river = self.board[:, :river_cards]
+            live = street_live.copy()
+            for bidding_round in range(1,4):
+                for step in range(players):
+                    actor = self.position_player[(self.small_position + step) % players]
+                    self._bet(live, actor, river, bidding_round != 3)
+                live &= ~((self.active_count == 1) | self._all_bets_equal())
+            street_live &= ~(self.active_count == 1)
+
+        # showdown of everyone still in, the pot is split between the best hands
+        hand_category(1) # loads the category table
+        categories = np.asarray(_hand_categories)
+        strengths = score_hands_batch(np.concatenate([np.repeat(self.board[:, None, :], players, axis=1), self.holes], axis=2).reshape(-1, 7)).reshape(tables, players)
+        strengths = np.where(self.active, strengths, -1)
+        winners = self.active & (strengths == strengths.max(axis=1, keepdims=True))
+        winner_count = np.maximum(winners.sum(axis=1), 1)
+        self.balance += np.where(winners, (self.pot * (1.0 / winner_count))[:, None], 0.0)
+
+        if self.record == 'none':
+            return None
+        status = np.where(self.folded, 3, np.where(self.last_survivor, 2, np.where(winners, 1, 0))) # see GameReasons
+        self.history.append({
+            'played': self.joined & self.playing[:, None], # who gets a balance row
+            'won': winners,
+            'status': status.astype(np.int8),
+            'blind': self.blind,
+            'final_hand': np.where(self.active, categories[np.maximum(strengths, 0)], 0).astype(np.int8),
+            'registered': self.registered,
+            'balance': self.balance.copy(),
+        })
+        return None
+
+    def run_simulation(self):
+        start_time = time.time()
+        for hand_number in range(self.hands):
+            self.play_hand(hand_number)
+        elapsed_time = time.time() - start_time
+        if tracing:
+            trace(TraceTableEnd, int(self.ids[0]), None, self.hands, elapsed_time) # the first of its tables
+        return 0
+
+    def net_changes(self):
+        """ (tables, players) array of what every player won or lost """
+        return self.balance - self.beginning_balance
+
+    def run_analysis(self):
+        """ poker_balances and poker_table_info files like Table.run_analysis, poker_hands only gets its header """
+        if self.record == 'none':
+            return 0
+        script_dir = os.path.dirname(__file__)
+        data_dir = os.path.join(script_dir,'data')
+        if not os.path.exists(data_dir):
+            os.makedirs(data_dir)
+
+        final_order = [(position - self.hands) % self.players for position in range(self.players)] # Table.players after the last rotation
+        for table, table_id in enumerate(self.ids):
+            with open(os.path.join(data_dir,'poker_balances_' + table_id + '.csv'),'w', newline='') as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerow(['table_id','game_id','player_name','player_type','game_result', 
+                                    'game_reason', 'blind_type', 'final_hand', 'beginning_balance',
+                                    'game_start_balance','game_end_balance','game_net_change'])
+                for player in final_order:
+                    name = "players_" + str(player + 1)
+                    player_type = self.player_types[table][player].__name__
+                    for hand_number, record in enumerate(self.history):
+                        if not record['played'][table, player]:
+                            continue
+                        registered = float(record['registered'][table, player])
+                        balance = float(record['balance'][table, player])
+                        writer.writerow([table_id, str(int(table_id) * 1000000 + hand_number + 1), name, player_type,
+                                         GameResults[int(record['won'][table, player])],
+                                         GameReasons[record['status'][table, player]],
+                                         BlindTypes[record['blind'][table, player]],
+                                         PokerInverseHierachy.get(int(record['final_hand'][table, player]), 'None'),
+                                         csv_number(self.beginning_balance), csv_number(registered), csv_number(balance), csv_number(balance - registered)])
+
+            with open(os.path.join(data_dir,'poker_hands_' + table_id + '.csv'),'w', newline='') as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerow(["table_id","game_id","player_name","player_type","bet_number",
+                                "opponents","call","current","final","pot","allowed",
+                                "hand1","hand2","community1","community2","community3",
+                                "community4","community5"])
+
+            with open(os.path.join(data_dir,'poker_table_info_' + table_id + '.csv'),'w', newline='') as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerow(["table_id","scenario_name","player_types"])
+                writer.writerow([table_id, self.scenario_name, '|'.join(sorted([player_type.__name__ for player_type in self.player_types[table]]))])
+        return 0
+
 # Write your own classes here to implement a new player strategy
 # first you inherit from GenericPlayer, which implements under the cover the mechanisms for joining a game
 # use self.call_bet() to make a call or check
@@ -1304,13 +3565,14 @@ class Table():
 # use self.fold to fold.
 # automatically does the accounting under the cover.
 # feel free to use these variables in making decisions...explained below:
-# hand -> 2-card hand the player holds, see Card named-tuple
-# river -> 3-4-5 card hand the player holds, see Card named-tuple for details
+# hand -> 2-card hand the player holds, see Card (an int card code with .rank and .suit)
+# river -> 3-4-5 card hand the player holds, see Card for details
 # opponents -> how many opponents are left
 # call_bid -> current amount required to make a call
 # current_bid -> current amount already put into pot
 # pot -> current pot, basically how much you can earn if you win
 # raise_allowed -> influences raise behavior, last round of betting raises aren't allowed so rasies become calls
+# self.game_events -> cursor into what the other players did this game, new_player_events() gives the actions since your last call, see GameEventLog
 
 # The below are some sample classes:
 # AlwaysCallPlayer:
@@ -1326,28 +3588,46 @@ class AlwaysCallPlayer(GenericPlayer):
         self.call_bet()
         return None
 
+    @classmethod
+    def bet_strategy_batch(cls,hands,river,opponents,call_bid,current_bid,pot,raise_allowed,rng):
+        return np.zeros(len(hands), dtype=np.int64)
+
 # Player that always raises
 class AlwaysRaisePlayer(GenericPlayer):
     def bet_strategy(self,hand,river,opponents,call_bid,current_bid,pot,raise_allowed=False):
         self.raise_bet(20)
         return None
 
+    @classmethod
+    def bet_strategy_batch(cls,hands,river,opponents,call_bid,current_bid,pot,raise_allowed,rng):
+        return np.full(len(hands), 20, dtype=np.int64)
+
 # Player that always calls
 class CalculatedPlayer(GenericPlayer):
     def bet_strategy(self,hand,river,opponents,call_bid,current_bid,pot,raise_allowed=False):
-        win_probabilty = simulate_win_odds(cards=hand,river=river,opponents=opponents,runtimes=100)
         equal_chance_probability = 1 / float(opponents + 1)
+        # only the side of the threshold matters, so obvious hands stop after the first batch
+        win_probabilty = estimate_equity(cards=hand,river=river,opponents=opponents,max_samples=400,batch_size=50,threshold=equal_chance_probability,rng=self.rng).equity
         if win_probabilty >= equal_chance_probability:
             self.call_bet()
         else:
             self.fold_bet()
         return None
 
+    @classmethod
+    def bet_strategy_batch(cls,hands,river,opponents,call_bid,current_bid,pot,raise_allowed,rng):
+        """ same decision from the precomputed tables, states the tables don't have are estimated one by one """
+        equity = table_equity_batch(hands,river,opponents)
+        for row in np.nonzero(np.isnan(equity))[0]:
+            threshold = 1 / float(opponents[row] + 1)
+            equity[row] = estimate_equity(cards=hands[row].tolist(),river=river[row].tolist(),opponents=int(opponents[row]),max_samples=400,batch_size=50,threshold=threshold,rng=rng).equity
+        return np.where(equity >= 1 / (opponents + 1.0), 0, BatchFold)
+
 # Player that always calls
 class GambleByProbabilityPlayer(GenericPlayer):
     def bet_strategy(self,hand,river,opponents,call_bid,current_bid,pot,raise_allowed=False):
-        win_probabilty = simulate_win_odds(cards=hand,river=river,opponents=opponents,runtimes=100)
         equal_chance_probability = 1 / float(opponents + 1)
+        win_probabilty = estimate_equity(cards=hand,river=river,opponents=opponents,max_samples=400,batch_size=50,threshold=equal_chance_probability,rng=self.rng).equity
         if win_probabilty >= equal_chance_probability:
             self.raise_bet(round(100 * win_probabilty,0))
         else:
@@ -1365,7 +3645,7 @@ class ConservativePlayer(GenericPlayer):
         30% of its balance if chance is between 90% and 95%, raise by 50% if chance is between 
         95% and 99% and goes all in if chance is 100%
         """
-        win_probability = simulate_win_odds(cards=hand,river=river,opponents=2,runtimes=100)
+        win_probability = simulate_win_odds(cards=hand,river=river,opponents=2,runtimes=100,rng=self.rng)
         if win_probability>0.5 and win_probability<=0.7:
             self.call_bet()
         elif  win_probability>0.7 and win_probability<=0.9:
@@ -1398,7 +3678,7 @@ class SmartPlayer(GenericPlayer):
             return <number> -> your total bet for this turn.  Most be equal or greater than current_bid + call_bid.
             return None -> you folded this hand and lose all your money.
         """
-        win_probabilty = simulate_win_odds(cards=hand,river=river,opponents=opponents,runtimes=100)
+        win_probabilty = simulate_win_odds(cards=hand,river=river,opponents=opponents,runtimes=100,rng=self.rng)
         expected_profit = round(win_probabilty * pot - (1 - win_probabilty) * current_bid,2)
         equal_chance_probability = 1 / float(opponents + 1)
         high_probability_of_win = 1.4 * equal_chance_probability
@@ -1432,7 +3712,7 @@ class simpleLearnerPlayer(GenericPlayer):
         self.dictionary_key=[hand_rank[0]+hand_rank[1]+same_suit,hand_rank[1]+hand_rank[0]+same_suit,'action']#saving the previous hand dictionary and action
        
         #using same probability to play for first hand
-        chance=random.random()
+        chance=self.rng.random()
         if self.hand_dictionary[self.dictionary_key[0]]['sum_absolute_bet']==0:
             
             if chance<0.33:
@@ -1537,12 +3817,12 @@ class simpleLearnerPlayer(GenericPlayer):
         return None
 
 class AwareLearnerPlayer(GenericPlayer):
-    def __init__(self,name,balance):
-        super().__init__(name,balance)
+    def __init__(self,name,balance,seed=None):
+        super().__init__(name,balance,seed)
         self.previous_game={}
         self.initial_balance=balance
         self.number_of_game=1
-        self.previous_list=[]
+        self.seen_actions=set() # player actions of this game already looked at by max_opponent_probability
     
     def AwareLearnerCall(self,hand):
         """
@@ -1599,26 +3879,20 @@ class AwareLearnerPlayer(GenericPlayer):
                
     def temp_balance_dictionary(self,active_players,temp_dictionary):
         #print('active players in temb balance dictionary',self.active_game.players)
-        for player in self.active_game.players:
-            #print('player is',player['player'])
-            #print('active is',player['active'])
-
-            
-            if player['active']==1:
+        game = self.active_game
+        for seat in game.order:
+            player = game.seats[seat]
+            if game.state.active[seat]==1:
                 active_players+=1
                 
-                if player['player'].name!=self.name:
-                    temp_dictionary.update({player['player'].name:player['player'].balance_history[-1][-1]})
+                if player.name!=self.name:
+                    temp_dictionary.update({player.name:player.balance_history[-1][-1]})
         return temp_dictionary,active_players
         
     def opponent_winning_probability(self,active_players,temp_dictionary):
         
-        player_action_list=self.active_game.player_actions.copy()
-        #removing all the items with card information from the list.
-        for action_list in player_action_list:
-            if len(action_list)!=4:
-                player_action_list.remove(action_list)
-        for _,player,action,_ in player_action_list[-2*active_players:-active_players]:#self.active_game.player_actions[-2*active_players:-active_players]:
+        player_action_list=self.active_game.events.player_events # the log keeps the player actions without the cards already
+        for _,player,action,_ in player_action_list[-2*active_players:-active_players]:
             
             if player!=self.name:#dont want to check our own action
                 
@@ -1632,21 +3906,16 @@ class AwareLearnerPlayer(GenericPlayer):
     
     def max_opponent_probability(self,action_list):
         """
-        This function looks at all the players action and their historical results, then return the current action
-        and highest probability of winning against other player
+        This function looks at the players actions since the last decision (action_list) and their historical results, then return the current action
+        and highest probability of winning against other player.  Actions already seen earlier in the game don't count again.
         """
         max_probability=0
-        #print('action_list is',action_list, 'previous list is',self.previous_list)
-        #print('------curent actions are ',list(set(action_list)-set(self.previous_list)))
-        for action_tuple in list(set(action_list)-set(self.previous_list)):
-            if len(action_tuple)==4:#filtering out the cards
-                
-                #print('action tuple is ',action_tuple)
-                _,player,action,_ = action_tuple
-                if (player!=self.name)&(action!='fold'):
-                    if self.previous_game[player][action]['probability']>max_probability:
-                        max_probability=self.previous_game[player][action]['probability']
-        self.previous_list=action_list.copy() #updating previous list for next betting round
+        for action_tuple in set(action_list)-self.seen_actions:
+            _,player,action,_ = action_tuple
+            if (player!=self.name)&(action!='fold'):
+                if self.previous_game[player][action]['probability']>max_probability:
+                    max_probability=self.previous_game[player][action]['probability']
+        self.seen_actions.update(action_list) #updating seen actions for next betting round
         return max_probability
         
         
@@ -1693,7 +3962,7 @@ class AwareLearnerPlayer(GenericPlayer):
             self.call_bet()#playing the first game as we dont have hany knowledge about previous games
         else:
             
-            action_list=[action_tuple for action_tuple in self.active_game.get_player_actions() if len(action_tuple)==4]#removing card info from the list
+            action_list=self.game_events.new_player_events() # only what happened since our last bet
             max_probability=self.max_opponent_probability(action_list)
             self.action_based_on_opponent(max_probability,hand)
         
@@ -1707,7 +3976,7 @@ class AwareLearnerPlayer(GenericPlayer):
 
         if self.number_of_game==1:
             #creating a dictionary to record winnig hand of other players for their action.
-            self.previous_game={player['player'].name:{'bet':{'cum_sum':0,'abs_sum':0,'probability':0},'call':{'cum_sum':0,'abs_sum':0,'probability':0}}  for player in self.active_game.players if player['player'].name!=self.name}
+            self.previous_game={player.name:{'bet':{'cum_sum':0,'abs_sum':0,'probability':0},'call':{'cum_sum':0,'abs_sum':0,'probability':0}}  for player in self.active_game.seats if player.name!=self.name}
         else:
             self.update_SimpleLearnerReward()
             
@@ -1722,7 +3991,7 @@ class AwareLearnerPlayer(GenericPlayer):
         self.opponent_winning_probability(active_players,temp_dictionary)
                                                                       
         
-        self.previous_list=[]
+        self.seen_actions=set()
         
 
 ##########################################################################################
@@ -1733,7 +4002,7 @@ def order_by_rank(cards):
     """ 
     order a set of Card objects by rank....
     """
-    return tuple(sorted(list(cards),key=lambda card: (RankMap[card.rank], card.suit)))
+    return tuple(sorted(cards)) # card codes sort by rank first, than suit
 
 def UCB(wins,games,parent_total,constant):
     """
@@ -1745,7 +4014,7 @@ def UCB(wins,games,parent_total,constant):
         return 0
     return wins / games + constant * math.sqrt(math.log(parent_total)/games)
 
-def monte_carlo_simulation(cards,river,opponents,runtimes=1):
+def monte_carlo_simulation(cards,river,opponents,runtimes=1,sampling='plain',rng=None):
     """
         A player can use this to simulate the odds of them winning a hand of poker.
         You give it your current hand (cards variable), the current river, which is
@@ -1754,45 +4023,11 @@ def monte_carlo_simulation(cards,river,opponents,runtimes=1):
         runtime number of times and report the wins and totals.  YOu can 
         think of it as a monte-carlo simulation.
     """
-    deck = FrenchDeck()
-
-    # enabling cache means if same hand + river show up, use the latest odds and skip calc
-    # bad thing about this is if you get a 1% percentile win-rate on a flop etc, than 
-    # that becomes baked into simulation.  So disable cache == better results, enable
-    # cache means quicker results.
-
-    if river is None:
-        river = []  # this is a pre-flob situation
-
-    for card in cards + river:
-        deck.remove_card(rank=card.rank,suit=card.suit) # remove the players hand and river from the deck
+    table_odds = table_equity(cards,river,opponents) # no sampling needed if the odds are precomputed
+    if table_odds is not None:
+        return (table_odds * runtimes, runtimes)
 
-    deck.save_deck() # the deck with removed cards is our start point for simulating everything.  So save it and reload after each runtime.
-
-    start_hand = cards # your hand
-    draw_player = len(cards) # all peoples hands
-    draw_river = 5 - len(river) # current number of cards left to draw in the river
-
-    wins = 0
-    for _ in range(runtimes):
-        hands_to_compare = []
-        if len(river) < 5:
-            new_river = deck.draw(draw_river) # draw the river
-        else:
-            new_river = [] # you already drew the river (all 5 cards)
-        current_river = river[:] + new_river # river with simulated cards
-        player_hand = start_hand[:] + current_river[:]  # your hand including simulated river
-        hands_to_compare.append(player_hand) # your hand is always first
-        for _ in range(opponents):
-            opponent_hand = deck.draw(draw_player) + current_river[:] # create opponents hands
-            hands_to_compare.append(opponent_hand) # add after your hand
-        is_win = winning_hand(hands_to_compare) # rank the hands, check if first one won
-
-        if is_win:
-            wins += 1 # keep tabs of your wins
-
-        deck.load_deck() # reset the deck for the next simulation
-        deck.reshuffle_draw_deck()
+    wins = sampled_equity(cards,river,opponents,runtimes,sampling,rng) * runtimes # keep tabs of your wins, split pots count as part of a win
 
     return (wins, runtimes) # wins and number of games
 
@@ -1801,7 +4036,8 @@ class MCST_Set(object):
     MCST - monte carlo tree search algorithm and it's associated tree.  get_root gets the actual tree.
     """
 
-    def __init__(self):
+    def __init__(self,seed=None):
+        self.seed = seed if seed is not None else new_seed()
         self.game_types = {}
 
     def all_games(self):
@@ -1809,7 +4045,8 @@ class MCST_Set(object):
 
     def add_game(self,turn_order):
         if turn_order not in self.game_types:
-            self.game_types[turn_order] = MCST(turn_order)
+            engine_seed = child_seed(self.seed,len(self.game_types)) # engines are numbered in the order they show up
+            self.game_types[turn_order] = MCST(turn_order,rng=random_stream(engine_seed))
         return None 
 
     def has_game(self,turn_order):
@@ -1918,7 +4155,8 @@ class PlayerNode(object):
         return listing
 
 class MCST(object):
-    def __init__(self,turn_order,card_branching=5,monte_carlo_sims=5):
+    def __init__(self,turn_order,card_branching=5,monte_carlo_sims=5,sampling='plain',rng=None):
+        self.rng = rng if rng is not None else sampling_rng()
         self.turn_order = turn_order
         self.small_blind = turn_order[-2]
         self.big_blind = turn_order[-1]
@@ -1927,6 +4165,7 @@ class MCST(object):
         self.done = {}
         self.card_branching = card_branching
         self.monte_carlo_sims = monte_carlo_sims
+        self.sampling = sampling # see SamplingModes, the leaves only get monte_carlo_sims samples
         self.hands_simulated = set()
         self.card_context = None
         self.node_count = 1
@@ -1948,10 +4187,10 @@ class MCST(object):
             return False
 
     def draw_river(self,removed_cards,draw_cards):
-        deck = FrenchDeck()
+        deck = ArrayDeck(rng=self.rng)
 
         for card in removed_cards:
-            deck.remove_card(rank=card.rank,suit=card.suit)
+            deck.remove_card(card)
 
         new_cards = deck.draw(draw_cards)
         new_cards = order_by_rank(new_cards)
@@ -2009,7 +4248,7 @@ class MCST(object):
                 return self.select_node(root,node.parent)
 
         if len(unfullfilled_actions):
-            action_to_update = random.choice(unfullfilled_actions)
+            action_to_update = unfullfilled_actions[int(self.rng.integers(len(unfullfilled_actions)))]
 
             self.updates += 1
 
@@ -2150,7 +4389,7 @@ class MCST(object):
             if node.card_phase == 0:
                 river = []
                 hand, river = list(hand),list(river)
-                wins, total = monte_carlo_simulation(cards=hand,river=river,opponents=active_opponents,runtimes=self.monte_carlo_sims)
+                wins, total = monte_carlo_simulation(cards=hand,river=river,opponents=active_opponents,runtimes=self.monte_carlo_sims,sampling=self.sampling,rng=self.rng)
 
                 propogation_key = tuple(hand)
                 node.back_propogation_list[propogation_key] = {"wins":wins,"total":total}
@@ -2169,9 +4408,9 @@ class MCST(object):
 
                 hand, river = list(hand),list(river)
 
-                deck = FrenchDeck()
+                deck = ArrayDeck(rng=self.rng)
                 for card in hand + river:
-                    deck.remove_card(rank=card.rank,suit=card.suit) # remove the players hand and river from the deck
+                    deck.remove_card(card) # remove the players hand and river from the deck
                 deck.save_deck()
 
                 cards_to_draw = total_river_cards - current_river_cards
@@ -2184,7 +4423,7 @@ class MCST(object):
                         new_river = river
                     else:
                         new_river = list(river) + list(deck.draw(cards_to_draw))
-                    wins, total = monte_carlo_simulation(cards=hand,river=new_river,opponents=active_opponents,runtimes=self.monte_carlo_sims)
+                    wins, total = monte_carlo_simulation(cards=hand,river=new_river,opponents=active_opponents,runtimes=self.monte_carlo_sims,sampling=self.sampling,rng=self.rng)
 
                     cards_to_propogate = list(hand) + list(new_river)
 
@@ -2196,7 +4435,6 @@ class MCST(object):
                     node.back_propogation_list[propagation_key] = {"wins":wins,"total":total}
 
                     deck.load_deck()
-                    deck.reshuffle_draw_deck()
         else:
             propagation_key = self.card_context
             node.back_propogation_list[propagation_key] = {"wins":0,"total":0}
@@ -2429,12 +4667,20 @@ class MCST(object):
 
 class MonteCarloTreeSearchPlayer(GenericPlayer):
 
-    def __init__(self,name,balance):
-        super().__init__(name,balance)
+    def __init__(self,name,balance,seed=None):
+        super().__init__(name,balance,seed)
 
-        self.decision_tree = MCST_Set()
+        self.decision_tree = MCST_Set(seed=self.seed)
         self.moving_average = []
         self.last_odds = [0,0,0]
+        self.converted_game = None # the EventCursor the lists below were converted with, a new one means a new game
+        self.converted_actions = []
+        self.past_actions = []
+
+    def set_seed(self,seed):
+        super().set_seed(seed)
+        self.decision_tree = MCST_Set(seed=self.seed) # the engines get their seeds from the players
+        return None
 
     def get_opponents_map(self):
 
@@ -2455,28 +4701,34 @@ class MonteCarloTreeSearchPlayer(GenericPlayer):
         turn_order_map = [opponent_map[player] for player in self.get_beginning_players()]
         return tuple(turn_order_map)
 
-    def get_converted_player_actions(self):
-        converted_list = []
-        opponent_map = self.get_opponents_map()
-        for action in self.get_all_player_actions():
+    def convert_new_actions(self):
+        """ 
+            adds the events since the last bet to converted_actions and past_actions, so a bet 
+            only converts what is new.  Both lists start over when the game changes.
+        """
+        if self.converted_game is not self.game_events:
+            self.converted_game = self.game_events
+            self.converted_actions = []
+            self.past_actions = []
+            self.opponent_map = self.get_opponents_map()
+        opponent_map = self.opponent_map
+        for action in self.game_events.new_events():
             if action[0] == 'card':
-                action_cards = sorted(action[1][0:3],key=lambda card: (RankMap[card.rank],card.suit)) + action[1][3:]
-                action = ('card',tuple(action_cards))
-                converted_list.append(action)
+                action_cards = sorted(action[1][0:3]) + action[1][3:]
+                self.converted_actions.append(('card',tuple(action_cards)))
             else:
                 player_type, player_name, bet_type, bet_amount = action 
-                converted_list.append((player_type,opponent_map[player_name],bet_type,bet_amount))
-        return converted_list
+                self.converted_actions.append((player_type,opponent_map[player_name],bet_type,bet_amount))
+                self.past_actions.append((opponent_map[player_name],bet_type,bet_amount))
+        return None
 
-    def past_player_actions(self):
-        past_actions = []
-        opponent_map = self.get_opponents_map()
-        for action in self.get_all_player_actions():
-            if action[0] == 'player':
-                _, player_name, bet_type, bet_amount = action 
-                past_actions.append((opponent_map[player_name],bet_type,bet_amount))
+    def get_converted_player_actions(self):
+        self.convert_new_actions()
+        return list(self.converted_actions)
 
-        return past_actions
+    def past_player_actions(self):
+        self.convert_new_actions()
+        return list(self.past_actions)
 
     def bet_strategy(self,hand,river,opponents,call_bid,current_bid,pot,raise_allowed=False):
 
@@ -2625,9 +4877,6 @@ class simpleLearnerPlayer(GenericPlayer):
 
         """
         
-        print('______________________________________________________________________')
-        print('______________________________________________________________________')
-        
         """if len(self.balance_history)==0:
             
             self.number_of_finished_games=0
@@ -2650,9 +4899,8 @@ class simpleLearnerPlayer(GenericPlayer):
         dictionary_key=[hand_rank[0]+hand_rank[1]+same_suit,hand_rank[1]+hand_rank[0]+same_suit]
         #using same probability to play for first hand
         #print('dictionary is ',self.hand_dictionary[dictionary_key[0]]['sum_absolute_bet'])
-        print('river is ',river)
         if self.hand_dictionary[dictionary_key[0]]['sum_absolute_bet']==0:
-            chance=random.random()
+            chance=self.rng.random()
             if chance<0.33:
                 self.fold_bet()
             elif chance>=0.33 and chance<0.66:
@@ -2669,8 +4917,6 @@ class simpleLearnerPlayer(GenericPlayer):
                     self.fold_bet()
         """
         
-        print('current pot is',pot)
-        print(random.random())
         #print([x(card.rank) for x in hand])
         #sys.exit(0)
 
@@ -2703,6 +4949,21 @@ def validate_config(config):
     if bad_integer_error == 1:
         raise Exception("Config_Error: bad type found!")
 
+    if 'seed' in config and not isinstance(config['seed'],int):
+        raise Exception("Config Error: seed should be an integer")
+
+    if config.get('engine', 'table') not in ('table', 'lockstep'):
+        raise Exception("Config Error: engine should be 'table' or 'lockstep'")
+
+    if config.get('record', 'full') not in RecordLevels:
+        raise Exception("Config Error: record should be one of {}".format(RecordLevels))
+
+    if 'trace' in config and not isinstance(config['trace'],bool):
+        raise Exception("Config Error: trace should be True or False")
+
+    if 'duplicate' in config and not isinstance(config['duplicate'],bool):
+        raise Exception("Config Error: duplicate should be True or False")
+
     if config['hands'] < 2:
         raise Exception("Config Error: hands needs to be at minimum 2")
 
@@ -2732,19 +4993,121 @@ def validate_config(config):
     print('finished the validation settings...')
     return None
 
-def run_table_in_parallel(table_id, scenario_name,player_types,beginning_balance,minimum_play_balance,hands):
-    print("running table_id {} for scenario: {} (parallel processing)".format(table_id, scenario_name))
+def init_worker(store_path=None,deal_handle=None,trace_size=0,debug_mode=0):
+    """
+        Pool initializer: warm equity cache (see open_equity_store), the deals of the run from
+        shared memory and a trace buffer of its own if trace_size isn't 0 (see start_tracing)
+    """
+    global deal_source, debug
+    debug = debug_mode
+    if trace_size:
+        start_tracing(trace_size)
+    if store_path is not None:
+        open_equity_store(store_path)
+    if deal_handle is not None:
+        deal_source = DealSource.attach(deal_handle)
+    return None
+
+def play_table(table_id, seed, table_number, rotation, scenario_name, player_types, beginning_balance, minimum_play_balance, hands, deals=None, record='full'):
+    """
+        plays one table and writes its data files.  rotation moves every player type that
+        many seats forward (duplicate mode).  returns (player type index, net change) of every
+        player, the index is into the player_types of the simulation before the rotation.
+    """
+    seats = len(player_types)
+    rotated_types = player_types[rotation:] + player_types[:rotation]
     casino = Table( # generates a new table
                     table_id=table_id,
                     scenario_name=scenario_name, # use this to look up scenario in data analysis
-                    player_types=player_types, # player types defined by subclassed version of GenericPlayer class
+                    player_types=rotated_types, # player types defined by subclassed version of GenericPlayer class
                     beginning_balance=beginning_balance, # beginning balances of player
                     minimum_play_balance=minimum_play_balance, # minimum balance to play
-                    hands=hands # number of hands to be played in this table
+                    hands=hands, # number of hands to be played in this table
+                    seed=seed, # random streams of the table, see DealStream
+                    deals=deals, # cards of every hand
+                    record=record # what gets written, see RecordLevels
                 )
-    casino.run_simulation() # start the actual simulation
+    try:
+        casino.run_simulation() # start the actual simulation
+    except Exception:
+        if tracing:
+            print("table {} failed, trace written to {}".format(table_id, dump_trace(table_id)))
+        raise
     casino.run_analysis() # export the data for jupyter analysis at some later date
-    return None
+
+    net_changes = []
+    for player in casino.players:
+        seat = int(player.name.split('_')[-1]) - 1 # players_1 sat in seat 0 and so on
+        net_changes.append(((seat + rotation) % seats, player.balance - player.beginning_balance))
+    return sorted(net_changes)
+
+def run_table_in_parallel(table_id, seed, table_number, rotation, scenario_name,player_types,beginning_balance,minimum_play_balance,hands,record='full'):
+    print("running table_id {} for scenario: {} (parallel processing)".format(table_id, scenario_name))
+    deals = None
+    if deal_source is not None:
+        deals = deal_source.table_deals(table_number,len(player_types),hands)
+    net_changes = play_table(table_id, seed, table_number, rotation, scenario_name, player_types, beginning_balance, minimum_play_balance, hands, deals, record)
+    flush_equity_store() # pool workers don't get a chance to flush when the pool shuts down
+    return net_changes
+
+def play_lockstep(jobs, scenario_name, player_types, beginning_balance, minimum_play_balance, hands, deals, rng, record='summary'):
+    """ plays all the (table_id, seed, table_number, rotation) jobs of a simulation with one LockstepTables, returns what play_table would """
+    seats = len(player_types)
+    engine = LockstepTables(
+                    table_ids=[job[0] for job in jobs],
+                    scenario_name=scenario_name,
+                    player_types=[player_types[rotation:] + player_types[:rotation] for _, _, _, rotation in jobs],
+                    beginning_balance=beginning_balance,
+                    minimum_play_balance=minimum_play_balance,
+                    hands=hands,
+                    deals=np.stack([deals.table_deals(table_number, seats, hands) for _, _, table_number, _ in jobs]),
+                    rng=rng,
+                    record=record
+                )
+    engine.run_simulation()
+    engine.run_analysis()
+    net_changes = engine.net_changes()
+    return [sorted(((seat + rotation) % seats, float(net_changes[job, seat])) for seat in range(seats)) for job, (_, _, _, rotation) in enumerate(jobs)]
+
+def player_type_labels(player_types):
+    """ class names of the player types, numbered where a class plays more than once """
+    names = [player_type.__name__ for player_type in player_types]
+    return [name if names.count(name) == 1 else "{}_{}".format(name, i + 1) for i, name in enumerate(names)]
+
+def paired_differences(labels, net_changes):
+    """
+        net_changes is a (tables, player types) array of what every player type won at a
+        table over all its seat rotations.  Every type got the same cards, so the difference
+        of 2 types at a table has none of the card luck in it.  returns a row per pair:
+        (type a, type b, tables, mean difference, standard error, t statistic)
+    """
+    tables = net_changes.shape[0]
+    rows = []
+    for a, b in itertools.combinations(range(len(labels)), 2):
+        differences = net_changes[:, a] - net_changes[:, b]
+        mean = float(differences.mean())
+        standard_error = float(differences.std(ddof=1) / math.sqrt(tables)) if tables > 1 else float('nan')
+        t_statistic = mean / standard_error if standard_error > 0 else float('nan')
+        rows.append((labels[a], labels[b], tables, round(mean, 2), round(standard_error, 2), round(t_statistic, 3)))
+    return rows
+
+def report_duplicate(simulation_name, sim_number, labels, net_changes):
+    """ prints the paired differences of a duplicate simulation and writes them to data/duplicate_<sim_number>.csv """
+    rows = paired_differences(labels, net_changes)
+    print("paired differences per table (duplicate mode):")
+    print("{:<30} {:<30} {:>12} {:>10} {:>8}".format('player type', 'against', 'mean', 'std err', 't'))
+    for row in rows:
+        print("{:<30} {:<30} {:>12} {:>10} {:>8}".format(row[0], row[1], row[3], row[4], row[5]))
+
+    data_dir = os.path.join(os.path.dirname(__file__),'data')
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+    file_loc = os.path.join(data_dir,'duplicate_' + str(sim_number) + '.csv')
+    with open(file_loc,'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['simulation_name','player_type','against','tables','mean_difference','standard_error','t_statistic'])
+        writer.writerows([(simulation_name,) + row for row in rows])
+    return rows
 
 def run_all_simulations(config):
     """ 
@@ -2757,70 +5120,151 @@ def run_all_simulations(config):
     player_balance = config['balance'] # players beginning balance
     minimum_to_play = config['minimum_balance'] # minimum balance to join next game for a given player
     simulations = config['simulations'] # all the simulations that we will run, this represents a list
-
-    # turns on pools of workers to run tables in parallel.  
-    # pros/cons -> really fast 5x speed up, bad side -> really bad for debugging and seeing the simulation in action
-    # pros/cons for turning off parallelism -> much slower: 1/5th the time, great for debugging and seeing the simulation in action with debug = 1 set.
+    seed = config.get('seed', random.getrandbits(63)) # every random stream of the run comes from this, see DealStream
+    store_path = config.get('equity_store') # a path turns the on disk store on, it gives up repeatable results, see EquityStore
+    engine = config.get('engine', 'table') # 'lockstep' plays simulations of stateless strategies with LockstepTables
+    duplicate = config.get('duplicate', False) # replays every table once per seat rotation of the player types
+    deal_file = config.get('deal_file') # replays the deals of a file, or writes them there if it doesn't exist yet
+    record = config.get('record', 'full') # what the tables write to data, see RecordLevels
+    trace_size = TraceBufferSize if config.get('trace', False) or debug == 1 else 0 # events kept per process, see start_tracing
+
+    if trace_size:
+        start_tracing(trace_size)
+
+    if store_path is not None and use_cache == 1:
+        store = open_equity_store(store_path)
+        print("equity store {}: {} states".format(store_path, store.stats()['states']))
+    else:
+        if store_path is not None:
+            print("equity store {} not used, it needs use_cache = 1".format(store_path))
+        store_path = None
+
+    # every simulation plays the same deals, dealt once here
+    if deal_file is not None and os.path.exists(deal_file):
+        deals = DealSource.load(deal_file)
+        print("replaying deals from {}".format(deal_file))
+    else:
+        deals = DealSource.generate(tables,hands,seed)
+        if deal_file is not None:
+            deals.save(deal_file)
+            print("deals written to {}".format(deal_file))
+    if deals.deals.shape[0] < tables or deals.deals.shape[1] < hands:
+        raise Exception("Config Error: deal file {} has {} tables of {} hands, need {} of {}".format(deal_file,deals.deals.shape[0],deals.deals.shape[1],tables,hands))
+    try: # the shared memory of the deals has to go even if a table fails
+        deal_handle = deals.share() if use_parallel == 1 else None
+
+        # turns on pools of workers to run tables in parallel.  
+        # pros/cons -> really fast 5x speed up, bad side -> the debug=1 messages of the workers come out mixed together (every one has its game id)
+        # pros/cons for turning off parallelism -> much slower: 1/5th the time, great for debugging and seeing the simulation in action with debug = 1 set.
     
-    print("beginning all simulation...")
-    sim_number = 0
-    for simulation in simulations: # run simluation one at a time in serial fashion
-        sim_number += 1
-        print("")
-        print("simulation running: {}".format(simulation['simulation_name']))
-        start_time = time.time()
-        if use_parallel == 1:
-            pool = Pool()
-            run_in_parallel=partial(
-                        run_table_in_parallel,
-                        scenario_name=simulation['simulation_name'],
-                        player_types=simulation['player_types'],
-                        beginning_balance=player_balance,
-                        minimum_play_balance=minimum_to_play,
-                        hands=hands
-                    )
-            table_ids = range((sim_number-1) * tables + 1,sim_number * tables + 1)
-            pool.map(run_in_parallel,table_ids)
-        else:
-            print("running job in serial fashion")
-            table_ids = range((sim_number-1) * tables + 1,sim_number * tables + 1)
-            for table_id in table_ids:
-                print("running table_id {} for scenario: {} (serial processing)".format(table_id, simulation['simulation_name']))
-                casino = Table( # generates a new table
-                                table_id=table_id,
-                                scenario_name=simulation['simulation_name'], # use this to look up scenario in data analysis
-                                player_types=simulation['player_types'], # player types defined by subclassed version of GenericPlayer class
-                                beginning_balance=player_balance, # beginning balances of player
-                                minimum_play_balance=minimum_to_play, # minimum balance to play
-                                hands=hands # number of hands to be played in this table
+        report_equity_tables() # the results depend on them, see report_equity_tables
+        print("beginning all simulation...")
+        sim_number = 0
+        next_table_id = 1
+        for simulation in simulations: # run simluation one at a time in serial fashion
+            sim_number += 1
+            print("")
+            print("simulation running: {}".format(simulation['simulation_name']))
+            start_time = time.time()
+            player_types = simulation['player_types']
+            rotations = len(player_types) if duplicate else 1
+            jobs = [] # table_id, seed, table_number, rotation
+            for table_number in range(tables):
+                table_seed = np.random.SeedSequence(seed, spawn_key=(table_number,)) # same for every simulation
+                for rotation in range(rotations):
+                    jobs.append((next_table_id, table_seed, table_number, rotation))
+                    next_table_id += 1
+
+            if engine == 'lockstep' and supports_lockstep(player_types):
+                print("running {} tables in lock step".format(len(jobs)))
+                lockstep_record = record
+                if record == 'full':
+                    print("warning: the lock-step engine doesn't record bets, poker_hands only gets its header (record level summary)")
+                    lockstep_record = 'summary'
+                lockstep_rng = random_stream(np.random.SeedSequence(seed, spawn_key=(LockstepStream, sim_number)))
+                results = play_lockstep(jobs, simulation['simulation_name'], player_types, player_balance, minimum_to_play, hands, deals, lockstep_rng, lockstep_record)
+            elif use_parallel == 1:
+                if engine == 'lockstep':
+                    print("not every player type has a bet_strategy_batch, using the table engine")
+                pool = Pool(initializer=init_worker, initargs=(store_path,deal_handle,trace_size,debug)) # every worker starts warm, reads the shared deals and traces on its own
+                try:
+                    run_in_parallel=partial(
+                                run_table_in_parallel,
+                                scenario_name=simulation['simulation_name'],
+                                player_types=player_types,
+                                beginning_balance=player_balance,
+                                minimum_play_balance=minimum_to_play,
+                                hands=hands,
+                                record=record
                             )
-                casino.run_simulation() # start the actual simulation
-                casino.run_analysis() # export the data for jupyter analysis at some later date
-        end_time = time.time()
-        elapsed_time = round(end_time - start_time,2)
-        print("simulation finished: {} - time_required: {} seconds".format(simulation['simulation_name'],elapsed_time))
-        dprint("")
+                    results = pool.starmap(run_in_parallel,jobs)
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                if engine == 'lockstep':
+                    print("not every player type has a bet_strategy_batch, using the table engine")
+                print("running job in serial fashion")
+                results = []
+                for table_id, table_seed, table_number, rotation in jobs:
+                    print("running table_id {} for scenario: {} (serial processing)".format(table_id, simulation['simulation_name']))
+                    results.append(play_table(
+                                    table_id, table_seed, table_number, rotation,
+                                    scenario_name=simulation['simulation_name'], # use this to look up scenario in data analysis
+                                    player_types=player_types, # player types defined by subclassed version of GenericPlayer class
+                                    beginning_balance=player_balance, # beginning balances of player
+                                    minimum_play_balance=minimum_to_play, # minimum balance to play
+                                    hands=hands, # number of hands to be played in this table
+                                    deals=deals.table_deals(table_number,len(player_types),hands), # cards of every hand
+                                    record=record # what gets written, see RecordLevels
+                                ))
+                    flush_equity_store()
+
+            if duplicate:
+                net_changes = np.zeros((tables, len(player_types)))
+                for (table_id, table_seed, table_number, rotation), table_result in zip(jobs, results):
+                    for player_type_index, net_change in table_result:
+                        net_changes[table_number, player_type_index] += net_change
+                report_duplicate(simulation['simulation_name'], sim_number, player_type_labels(player_types), net_changes)
+            end_time = time.time()
+            elapsed_time = round(end_time - start_time,2)
+            print("simulation finished: {} - time_required: {} seconds".format(simulation['simulation_name'],elapsed_time))
+            dprint("")
+    finally:
+        deals.release()
+    if equity_store is not None:
+        merged = equity_store.compact() # one writer left, so merge the log of this run
+        print("equity store: merged {} log rows, {} states".format(merged, equity_store.stats()['states']))
     print("")
     print('finished all simulation')
     return None
 
-debug = 0 # to see detailed messages of simulation, put this to 1, think verbose mode
-use_parallel = 1 # would not recommend using use_cache=1 on function simulate_win_odds due to not knowing if globals are thread or process safe.
+debug = 0 # to see detailed messages of simulation, put this to 1, think verbose mode.  Prints the trace events, see Tracing
+use_parallel = 1 # every pool worker has its own equity_cache, see EquityCache
 
-# serial runs are guanteed unique repeatable results.  Parallel runs due to randomness of start times are not.  worth noting.
+# every table has its own random streams (see DealStream), so serial and parallel runs with the same
+# seed deal the same cards.  Results are repeatable to the bit with the defaults, use_cache = 0 and no 'equity_store',
+# on the same machine: the precomputed equity tables in tables/ aren't in git and odds they don't have get sampled,
+# so checkouts with different tables, or a street table whose build went on in between, play differently.  Every run
+# prints which tables it found and how much of every street table is built (see report_equity_tables).
+# Not with the cache or store on either, since what is in a workers cache depends on which tables ran in it before, and
+# MCTS players search for a fixed amount of time (see MCST.build), so they aren't repeatable either.
 
 if __name__ == '__main__':
     print("starting poker simulation...(set debug=1 to see messages)")
 
-    if debug == 1 and use_parallel == 1:
-        raise Exception("Parallelism (use_parallel=1) is not supported with debug mode (debug=1)...set debug to 0")
-
     # defines all the simulations we will run
     simulations = {
        'tables': 10, # number of poker tables simulated
        'hands': 50, # number of hands the dealer will player, has to be greater than 2
        'balance': 100000, # beginning balance in dollars, recommend > 10,000 unless you want player to run out of money
        'minimum_balance': 50, # minimum balance to join a table
+       'seed': 42, # seed of all the random streams, tables with the same number get the same deals in every simulation
+       'engine': 'table', # 'lockstep' runs simulations with only AlwaysCall/AlwaysRaise/Calculated players many tables at a time on one core, without the poker_hands rows
+       'record': 'full', # 'summary' only writes the balances, 'none' writes nothing, see RecordLevels
+       'trace': False, # True keeps the last events of every process and dumps them to data when a table fails, see Tracing
+       'equity_store': None, # e.g. os.path.join(TABLE_DIR, EQUITY_STORE_FILE) keeps sampled odds between runs, results then depend on earlier runs
+       'duplicate': False, # True plays every table once per seat rotation, so every player type gets every hand, see report_duplicate
        'simulations': [ # each dict in the list is a simulation to run    
             {
                 'simulation_name': 'monte vs 1 all different types player', # name of simulation - reference for data analytics
@@ -2842,6 +5286,6 @@ if __name__ == '__main__':
         ]
     }
 
-    random.seed(42) # gurantees standardized output for any given config
+    random.seed(42) # only fixes the seed run_all_simulations falls back to (random.getrandbits) when the config has no 'seed'
 
     run_all_simulations(simulations) # runs all the simulations in simulation variable
\ No newline at end of file
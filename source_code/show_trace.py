@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+    Prints a trace dump written when a table failed with tracing on (see Tracing in poker.py):
+
+        python show_trace.py data/trace_12_4711.npy
+        python show_trace.py data/trace_12_4711.npy --last 200 --game 12000031
+
+    The dump holds the last events of the process that ran the table, oldest first, so
+    it can reach back into the tables that worker played before.
+"""
+import argparse
+
+from poker import *
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="prints the events of a trace dump")
+    parser.add_argument('path', help="the trace_<table_id>_<pid>.npy file")
+    parser.add_argument('--last', type=int, default=None, help="only the last N events")
+    parser.add_argument('--game', type=int, default=None, help="only the events of this game id")
+    parser.add_argument('--event', default=None, choices=[name for name, message in TraceEvents], help="only this kind of event")
+    args = parser.parse_args()
+
+    records = read_trace(args.path)
+    if args.game is not None:
+        records = records[records['game'] == args.game]
+    if args.event is not None:
+        records = records[records['event'] == [name for name, message in TraceEvents].index(args.event)]
+    if args.last is not None:
+        records = records[-args.last:]
+    for line in format_trace(records):
+        print(line)
+    print("{} events".format(len(records)))